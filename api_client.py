@@ -1,57 +1,479 @@
+import email.utils
+import random
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import traced
+from payload_splitter import count_leaves, serialize_payload, split_payload
+from payload_writer import iter_payload_chunks
+from submission_journal import payload_hash
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Methods resent after a dropped connection or a server error, since sending them twice
+# has the effect of sending them once. A create POST is not: see APIClient._send_create
+IDEMPOTENT_METHODS = {'GET', 'PATCH'}
+
+DEFAULT_TIMEOUT = (10, 300)  # (connect, read) seconds
+
+# Payloads above this size are sent as a create call plus PATCH batches
+DEFAULT_MAX_PAYLOAD_BYTES = 8 * 1024 * 1024
+
+GZIP_LEVEL = 6
+# Encoded JSON is compressed (and sent as one HTTP chunk) about this many bytes at a time
+GZIP_CHUNK_SIZE = 64 * 1024
+
+# Responses to a compressed body meaning the target does not take it: unsupported
+# Content-Encoding, or a chunked body without Content-Length
+COMPRESSION_REJECTED_STATUS_CODES = {411, 415}
+
+# A 400 only counts as rejecting compression when its text names the encoding; any
+# other 400 refuses the payload itself
+COMPRESSION_REJECTED_TEXT = re.compile(r'gzip|encoding', re.IGNORECASE)
+
+
+def migration_packages_endpoint(cpq_instance):
+    """
+    Create endpoint for a CPQ instance, e.g. https://jcitest5.bigmachines.com
+    """
+    return f"{cpq_instance.rstrip('/')}/rest/v14/migrationPackages"
+
+
+def package_identifier(package_name):
+    """
+    Identifier of a newly created package, used by the PATCH endpoint.
+    """
+    return package_name.lower() + "_v1"
+
+
+class RequestBody:
+    """
+    An encoded JSON request body: gzip-compressed chunks, or plain bytes.
+    """
+    def __init__(self, chunks, size, compression=None):
+        """
+        Args:
+            chunks: The body as a list of bytes; one element when not compressed
+            size: Bytes of JSON the body carries (before compression)
+            compression: 'gzip' or None
+        """
+        self.chunks = chunks
+        self.size = size
+        self.compression = compression
+
+    @classmethod
+    def plain(cls, body):
+        return cls([body], len(body))
+
+    @property
+    def wire_size(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def data(self):
+        """
+        What to pass to requests as data: a compressed body is a fresh generator on
+        every call, so it goes out with chunked transfer encoding and can be resent.
+        """
+        if self.compression is None:
+            return self.chunks[0]
+        return (chunk for chunk in self.chunks)
+
+    def headers(self):
+        if not self.size:
+            return {}
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        if self.compression is not None:
+            headers['Content-Encoding'] = self.compression
+        return headers
+
+
+def gzip_body(payload, max_bytes=None):
+    """
+    Encode payload as compact JSON and gzip it incrementally, one GZIP_CHUNK_SIZE
+    block of encoded JSON at a time, so only the compressed body is kept.
+
+    Returns None as soon as the encoded JSON exceeds max_bytes.
+    """
+    # wbits 31: a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    chunks = []
+    pending = []
+    pending_size = 0
+    size = 0
+    for piece in iter_payload_chunks(payload):
+        pending.append(piece)
+        pending_size += len(piece)
+        if pending_size >= GZIP_CHUNK_SIZE:
+            size += pending_size
+            if max_bytes is not None and size > max_bytes:
+                return None
+            compressed = compressor.compress(b''.join(pending))
+            if compressed:
+                chunks.append(compressed)
+            pending = []
+            pending_size = 0
+
+    size += pending_size
+    if max_bytes is not None and size > max_bytes:
+        return None
+    chunks.append(compressor.compress(b''.join(pending)) + compressor.flush())
+    return RequestBody(chunks, size, 'gzip')
+
 
 class APIClient:
-    def __init__(self, endpoint, username, password):
+    def __init__(self, endpoint, username, password, timeout=DEFAULT_TIMEOUT, max_retries=3,
+                 backoff_factor=0.5, max_backoff=30, pool_maxsize=10,
+                 max_payload_bytes=DEFAULT_MAX_PAYLOAD_BYTES, max_payload_children=None, journal=None,
+                 compression=None):
+        """
+        Args:
+            endpoint: The migration package endpoint (.../rest/v14/migrationPackages)
+            username, password: Basic Auth credentials
+            timeout: (connect, read) timeout in seconds, or a single number for both
+            max_retries: Retries for 5xx/429 responses and connection errors
+            backoff_factor: Base delay for jittered exponential backoff between retries
+            max_backoff: Upper bound in seconds for a single wait, including Retry-After
+            pool_maxsize: Keep-alive connections kept per host
+            max_payload_bytes: Serialized size above which a payload is split into batches (None: never)
+            max_payload_children: Leaf node count above which a payload is split into batches (None: never)
+            journal: Optional SubmissionJournal recording the progress of every create and update call
+            compression: None to send plain JSON, or 'gzip' (opt-in, for instances known to take
+                it) to send gzip-compressed, chunked bodies; plain JSON is used again once the
+                target rejects one
+        """
         self.endpoint = endpoint
         self.username = username
         self.password = password
-        
-    def post_data(self, payload):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_payload_bytes = max_payload_bytes
+        self.max_payload_children = max_payload_children
+        self.journal = journal
+        self.compression = compression
+        # Whether the target took a compressed body; None until the first response to one
+        self.accepts_compression = None
+
+        # One session so the POST and PATCH of a package reuse the same TLS connection
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # One entry per request: method, url, status, attempts, retries, elapsed (seconds),
+        # bytes (sent on the wire), payloadBytes (JSON before compression), compression, ratio
+        self.request_log = []
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def last_request(self):
+        """
+        Timing and retry details of the most recent request, or None.
+        """
+        return self.request_log[-1] if self.request_log else None
+
+    def post_data(self, payload, start_batch=0):
         """
         Post the JSON payload to the API endpoint using Basic Auth.
+
+        Payloads over the size budget are split: the first batch creates the
+        package and the rest are PATCHed into it in order. The returned response
+        is the last one, or the first failed one.
+
+        start_batch resumes an interrupted split create: the batches before it
+        already reached the package and are not sent again.
         """
         try:
-            headers = {
-                'Content-Type': 'application/json'
-            }
-            
-            response = requests.post(
-                self.endpoint,
-                json=payload,
-                headers=headers,
-                auth=(self.username, self.password)
-            )
-            
-            return response
-            
+            update_endpoint = self._update_endpoint(package_identifier(payload['name']))
+            return self._send_batched(payload, self.endpoint, 'POST', update_endpoint, 'create', start_batch)
+
         except Exception as e:
             raise Exception(f"API request failed: {str(e)}")
-    
-    def patch_data(self, identifier, payload):
+
+    def patch_data(self, identifier, payload, start_batch=0):
         """
         Update (PATCH) an existing migration package with Configuration items.
-        
+
         Args:
             identifier: The package identifier (e.g., "packagename_v1")
             payload: The JSON payload containing Configuration items
+            start_batch: First batch to send when resuming an interrupted split update
         """
         try:
-            # Construct the update endpoint
-            update_endpoint = self.endpoint.replace('/rest/v14/', '/rest/v19/')
-            update_endpoint = f"{update_endpoint}/{identifier}"
-            
-            headers = {
-                'Content-Type': 'application/json'
+            update_endpoint = self._update_endpoint(identifier)
+            return self._send_batched(payload, update_endpoint, 'PATCH', update_endpoint, 'update', start_batch)
+
+        except Exception as e:
+            raise Exception(f"API PATCH request failed: {str(e)}")
+
+    def package_exists(self, identifier):
+        """
+        Whether a migration package with this identifier exists (GET on the update endpoint).
+        """
+        try:
+            response = self._get_package(identifier)
+        except Exception as e:
+            raise Exception(f"API GET request failed: {str(e)}")
+
+        if response.status_code == 404:
+            return False
+        if response.status_code != 200:
+            raise Exception(f"API GET request failed: status {response.status_code}")
+        return True
+
+    def _get_package(self, identifier):
+        response = self._send('GET', self._update_endpoint(identifier), RequestBody.plain(b''))
+        response.close()
+        return response
+
+    def _update_endpoint(self, identifier):
+        # Construct the update endpoint
+        update_endpoint = self.endpoint.replace('/rest/v14/', '/rest/v19/')
+        return f"{update_endpoint}/{identifier}"
+
+    def _send_batched(self, payload, first_url, first_method, update_url, step, start_batch=0):
+        """
+        Send payload in one request, or as budget-sized batches when it is too large.
+
+        Batches go out back to back over the session's keep-alive connection; the next
+        batch is encoded while the previous request is in flight. Batches before
+        start_batch are skipped.
+
+        With a journal, the call is recorded as 'started', then 'sent' after every
+        batch but the last, then 'done' or 'failed'.
+        """
+        body = self._encode(payload)
+        journal_fields = None
+        if self.journal is not None:
+            journal_fields = {
+                'endpoint': self.endpoint,
+                'packageName': payload.get('name'),
+                'identifier': update_url.rsplit('/', 1)[1],
+                'step': step,
+                'payloadHash': payload_hash(serialize_payload(payload)),
             }
-            
-            response = requests.patch(
-                update_endpoint,
-                json=payload,
-                headers=headers,
-                auth=(self.username, self.password)
-            )
-            
-            return response
-            
+
+        if not self._over_budget(payload, body):
+            batches = None
+            requests_to_send = [(first_method, first_url)]
+        else:
+            batches = split_payload(payload, self.max_payload_bytes, self.max_payload_children)
+            requests_to_send = [(first_method, first_url)] + [('PATCH', update_url)] * (len(batches) - 1)
+        if start_batch >= len(requests_to_send):
+            raise ValueError(f"Cannot resume at batch {start_batch + 1}: the payload has {len(requests_to_send)} batch(es).")
+
+        identifier = update_url.rsplit('/', 1)[1]
+        self._journal('started', journal_fields, batches=len(requests_to_send), startBatch=start_batch)
+        try:
+            if batches is None:
+                response = self._send_request(first_method, first_url, payload, body, identifier)
+            else:
+                response = self._send_batches(batches, requests_to_send, start_batch, identifier, journal_fields)
         except Exception as e:
-            raise Exception(f"API PATCH request failed: {str(e)}")
\ No newline at end of file
+            self._journal('failed', journal_fields, error=str(e))
+            raise
+
+        succeeded = response.status_code in (200, 201)
+        self._journal('done' if succeeded else 'failed', journal_fields, statusCode=response.status_code)
+        return response
+
+    def _send_batches(self, batches, requests_to_send, start_batch, identifier, journal_fields):
+        with ThreadPoolExecutor(max_workers=1) as encoder:
+            next_body = encoder.submit(self._encode, batches[start_batch], False)
+            for index in range(start_batch, len(batches)):
+                method, url = requests_to_send[index]
+                body = next_body.result()
+                if index + 1 < len(batches):
+                    next_body = encoder.submit(self._encode, batches[index + 1], False)
+
+                response = self._send_request(method, url, batches[index], body, identifier)
+                self.request_log[-1]['batch'] = f"{index + 1}/{len(batches)}"
+                if response.status_code not in (200, 201):
+                    break
+                if index + 1 < len(batches):
+                    self._journal('sent', journal_fields, batch=index + 1, statusCode=response.status_code)
+
+        return response
+
+    def _journal(self, event, journal_fields, **fields):
+        if journal_fields is not None:
+            self.journal.record(event, **journal_fields, **fields)
+
+    def _encode(self, payload, budgeted=True):
+        """
+        Encode payload for sending: gzip-compressed unless compression is off or the
+        target rejected it. A compressed body is None when the payload is over the
+        byte budget (only checked when budgeted, i.e. before splitting).
+        """
+        if self.compression == 'gzip' and self.accepts_compression is not False:
+            return gzip_body(payload, self.max_payload_bytes if budgeted else None)
+        return RequestBody.plain(serialize_payload(payload))
+
+    def _send_request(self, method, url, payload, body, identifier):
+        if method == 'POST':
+            return self._send_create(url, payload, body, identifier)
+        return self._send_payload(method, url, payload, body)
+
+    def _send_create(self, url, payload, body, identifier):
+        """
+        Send the create call of a package. After a dropped connection or a server
+        error the package may have been created anyway, so it is looked up (GET)
+        before the create is sent again: if it exists, that response (200) stands
+        for the create call; if the lookup cannot tell, the failure is returned.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            error = None
+            try:
+                response = self._send_payload('POST', url, payload, body)
+            except requests.exceptions.ConnectionError as e:
+                response, error = None, e
+            if response is not None and response.status_code < 500:
+                return response
+
+            lookup = self._get_package(identifier)
+            if lookup.status_code == 200:
+                return lookup
+            if lookup.status_code != 404 or attempt > self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(self._backoff(attempt))
+
+    def _send_payload(self, method, url, payload, body):
+        """
+        Send an encoded payload. If the target explicitly rejects a compressed body
+        (411, 415, or a 400 naming the encoding), the payload is resent as plain JSON
+        and later requests are not compressed.
+
+        A 5xx or a dropped connection is not taken as a rejection: the target may have
+        applied the request, so it is handled like any other failure (see _send and
+        _send_create) rather than resent plain.
+        """
+        if body.compression is not None and self.accepts_compression is False:
+            # Encoded before an earlier batch found out the target rejects compression
+            body = RequestBody.plain(serialize_payload(payload))
+        if body.compression is None:
+            return self._send(method, url, body)
+
+        response = self._send(method, url, body)
+        if not self._rejects_compression(response):
+            if response.ok:
+                # An error response does not show the target read the compressed body
+                self.accepts_compression = True
+            return response
+
+        self.accepts_compression = False
+        response.close()
+        return self._send(method, url, RequestBody.plain(serialize_payload(payload)))
+
+    @staticmethod
+    def _rejects_compression(response):
+        if response.status_code in COMPRESSION_REJECTED_STATUS_CODES:
+            return True
+        return response.status_code == 400 and bool(COMPRESSION_REJECTED_TEXT.search(response.text))
+
+    def _over_budget(self, payload, body):
+        if self.max_payload_bytes is not None and (body is None or body.size > self.max_payload_bytes):
+            return True
+        if self.max_payload_children is not None:
+            return count_leaves(payload) > self.max_payload_children
+        return False
+
+    @traced('http', lambda response, self, method, url, body: {
+        'method': method, 'status': response.status_code, 'retries': self.last_request['retries'],
+        'bytes': self.last_request['bytes'], 'ratio': self.last_request['ratio']})
+    def _send(self, method, url, body):
+        """
+        Send a RequestBody through the pooled session, retrying transient failures
+        up to max_retries times.
+
+        Only IDEMPOTENT_METHODS are resent after a dropped connection or a server error;
+        other methods are only resent on 429, which the server sends before applying
+        anything. Read timeouts are not retried: the server may already have applied
+        the change.
+        """
+        max_retries = self.max_retries
+        started = time.perf_counter()
+        attempt = 0
+
+        while True:
+            attempt += 1
+            try:
+                response = self.session.request(method, url, data=body.data(), headers=body.headers(),
+                                                timeout=self.timeout)
+            except requests.exceptions.ConnectionError:
+                if attempt > max_retries or method not in IDEMPOTENT_METHODS:
+                    self._log(method, url, None, attempt, started, body)
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            resendable = method in IDEMPOTENT_METHODS or response.status_code == 429
+            if response.status_code in RETRY_STATUS_CODES and resendable and attempt <= max_retries:
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                response.close()
+                time.sleep(delay)
+                continue
+
+            self._log(method, url, response.status_code, attempt, started, body)
+            return response
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform in [0, base * 2^(attempt-1)], capped at max_backoff
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** (attempt - 1)))
+
+    def _retry_after(self, response):
+        """
+        Seconds to wait from a Retry-After header (delta-seconds or HTTP date), capped at max_backoff.
+        """
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            delay = retry_at.timestamp() - time.time()
+
+        return min(max(delay, 0), self.max_backoff)
+
+    def _log(self, method, url, status_code, attempts, started, body):
+        wire_size = body.wire_size
+        self.request_log.append({
+            'method': method,
+            'url': url,
+            'status': status_code,
+            'attempts': attempts,
+            'retries': attempts - 1,
+            'elapsed': time.perf_counter() - started,
+            'bytes': wire_size,
+            'payloadBytes': body.size,
+            'compression': body.compression,
+            'ratio': round(body.size / wire_size, 2) if wire_size else None
+        })
@@ -0,0 +1,305 @@
+import csv
+import glob
+import json
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from pathlib import Path
+
+import instrumentation
+from out_of_core import write_payloads_out_of_core
+from payload_builder import load_tracker, write_payloads
+
+# Workbooks and the tabular formats ExcelParser reads (plain .json is left out: manifests and
+# summary.json use it)
+TRACKER_SUFFIXES = ('.xlsx', '.xlsm', '.csv', '.parquet', '.jsonl')
+
+
+def load_manifest(manifest_path):
+    """
+    Load the workbook -> package name mapping.
+
+    Accepts a JSON object ({"tracker.xlsx": "PackageName", ...}) or a CSV file
+    with `workbook` and `packageName` columns. Workbooks are matched by file name.
+    """
+    path = Path(manifest_path)
+    if path.suffix.lower() == '.json':
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)
+        if not isinstance(entries, dict):
+            raise ValueError("JSON manifest must be an object mapping workbook to package name.")
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames or not {'workbook', 'packageName'} <= set(reader.fieldnames):
+                raise ValueError("CSV manifest must have 'workbook' and 'packageName' columns.")
+            entries = {row['workbook']: row['packageName'] for row in reader}
+
+    return {Path(workbook).name: package_name for workbook, package_name in entries.items()}
+
+
+def find_workbooks(source):
+    """
+    Resolve a directory or glob pattern to a sorted list of tracker paths
+    (workbooks, .csv, .parquet and .jsonl files).
+    """
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+
+    return sorted(
+        path for path in paths
+        if path.lower().endswith(TRACKER_SUFFIXES) and not os.path.basename(path).startswith('~$')
+    )
+
+
+def output_stem(workbook, sheet=None, keep_suffix=False):
+    """
+    File name stem for a workbook's payloads: tracker, or tracker.<sheet> for one sheet of it.
+    With keep_suffix the file extension is kept (tracker.csv), for trackers sharing a name.
+    """
+    stem = Path(workbook).name if keep_suffix else Path(workbook).stem
+    if sheet is None:
+        return stem
+    return f"{stem}.{re.sub(r'[^A-Za-z0-9_.-]+', '_', sheet)}"
+
+
+def plan_stems(tasks):
+    """
+    Output stems for (workbook, sheet, package name) tasks. Trackers that would
+    write the same files (tracker.xlsx and tracker.csv) keep their extension in
+    the stem; stems that still collide are an error rather than an overwrite.
+    """
+    stems = [output_stem(workbook, sheet) for workbook, sheet, _ in tasks]
+    counts = Counter(stem.lower() for stem in stems)
+    stems = [
+        output_stem(workbook, sheet, keep_suffix=True) if counts[stem.lower()] > 1 else stem
+        for stem, (workbook, sheet, _) in zip(stems, tasks)
+    ]
+
+    owners = {}
+    for stem, (workbook, sheet, _) in zip(stems, tasks):
+        name = Path(workbook).name if sheet is None else f"{Path(workbook).name}:{sheet}"
+        other = owners.setdefault(stem.lower(), name)
+        if other != name:
+            raise ValueError(f"'{other}' and '{name}' would both write {stem}.json.")
+    return stems
+
+
+def plan_sheets(workbooks, sheets, manifest):
+    """
+    Expand workbooks into (workbook, sheet, package name) tasks, in workbook then sheet order.
+
+    sheets is 'all' or a list of sheet names. A sheet's package name comes from the
+    manifest entry "<workbook file>:<sheet>", then "<sheet>", and defaults to the sheet name.
+    """
+    from excel_parser import ExcelParser
+
+    tasks = []
+    for workbook in workbooks:
+        names = sheets
+        if sheets == 'all':
+            try:
+                names = ExcelParser(workbook).sheet_names()
+            except Exception:
+                # Reported by the worker when it fails to open the workbook
+                names = [None]
+        for sheet in names:
+            name = Path(workbook).name
+            package_name = manifest.get(f"{name}:{sheet}") or manifest.get(sheet) or sheet
+            tasks.append((workbook, sheet, package_name))
+    return tasks
+
+
+def process_workbook(workbook, package_name, output_dir, use_cache=True, profile=False, sheet=None,
+                     out_of_core=False, spill_dir=None, stem=None):
+    """
+    Parse one workbook (or one sheet of it), generate its payload(s) and write them to output_dir.
+    Runs in a worker process, so it returns a plain summary dict instead of raising.
+    With profile, the worker's instrumentation spans are returned under 'trace'.
+    With out_of_core, the tracker is read in batches and spilled to spill_dir by payload
+    group instead of being loaded whole (see out_of_core.py); the parse cache is not used.
+    stem names the output files (default: output_stem).
+    """
+    if profile:
+        instrumentation.enable()
+        instrumentation.reset()
+
+    started = time.perf_counter()
+    stem = stem or output_stem(workbook, sheet)
+    result = {
+        'workbook': workbook,
+        'sheet': sheet,
+        'packageName': package_name,
+        'flow': None,
+        'rows': None,
+        'outputs': [],
+        'status': 'failed',
+        'error': None,
+    }
+
+    try:
+        if not package_name:
+            raise ValueError("No package name in manifest.")
+
+        output = os.path.join(output_dir, f"{stem}.json")
+        # A mixed tracker's Configuration payload is PATCHed into {package}_v1 after the create call
+        config_output = os.path.join(output_dir, f"{stem}.config.json")
+        if out_of_core:
+            flow, outputs, rows = write_payloads_out_of_core(workbook, package_name, output, config_output,
+                                                             sheet=sheet, spill_dir=spill_dir)
+        else:
+            excel_data = load_tracker(workbook, use_cache, sheet=sheet)
+            flow, outputs = write_payloads(excel_data, package_name, output, config_output)
+            rows = len(excel_data)
+
+        result['flow'] = flow
+        result['rows'] = rows
+        result['outputs'] = outputs
+        result['status'] = 'ok'
+
+    except Exception as e:
+        result['error'] = str(e)
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    if profile:
+        result['trace'] = instrumentation.spans()
+    return result
+
+
+def load_outputs(outputs):
+    """
+    Read back a task's written payloads as (payload, config_payload).
+    """
+    payloads = []
+    for output_path in outputs:
+        with open(output_path, encoding='utf-8') as f:
+            payloads.append(json.load(f))
+    return payloads[0], (payloads[1] if len(payloads) > 1 else None)
+
+
+def run_batch(source, manifest_path, output_dir, workers=None, use_cache=True, sheets=None,
+              submitter=None, out_of_core=False, spill_dir=None):
+    """
+    Generate payloads for every workbook matching source across a process pool.
+
+    With sheets ('all' or a list of sheet names), every selected sheet of every
+    workbook is its own task and payload; otherwise only the first sheet is read.
+    At most `workers` workbooks or sheets are parsed at once.
+
+    With a SubmissionScheduler, each package is queued for submission as soon as
+    its payloads are written, so packages are created and updated while the rest
+    are still being generated. Its outcome is stored under 'submission'.
+
+    With out_of_core, every tracker is generated through a disk spill instead of
+    in memory (see process_workbook).
+
+    Returns the list of per-task results in workbook (then sheet) order; a summary.json
+    with the same content is written to output_dir. When instrumentation is enabled,
+    the workers' spans are collected here, tagged with their workbook.
+    """
+    workbooks = find_workbooks(source)
+    if manifest_path:
+        # A CSV manifest may sit next to the trackers
+        manifest_file = os.path.abspath(manifest_path)
+        workbooks = [workbook for workbook in workbooks if os.path.abspath(workbook) != manifest_file]
+    if not workbooks:
+        raise ValueError(f"No workbooks found for '{source}'.")
+
+    manifest = load_manifest(manifest_path) if manifest_path else {}
+    os.makedirs(output_dir, exist_ok=True)
+
+    if sheets is None:
+        tasks = [(workbook, None, manifest.get(Path(workbook).name)) for workbook in workbooks]
+    else:
+        tasks = plan_sheets(workbooks, sheets, manifest)
+    stems = plan_stems(tasks)
+    count = len(tasks)
+    workers = min(workers or os.cpu_count() or 1, count)
+
+    results = [None] * count
+    submissions = {}
+
+    def generated(index, result):
+        results[index] = result
+        if submitter is not None and result['status'] == 'ok':
+            submissions[index] = submitter.submit(result['packageName'], partial(load_outputs, result['outputs']),
+                                                  sources=result['outputs'])
+
+    if workers == 1:
+        for index, task in enumerate(tasks):
+            workbook, sheet, package_name = task
+            generated(index, process_workbook(workbook, package_name, output_dir, use_cache, False, sheet,
+                                              out_of_core, spill_dir, stems[index]))
+    else:
+        profile = instrumentation.is_enabled()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(process_workbook, workbook, package_name, output_dir, use_cache, profile, sheet,
+                                out_of_core, spill_dir, stems[index]): index
+                for index, (workbook, sheet, package_name) in enumerate(tasks)
+            }
+            for future in as_completed(futures):
+                generated(futures[future], future.result())
+        for result in results:
+            instrumentation.collect(result.pop('trace', []), workbook=result['workbook'], sheet=result['sheet'])
+
+    for index, future in submissions.items():
+        record_submission(results[index], future.result())
+
+    with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=4)
+
+    return results
+
+
+def record_submission(result, submission):
+    """
+    Store a package's submission outcome on its batch result; a failed
+    submission fails the task.
+    """
+    result['submission'] = {
+        'status': submission['status'],
+        'latency': submission['latency'] and round(submission['latency'], 3),
+        'steps': [
+            {'step': step['step'], 'statusCode': step['statusCode'],
+             'elapsed': round(step['elapsed'], 3), 'retries': step['retries'],
+             'bytes': step['bytes'], 'payloadBytes': step['payloadBytes'], 'compression': step['compression']}
+            for step in submission['steps']
+        ],
+        'error': submission['error'],
+    }
+    if submission['status'] != 'ok':
+        result['status'] = 'failed'
+        steps = ', '.join(f"{step['step']} {step['statusCode']}" for step in submission['steps'])
+        result['error'] = f"submission failed: {submission['error'] or steps}"
+
+
+def print_summary(results):
+    print(f"{'Workbook':<40} {'Package':<25} {'Flow':<14} {'Rows':>7} {'Time(s)':>8}  Status")
+    for result in results:
+        rows = result['rows'] if result['rows'] is not None else '-'
+        name = Path(result['workbook']).name
+        if result['sheet'] is not None:
+            name = f"{name}:{result['sheet']}"
+        print(f"{name:<40} {str(result['packageName'] or '-'):<25} "
+              f"{str(result['flow'] or '-'):<14} {rows:>7} {result['seconds']:>8.2f}  "
+              f"{result['status'] if result['status'] == 'ok' else 'FAILED: ' + result['error']}")
+
+    submitted = [result for result in results if 'submission' in result]
+    if submitted:
+        from submission import format_step
+
+        print(f"\n{'Package':<25} {'Latency(s)':>10}  Steps")
+        for result in submitted:
+            submission = result['submission']
+            latency = '-' if submission['latency'] is None else f"{submission['latency']:.2f}"
+            steps = ', '.join(format_step(step) for step in submission['steps']) or f"error: {submission['error']}"
+            print(f"{str(result['packageName']):<25} {latency:>10}  {steps}")
+
+    failed = sum(1 for result in results if result['status'] != 'ok')
+    print(f"\n{len(results) - failed} succeeded, {failed} failed")
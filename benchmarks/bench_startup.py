@@ -0,0 +1,121 @@
+"""
+CLI startup benchmark.
+
+Each measurement runs in a fresh interpreter (best of --repeat runs):
+- import: importing main, i.e. what the user waits for before the first prompt
+- light: loading and converting a small CSV tracker through the pure-Python path
+- workbook: the same tracker as an .xlsx workbook through pandas
+
+Results are compared with the 'startup' entry of benchmarks/baselines.json.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --update-baselines
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from benchmarks.synthetic import build_tracker, write_workbook  # noqa: E402
+
+BASELINES_PATH = Path(__file__).resolve().parent / 'baselines.json'
+BASELINE_KEY = 'startup'
+
+# Startup times are small; differences below this are noise
+MIN_SECONDS_DELTA = 0.05
+
+CONVERT = (
+    "import contextlib, io\n"
+    "from payload_builder import load_tracker, generate_payloads\n"
+    "with contextlib.redirect_stdout(io.StringIO()):\n"
+    "    generate_payloads(load_tracker({path!r}, use_cache=False), 'Benchmark')\n"
+)
+
+
+def time_interpreter(code, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+        best = min(best, time.perf_counter() - started)
+    return round(best, 4)
+
+
+def loaded_heavy_modules(code):
+    """
+    Heavy modules still imported after running code.
+    """
+    probe = code + "\nimport sys\nprint(','.join(m for m in ('pandas', 'numpy', 'openpyxl', 'requests') if m in sys.modules))"
+    output = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout.strip()
+    return output.split(',') if output else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup and small-tracker conversion.")
+    parser.add_argument('--rows', type=int, default=200, help="Rows in the small tracker")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement (best time is kept)")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="Allowed relative regression before failing (default 0.5 = 50%%)")
+    parser.add_argument('--baselines', type=Path, default=BASELINES_PATH, help="Baselines file")
+    parser.add_argument('--update-baselines', action='store_true', help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        df = build_tracker(args.rows)
+        csv_path = Path(tmp) / 'tracker.csv'
+        workbook_path = Path(tmp) / 'tracker.xlsx'
+        df.to_csv(csv_path, index=False)
+        write_workbook(df, workbook_path)
+
+        results = {
+            'rows': args.rows,
+            'seconds': {
+                'import': time_interpreter("import main", args.repeat),
+                'light': time_interpreter(CONVERT.format(path=str(csv_path)), args.repeat),
+                'workbook': time_interpreter(CONVERT.format(path=str(workbook_path)), args.repeat),
+            },
+            'heavy_modules': {
+                'import': loaded_heavy_modules("import main"),
+                'light': loaded_heavy_modules(CONVERT.format(path=str(csv_path))),
+            }
+        }
+
+    print(f"{'Measurement':<12} {'Seconds':>9}  Heavy modules loaded")
+    for name, seconds in results['seconds'].items():
+        heavy = results['heavy_modules'].get(name)
+        print(f"{name:<12} {seconds:>9.3f}  {'-' if heavy is None else ', '.join(heavy) or 'none'}")
+
+    baselines = json.loads(args.baselines.read_text()) if args.baselines.exists() else {}
+    if args.update_baselines:
+        baselines[BASELINE_KEY] = results
+        args.baselines.write_text(json.dumps(baselines, indent=2) + '\n')
+        print(f"\nBaseline written to {args.baselines}")
+        return
+
+    regressions = [f"{name}: imports {', '.join(heavy)}" for name, heavy in results['heavy_modules'].items() if heavy]
+    baseline = baselines.get(BASELINE_KEY)
+    if baseline is None or baseline['rows'] != results['rows']:
+        print(f"\nNo startup baseline at {results['rows']} rows; timings not compared.")
+    else:
+        for name, new in results['seconds'].items():
+            old = baseline['seconds'][name]
+            if new > old * (1 + args.tolerance) and new - old > MIN_SECONDS_DELTA:
+                regressions.append(f"{name}: seconds {old} -> {new}")
+
+    if regressions:
+        print("\nRegressions:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print("\nNo regressions past baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Parse -> generate -> serialize benchmark suite on synthetic trackers.
+
+Each scenario writes a synthetic workbook, then times every stage separately
+(best of --repeat runs) and records its peak traced memory in a separate pass.
+Results are compared with benchmarks/baselines.json and the run fails when a
+stage regresses by more than --tolerance.
+
+It also compares JSONGenerator's derived columns (DERIVED_COLUMN_RULES, evaluated
+per distinct code) with the original row-by-row derivation, failing if they differ.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks                      # all scenarios, compare
+    python -m benchmarks.run_benchmarks --scenario mixed     # one scenario
+    python -m benchmarks.run_benchmarks --update-baselines   # record new baselines
+    python -m benchmarks.run_benchmarks --derived-columns-rows 200000 --scenario standard
+
+Baselines are machine specific; record them on the machine that runs the comparison.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from benchmarks.synthetic import build_tracker, write_workbook  # noqa: E402
+from json_generator import JSONGenerator  # noqa: E402
+from configuration_generator import ConfigurationGenerator  # noqa: E402
+from payload_builder import load_tracker, split_mixed  # noqa: E402
+from payload_writer import payload_size  # noqa: E402
+from tracker_schema import DERIVED_COLUMN_RULES  # noqa: E402
+from tracker_table import as_table  # noqa: E402
+
+BASELINES_PATH = Path(__file__).resolve().parent / 'baselines.json'
+
+SCENARIOS = {
+    'standard': dict(rows=20000, item_mix={
+        'Commerce': 0.6, 'Util Library': 0.1, 'Document Designer': 0.1,
+        'Email Designer': 0.1, 'Data Table': 0.1}),
+    'granular-commerce': dict(rows=20000, item_mix={'Commerce': 1.0}, granular_share=0.9, transactions=6),
+    'configuration': dict(rows=20000, item_mix={'Configuration': 1.0}, config_depth=3, config_fanout=12),
+    'configuration-deep': dict(rows=20000, item_mix={'Configuration': 1.0}, config_depth=6, config_fanout=4),
+    'mixed': dict(rows=20000),
+}
+
+STAGES = ['parse', 'json_generator', 'configuration_generator', 'serialize']
+
+# Differences below these are noise, whatever the relative change
+MIN_SECONDS_DELTA = 0.1
+MIN_PEAK_MB_DELTA = 2.0
+
+
+def run_stages(workbook):
+    """
+    Return (state, stage callables in STAGES order) for one pass over the workbook.
+    Each stage stores its output in state for the next one.
+    """
+    state = {}
+
+    def parse():
+        state['table'] = load_tracker(workbook, use_cache=False)
+        state['standard'], state['config'] = split_mixed(state['table'])
+
+    def json_generator():
+        if len(state['standard']):
+            state['payload'] = JSONGenerator(state['standard']).generate('Benchmark')
+
+    def configuration_generator():
+        if len(state['config']):
+            state['config_payload'] = ConfigurationGenerator(state['config']).generate('Benchmark')
+
+    def serialize():
+        state['bytes'] = sum(
+            payload_size(state[key]) for key in ('payload', 'config_payload') if key in state
+        )
+
+    return state, [parse, json_generator, configuration_generator, serialize]
+
+
+def measure(workbook, repeat):
+    """
+    Return ({stage: {'seconds', 'peak_mb'}}, payload bytes) for one workbook.
+    """
+    results = {stage: {'seconds': float('inf'), 'peak_mb': 0.0} for stage in STAGES}
+
+    for _ in range(repeat):
+        state, stages = run_stages(workbook)
+        for stage, func in zip(STAGES, stages):
+            started = time.perf_counter()
+            func()
+            results[stage]['seconds'] = min(results[stage]['seconds'], time.perf_counter() - started)
+
+    # Separate pass: tracemalloc slows everything down, so it must not affect timings
+    state, stages = run_stages(workbook)
+    tracemalloc.start()
+    try:
+        for stage, func in zip(STAGES, stages):
+            tracemalloc.reset_peak()
+            func()
+            results[stage]['peak_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+    for stage in STAGES:
+        results[stage]['seconds'] = round(results[stage]['seconds'], 4)
+        results[stage]['peak_mb'] = round(results[stage]['peak_mb'], 2)
+    return results, state['bytes']
+
+
+def legacy_derive(df):
+    """
+    The original row-wise derivation from JSONGenerator.generate, kept as the reference.
+    """
+    df['transactionName'] = ''
+    df['transactionResourceType'] = ''
+    df['commerceName'] = ''
+    df['resourceType'] = ''
+
+    for idx, row in df.iterrows():
+        if row['childResourceType'] != 'integration' and row['transactionVariableName'] != '':
+            df.at[idx, 'transactionResourceType'] = 'document'
+
+        if row['transactionVariableName'] == 'transaction':
+            df.at[idx, 'transactionName'] = 'Transaction'
+        elif row['transactionVariableName'] == 'transactionLine':
+            df.at[idx, 'transactionName'] = 'Transaction Line'
+
+        if row['commerceVariableName'] != '':
+            df.at[idx, 'commerceName'] = row['commerceVariableName']
+
+        if row['itemName'] == 'Commerce':
+            df.at[idx, 'resourceType'] = 'process'
+        elif row['itemName'] in ['Document Designer', 'Email Designer']:
+            df.at[idx, 'resourceType'] = '_set'
+        elif row['itemName'] == 'Data Table':
+            df.at[idx, 'resourceType'] = 'data_table_folder'
+    return {rule.target: df[rule.target].tolist() for rule in DERIVED_COLUMN_RULES}
+
+
+def rule_derive(table):
+    """
+    DERIVED_COLUMN_RULES as JSONGenerator evaluates them: once per distinct code combination.
+    """
+    _, codes = JSONGenerator._read_columns(table)
+    derived = JSONGenerator._derive_rows(DERIVED_COLUMN_RULES, codes, range(len(table)))
+    return {rule.target: [row[index] for row in derived] for index, rule in enumerate(DERIVED_COLUMN_RULES)}
+
+
+def measure_derived_columns(rows, repeat):
+    """
+    Return (row-wise seconds, rule table seconds), best of repeat runs each.
+    Exits if the two derivations disagree.
+    """
+    df = build_tracker(rows)
+    table = as_table(df)
+    legacy_seconds = rules_seconds = float('inf')
+    for _ in range(repeat):
+        frame = df.copy()
+        started = time.perf_counter()
+        legacy_columns = legacy_derive(frame)
+        legacy_seconds = min(legacy_seconds, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        rule_columns = rule_derive(table)
+        rules_seconds = min(rules_seconds, time.perf_counter() - started)
+
+    for rule in DERIVED_COLUMN_RULES:
+        if legacy_columns[rule.target] != rule_columns[rule.target]:
+            raise SystemExit(f"Derived column '{rule.target}' differs from the row-wise reference.")
+    return legacy_seconds, rules_seconds
+
+
+def compare(name, current, baseline, tolerance):
+    """
+    Return a list of regression messages for one scenario.
+    """
+    regressions = []
+    for stage in STAGES:
+        for metric, floor in (('seconds', MIN_SECONDS_DELTA), ('peak_mb', MIN_PEAK_MB_DELTA)):
+            old = baseline['stages'][stage][metric]
+            new = current['stages'][stage][metric]
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append(f"{name}/{stage}: {metric} {old} -> {new}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse, generate and serialize on synthetic trackers.")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable; default: all)")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply every scenario's row count")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per scenario (best time is kept)")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="Allowed relative regression before failing (default 0.5 = 50%%)")
+    parser.add_argument('--baselines', type=Path, default=BASELINES_PATH, help="Baselines file")
+    parser.add_argument('--update-baselines', action='store_true', help="Store these results as the new baselines")
+    parser.add_argument('--json', type=Path, help="Also write the results to this file")
+    parser.add_argument('--derived-columns-rows', type=int, default=20000,
+                        help="Rows of the derived column comparison (0 to skip it)")
+    args = parser.parse_args()
+
+    names = args.scenario or list(SCENARIOS)
+    baselines = json.loads(args.baselines.read_text()) if args.baselines.exists() else {}
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            params = dict(SCENARIOS[name])
+            params['rows'] = max(1, int(params['rows'] * args.scale))
+            workbook = Path(tmp) / f"{name}.xlsx"
+            write_workbook(build_tracker(**params), workbook)
+
+            stages, payload_bytes = measure(workbook, args.repeat)
+            results[name] = {'rows': params['rows'], 'payload_bytes': payload_bytes, 'stages': stages}
+
+            print(f"\n{name} ({params['rows']} rows, payload {payload_bytes} bytes)")
+            print(f"  {'Stage':<26} {'Seconds':>9} {'Peak MB':>9}")
+            for stage in STAGES:
+                print(f"  {stage:<26} {stages[stage]['seconds']:>9.3f} {stages[stage]['peak_mb']:>9.2f}")
+
+    if args.derived_columns_rows:
+        legacy_seconds, rules_seconds = measure_derived_columns(args.derived_columns_rows, args.repeat)
+        print(f"\nderived columns ({args.derived_columns_rows} rows, same values as the row-wise reference)")
+        print(f"  {'Row-wise (legacy)':<26} {legacy_seconds:>9.3f}")
+        print(f"  {'Column rules':<26} {rules_seconds:>9.3f}")
+        print(f"  {'Speedup':<26} {legacy_seconds / rules_seconds:>8.1f}x")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    if args.update_baselines:
+        baselines.update(results)
+        args.baselines.write_text(json.dumps(baselines, indent=2) + '\n')
+        print(f"\nBaselines written to {args.baselines}")
+        return
+
+    regressions = []
+    for name, current in results.items():
+        baseline = baselines.get(name)
+        if baseline is None or baseline['rows'] != current['rows']:
+            print(f"\nNo baseline for {name} at {current['rows']} rows; not compared.")
+            continue
+        regressions.extend(compare(name, current, baseline, args.tolerance))
+
+    if regressions:
+        print("\nRegressions past baseline:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print("\nNo regressions past baseline.")
+
+
+if __name__ == "__main__":
+    main()
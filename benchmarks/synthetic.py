@@ -0,0 +1,97 @@
+"""
+Synthetic tracker workbooks with a controlled shape, for benchmarks.
+"""
+import random
+
+import pandas as pd
+
+TRACKER_COLUMNS = [
+    'itemName', 'commerceVariableName', 'granular',
+    'transactionVariableName', 'childVariableName', 'childResourceType'
+]
+
+DEFAULT_ITEM_MIX = {
+    'Commerce': 0.5,
+    'Util Library': 0.1,
+    'Document Designer': 0.1,
+    'Email Designer': 0.05,
+    'Data Table': 0.05,
+    'Configuration': 0.2,
+}
+
+CHILD_RESOURCE_TYPES = ['action', 'attribute', 'rule', 'library', 'integration']
+CONFIG_RESOURCE_TYPES = ['product_family', 'product_line', 'model']
+
+
+def transaction_names(count):
+    """
+    The first `count` transactionVariableName values: the two the generator names,
+    then custom ones.
+    """
+    names = ['transaction', 'transactionLine']
+    return (names + [f"transaction{i}" for i in range(3, count + 1)])[:count]
+
+
+def build_tracker(rows, item_mix=None, granular_share=0.5, transactions=2,
+                  config_depth=3, config_fanout=5, seed=0):
+    """
+    Build a tracker DataFrame in the layout ExcelParser returns.
+
+    Args:
+        rows: Number of rows.
+        item_mix: itemName -> relative weight (DEFAULT_ITEM_MIX if None).
+        granular_share: Share of Commerce rows that are granular and attached to a
+            transaction; the rest go directly under the process.
+        transactions: Number of distinct transactionVariableName values on granular rows.
+        config_depth: Maximum number of dotted segments in Configuration paths.
+        config_fanout: Distinct values per Configuration path segment.
+        seed: Random seed; the same arguments always give the same tracker.
+    """
+    rnd = random.Random(seed)
+    mix = item_mix or DEFAULT_ITEM_MIX
+    item_names = rnd.choices(list(mix), weights=list(mix.values()), k=rows)
+    transaction_vars = transaction_names(transactions)
+
+    data = {col: [] for col in TRACKER_COLUMNS}
+    for index, item_name in enumerate(item_names):
+        if item_name == 'Configuration':
+            depth = config_depth if rnd.random() < 0.7 else rnd.randint(1, config_depth)
+            segments = [f"seg{level}_{rnd.randrange(config_fanout)}" for level in range(depth)]
+            commerce_var = '.'.join(segments)
+            granular = True
+            transaction_var = CONFIG_RESOURCE_TYPES[min(depth, len(CONFIG_RESOURCE_TYPES)) - 1]
+            child_var = f"attr{rnd.randrange(200)}"
+            child_resource = rnd.choice(['attribute', 'action'])
+        else:
+            commerce_var = 'oraclecpqo_bmClone_2'
+            child_var = f"{item_name.replace(' ', '')}_{index}"
+            child_resource = rnd.choice(CHILD_RESOURCE_TYPES)
+            if item_name == 'Commerce' and transaction_vars and rnd.random() < granular_share:
+                granular = True
+                transaction_var = rnd.choice(transaction_vars)
+            else:
+                granular = False
+                transaction_var = ''
+
+        data['itemName'].append(item_name)
+        data['commerceVariableName'].append(commerce_var)
+        data['granular'].append(granular)
+        data['transactionVariableName'].append(transaction_var)
+        data['childVariableName'].append(child_var)
+        data['childResourceType'].append(child_resource)
+
+    return pd.DataFrame(data)
+
+
+def write_workbook(df, path):
+    """
+    Write a tracker DataFrame to an .xlsx file (streamed, write-only mode).
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Tracker')
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        sheet.append([None if value == '' else value for value in row])
+    workbook.save(path)
@@ -1,11 +1,24 @@
-import pandas as pd
-from typing import Dict, List, Any, Set
+from typing import Dict, List, Any, Set, Union, Iterable, Iterator, BinaryIO, TYPE_CHECKING
+
+from instrumentation import count_nodes, traced
+from payload_writer import encode
+from tracker_table import TrackerTable, as_table, group_by_codes
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class ConfigurationGenerator:
-    def __init__(self, df: pd.DataFrame):
-        self.df = df
+    def __init__(self, df: Union[TrackerTable, 'pd.DataFrame']):
+        """
+        Args:
+            df: Configuration rows; a DataFrame is converted to a TrackerTable once.
+        """
+        self.table = as_table(df)
+        self._resource_type_cache = {}
         
+    @traced('configuration_generator', lambda payload, self, *args, **kwargs: {
+        'rows': len(self.table), 'nodes': count_nodes(payload)})
     def generate(self, package_name: str) -> Dict[str, Any]:
         """
         Generate Configuration JSON payload from Excel data.
@@ -30,6 +43,63 @@ class ConfigurationGenerator:
             }
         }
     
+    @traced('configuration_generator', lambda written, self, *args, **kwargs: {
+        'rows': len(self.table), 'bytes': written})
+    def write(self, package_name: str, fp: BinaryIO) -> int:
+        """
+        Stream the Configuration payload as compact JSON to a binary file object
+        (a file, stdout's buffer or a socket's makefile('wb')), without building the tree.
+
+        The bytes are identical to write_payload(self.generate(package_name), fp).
+
+        Returns:
+            Number of bytes written.
+        """
+        written = 0
+        for chunk in iter_configuration_chunks(self.iter_path_rows(), package_name):
+            fp.write(chunk)
+            written += len(chunk)
+        fp.write(b'\n')
+        return written
+
+    def iter_path_rows(self) -> Iterator[tuple]:
+        """
+        Yield (commerceVariableName, transactionVariableName, childVariableName,
+        childResourceType, granular) rows grouped the way _construct_hierarchy
+        orders them: by product family, then second-level segment, then path,
+        each in order of first appearance.
+        """
+        table = self.table
+        commerce_values = table['commerceVariableName']
+        if 'granular' in table.columns:
+            granular_values = table['granular']
+        else:
+            granular_values = [True] * len(table)
+
+        # Rows per path, grouped on the column's codes; each distinct value is converted to its path once
+        codes, categories = table.categories('commerceVariableName')
+        path_rows = group_by_codes(codes, [str(value) for value in categories])
+
+        # product family -> second segment (None for the family's own path) -> paths
+        families = {}
+        for path in path_rows:
+            segments = path.split('.')
+            branches = families.setdefault(segments[0], {})
+            branches.setdefault(segments[1] if len(segments) > 1 else None, []).append(path)
+
+        columns = (
+            commerce_values,
+            table['transactionVariableName'],
+            table['childVariableName'],
+            table['childResourceType'],
+            granular_values
+        )
+        for branches in families.values():
+            for paths in branches.values():
+                for path in paths:
+                    for index in path_rows[path]:
+                        yield tuple(values[index] for values in columns)
+
     def _build_tree(self) -> List[Dict[str, Any]]:
         """
         Build the nested tree structure from Configuration rows.
@@ -37,31 +107,40 @@ class ConfigurationGenerator:
         # Group data by path
         path_data = {}
         
-        for _, row in self.df.iterrows():
-            commerce_var = str(row['commerceVariableName'])
-            transaction_var = str(row['transactionVariableName'])
-            child_var = str(row['childVariableName'])
-            child_resource = str(row['childResourceType'])
-            granular = bool(row.get('granular', True))
-            
-            path_segments = commerce_var.split('.')
+        if 'granular' in self.table.columns:
+            granular_values = self.table['granular']
+        else:
+            granular_values = [True] * len(self.table)
+        
+        rows = zip(
+            self.table['commerceVariableName'],
+            self.table['transactionVariableName'],
+            self.table['childVariableName'],
+            self.table['childResourceType'],
+            granular_values
+        )
+        
+        for commerce_var, transaction_var, child_var, child_resource, granular in rows:
+            commerce_var = str(commerce_var)
+            child_var = str(child_var)
+            child_resource = str(child_resource)
             
             # Store path information
-            if commerce_var not in path_data:
-                path_data[commerce_var] = {
-                    'segments': path_segments,
-                    'transaction_type': transaction_var,
-                    'granular': granular,
-                    'children': []
+            data = path_data.get(commerce_var)
+            if data is None:
+                data = path_data[commerce_var] = {
+                    'segments': commerce_var.split('.'),
+                    'transaction_type': str(transaction_var),
+                    'granular': bool(granular),
+                    'children': [],
+                    'child_keys': set()
                 }
             
             # Add unique children only
             child_key = f"{child_var}_{child_resource}"
-            existing_children = [f"{c['variableName']}_{c['resourceType']}" 
-                                for c in path_data[commerce_var]['children']]
-            
-            if child_key not in existing_children:
-                path_data[commerce_var]['children'].append({
+            if child_key not in data['child_keys']:
+                data['child_keys'].add(child_key)
+                data['children'].append({
                     'name': child_var,
                     'variableName': child_var,
                     'resourceType': child_resource
@@ -73,25 +152,51 @@ class ConfigurationGenerator:
     def _construct_hierarchy(self, path_data: Dict) -> List[Dict[str, Any]]:
         """
         Construct the hierarchical tree structure with proper nesting.
+        
+        Single pass over path_data: product families and their second-level nodes are
+        merged by variableName, anything deeper is attached as one branch per path.
         """
-        # Find the top-level product_family (first segment of all paths)
+        # top-level product_family (first segment of all paths) -> (node, second-level branches)
         top_level_nodes = {}
         
-        for path, data in path_data.items():
+        for data in path_data.values():
             segments = data['segments']
-            if len(segments) > 0:
-                top_segment = segments[0]
-                if top_segment not in top_level_nodes:
-                    top_level_nodes[top_segment] = {
-                        'variableName': top_segment,
-                        'name': top_segment.capitalize(),
-                        'resourceType': 'product_family',
-                        'granular': data['granular']
-                    }
+            top_segment = segments[0]
+            
+            if top_segment not in top_level_nodes:
+                top_level_nodes[top_segment] = ({
+                    'variableName': top_segment,
+                    'name': top_segment.capitalize(),
+                    'resourceType': 'product_family',
+                    'granular': data['granular']
+                }, {})
+            branches = top_level_nodes[top_segment][1]
+            
+            if len(segments) == 1:
+                # Leaf children directly under the product family
+                branches.setdefault('_direct_children', []).extend(data['children'])
+                continue
+            
+            next_segment = segments[1]
+            branch = branches.get(next_segment)
+            if branch is None:
+                branch = branches[next_segment] = {
+                    'name': next_segment.capitalize(),
+                    'variableName': next_segment,
+                    'resourceType': self._get_resource_type(segments, 1, data['transaction_type']),
+                    'granular': data['granular'],
+                    '_children': [],
+                    '_leaf_children': []
+                }
+            
+            if len(segments) > 2:
+                branch['_children'].append(self._build_branch(segments, 2, data))
+            else:
+                branch['_leaf_children'].extend(data['children'])
         
         # Build complete structure for each top-level node
         result = []
-        for top_var, top_node in top_level_nodes.items():
+        for top_node, branches in top_level_nodes.values():
             # Add All Product Family wrapper with duplicated top-level inside
             all_product_family = {
                 'name': 'All Product Family',
@@ -110,8 +215,7 @@ class ConfigurationGenerator:
                 'children': []
             }
             
-            # Build children for the inner top node
-            inner_children = self._build_children_for_segment(top_var, path_data)
+            inner_children = self._merge_branches(branches)
             if inner_children:
                 inner_top_node['children'] = inner_children
             
@@ -122,59 +226,12 @@ class ConfigurationGenerator:
         
         return result
     
-    def _build_children_for_segment(self, parent_var: str, path_data: Dict) -> List[Dict[str, Any]]:
+    def _merge_branches(self, branches: Dict) -> List[Dict[str, Any]]:
         """
-        Build children for a given parent segment.
+        Convert the second-level branches of a product family into child nodes.
         """
-        children_dict = {}
-        
-        for path, data in path_data.items():
-            segments = data['segments']
-            
-            # Check if this path starts with parent_var
-            if len(segments) > 0 and segments[0] == parent_var:
-                if len(segments) > 1:
-                    # Process next level
-                    next_segment = segments[1]
-                    full_path = '.'.join(segments[:2])
-                    
-                    if next_segment not in children_dict:
-                        # Determine resourceType based on depth and transaction_var
-                        resource_type = self._get_resource_type(segments, 1, data['transaction_type'])
-                        
-                        children_dict[next_segment] = {
-                            'name': next_segment.capitalize(),
-                            'variableName': next_segment,
-                            'resourceType': resource_type,
-                            'granular': data['granular'],
-                            '_children': [],
-                            '_leaf_children': []
-                        }
-                    
-                    # Add deeper children or leaf children
-                    if len(segments) > 2:
-                        # Has more nesting
-                        next_path = '.'.join(segments[1:])
-                        deeper_children = self._build_children_for_segment(next_segment, 
-                                                                           {next_path: {
-                                                                               'segments': segments[1:],
-                                                                               'transaction_type': data['transaction_type'],
-                                                                               'granular': data['granular'],
-                                                                               'children': data['children']
-                                                                           }})
-                        children_dict[next_segment]['_children'].extend(deeper_children)
-                    elif path == full_path:
-                        # This is the target path, add leaf children
-                        children_dict[next_segment]['_leaf_children'].extend(data['children'])
-                elif len(segments) == 1 and segments[0] == parent_var:
-                    # Leaf children at this level
-                    if '_direct_children' not in children_dict:
-                        children_dict['_direct_children'] = []
-                    children_dict['_direct_children'].extend(data['children'])
-        
-        # Convert to list and merge children
         result = []
-        for key, node in children_dict.items():
+        for key, node in branches.items():
             if key == '_direct_children':
                 result.extend(node)
             else:
@@ -193,21 +250,212 @@ class ConfigurationGenerator:
         
         return result
     
+    def _build_branch(self, segments: List[str], depth: int, data: Dict) -> Dict[str, Any]:
+        """
+        Build the chain of nodes for segments[depth:] of a single path, bottom-up.
+        """
+        children = list(data['children'])
+        for level in range(len(segments) - 1, depth - 1, -1):
+            node = {
+                'name': segments[level].capitalize(),
+                'variableName': segments[level],
+                'resourceType': self._get_resource_type(segments, level, data['transaction_type']),
+                'granular': data['granular']
+            }
+            if children:
+                node['children'] = children
+            children = [node]
+        
+        return node
+    
     def _get_resource_type(self, segments: List[str], depth: int, transaction_type: str) -> str:
         """
         Determine resource type based on depth and transaction type.
         """
+        # The result only depends on the distance from the last segment
+        levels_from_end = len(segments) - 1 - depth
+        key = (levels_from_end, transaction_type)
+        if key not in self._resource_type_cache:
+            self._resource_type_cache[key] = self._resolve_resource_type(levels_from_end, transaction_type)
+        return self._resource_type_cache[key]
+    
+    @staticmethod
+    def _resolve_resource_type(levels_from_end: int, transaction_type: str) -> str:
         type_hierarchy = ['product_family', 'product_line', 'model']
         
         # If this is the last segment, use transaction_type
-        if depth == len(segments) - 1:
+        if levels_from_end == 0:
             return transaction_type
         
         # Otherwise, work backwards from transaction_type
         if transaction_type in type_hierarchy:
             trans_index = type_hierarchy.index(transaction_type)
-            levels_from_end = len(segments) - 1 - depth
             target_index = trans_index - levels_from_end
             return type_hierarchy[max(0, target_index)]
         
         return 'product_family'
+
+
+def write_configuration(rows: Iterable[tuple], package_name: str, fp: BinaryIO) -> int:
+    """
+    Stream the Configuration payload for path-grouped rows to a binary file object.
+
+    Returns:
+        Number of bytes written.
+    """
+    written = 0
+    for chunk in iter_configuration_chunks(rows, package_name):
+        fp.write(chunk)
+        written += len(chunk)
+    fp.write(b'\n')
+    return written
+
+
+def iter_configuration_chunks(rows: Iterable[tuple], package_name: str) -> Iterator[bytes]:
+    """
+    Yield the compact JSON of the Configuration payload, walking the hierarchy as
+    rows arrive.
+
+    rows are (commerceVariableName, transactionVariableName, childVariableName,
+    childResourceType, granular) tuples, grouped so that the rows of a path, the
+    paths of a product family and the paths sharing a second-level segment are
+    each contiguous (e.g. sorted by path segments, or ConfigurationGenerator.iter_path_rows).
+    For rows in the order of iter_path_rows the output is byte-identical to the
+    generate() payload written with write_payload.
+
+    Only the current path, its second-level node's leaf children and the names of
+    the families and second-level nodes already closed are held in memory.
+    """
+    resource_types = {}
+
+    def resource_type(segments, depth, transaction_type):
+        key = (len(segments) - 1 - depth, transaction_type)
+        if key not in resource_types:
+            resource_types[key] = ConfigurationGenerator._resolve_resource_type(*key)
+        return resource_types[key]
+
+    def node_open(name, variable_name, resource, granular):
+        return (b'{"name":' + encode(name) + b',"variableName":' + encode(variable_name) +
+                b',"resourceType":' + encode(resource) + b',"granular":' + encode(granular))
+
+    def leaves(children):
+        return b','.join(encode(child) for child in children)
+
+    yield b'{"name":' + encode(package_name) + b',"contents":{"items":[{"name":"Configuration","category":"CONFIGURATION","children":['
+
+    family = None
+    closed_families = set()
+    branch = None
+    closed_branches = set()
+    family_children = 0
+    branch_children_open = False
+    branch_leaves = []
+
+    def close_branch():
+        chunk = b''
+        if branch_leaves:
+            chunk = (b',' if branch_children_open else b',"children":[') + leaves(branch_leaves)
+        if branch_children_open or branch_leaves:
+            chunk += b']'
+        return chunk + b'}'
+
+    for path, transaction_type, granular, children in _iter_paths(rows):
+        segments = path.split('.')
+        top_segment = segments[0]
+
+        if top_segment != family:
+            if family is not None:
+                if branch is not None:
+                    yield close_branch()
+                yield b']}]}]}'
+                closed_families.add(family)
+            if top_segment in closed_families:
+                raise ValueError(f"Configuration rows are not grouped: product family '{top_segment}' appears again.")
+            opening = b',' if family is not None else b''
+            yield (opening + b'{"variableName":' + encode(top_segment) + b',"name":' + encode(top_segment.capitalize()) +
+                   b',"resourceType":"product_family","granular":' + encode(granular) +
+                   b',"children":[{"name":"All Product Family","variableName":"All Product Family",'
+                   b'"resourceType":"all_product_family","granular":true,"children":[' +
+                   node_open(top_segment.capitalize(), top_segment, 'product_family', granular) + b',"children":[')
+            family = top_segment
+            branch = None
+            closed_branches = set()
+            family_children = 0
+
+        if len(segments) == 1:
+            # Leaf children directly under the product family
+            if branch is not None:
+                yield close_branch()
+                closed_branches.add(branch)
+                branch = None
+            yield (b',' if family_children else b'') + leaves(children)
+            family_children += len(children)
+            continue
+
+        next_segment = segments[1]
+        if next_segment != branch:
+            if branch is not None:
+                yield close_branch()
+                closed_branches.add(branch)
+            if next_segment in closed_branches:
+                raise ValueError(f"Configuration rows are not grouped: '{top_segment}.{next_segment}' appears again.")
+            yield (b',' if family_children else b'') + node_open(
+                next_segment.capitalize(), next_segment, resource_type(segments, 1, transaction_type), granular)
+            family_children += 1
+            branch = next_segment
+            branch_children_open = False
+            branch_leaves = []
+
+        if len(segments) > 2:
+            yield b',' if branch_children_open else b',"children":['
+            branch_children_open = True
+            # One branch per deeper path, as _build_branch builds it
+            chunk = b''
+            for level in range(2, len(segments)):
+                chunk += node_open(segments[level].capitalize(), segments[level],
+                                   resource_type(segments, level, transaction_type), granular)
+                if level < len(segments) - 1:
+                    chunk += b',"children":['
+            if children:
+                chunk += b',"children":[' + leaves(children) + b']'
+            yield chunk + b'}' + b']}' * (len(segments) - 3)
+        else:
+            branch_leaves.extend(children)
+
+    if family is not None:
+        if branch is not None:
+            yield close_branch()
+        yield b']}]}]}'
+    yield b']}]}}'
+
+
+def _iter_paths(rows: Iterable[tuple]) -> Iterator[tuple]:
+    """
+    Collapse runs of rows with the same path into (path, transaction type,
+    granular, unique children), typed the way _build_tree types them.
+    """
+    path = None
+    for commerce_var, transaction_var, child_var, child_resource, granular in rows:
+        commerce_var = str(commerce_var)
+        if commerce_var != path:
+            if path is not None:
+                yield path, transaction_type, is_granular, children
+            path = commerce_var
+            transaction_type = str(transaction_var)
+            is_granular = bool(granular)
+            children = []
+            child_keys = set()
+
+        child_var = str(child_var)
+        child_resource = str(child_resource)
+        child_key = f"{child_var}_{child_resource}"
+        if child_key not in child_keys:
+            child_keys.add(child_key)
+            children.append({
+                'name': child_var,
+                'variableName': child_var,
+                'resourceType': child_resource
+            })
+
+    if path is not None:
+        yield path, transaction_type, is_granular, children
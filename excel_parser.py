@@ -1,41 +1,424 @@
+import math
+import mmap
+import os
+
 import pandas as pd
+from pandas._libs.parsers import STR_NA_VALUES
+from pandas.io.parsers import TextParser
+
+from instrumentation import traced
+from tracker_schema import CORE_REQUIRED_COLUMNS, OPTIONAL_COLUMNS, PAYLOAD_COLUMNS
+
+DEFAULT_BATCH_SIZE = 10000
+
+# File extension -> reader for trackers that are not workbooks
+TABULAR_READERS = {
+    '.csv': '_read_csv',
+    '.parquet': '_read_parquet',
+    '.jsonl': '_read_json_lines',
+    '.json': '_read_json',
+}
+
+# Text TextParser reads as booleans
+BOOLEAN_TEXT = frozenset(['True', 'TRUE', 'true', 'False', 'FALSE', 'false'])
+
 
 class ExcelParser:
-    def __init__(self, file_path):
+    """
+    Reads a tracker into a DataFrame. Workbooks are the default; .csv, .parquet,
+    .jsonl and .json (array of row objects) files are dispatched on their extension.
+    """
+    def __init__(self, file_path, cache=None, sheet=None):
+        """
+        Args:
+            file_path: Path to the tracker workbook or tracker file.
+            cache: Optional ParseCache; parsed frames are reused while the file is unchanged.
+            sheet: Name of the sheet to read; the first sheet if None.
+        """
         self.file_path = file_path
-        
-    def parse(self):
+        self.cache = cache
+        self.sheet = sheet
+
+    def sheet_names(self):
+        """
+        Names of the workbook's sheets, in workbook order.
+        """
+        try:
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(self.file_path, read_only=True)
+            try:
+                return list(workbook.sheetnames)
+            finally:
+                workbook.close()
+
+        except Exception as e:
+            raise Exception(f"Failed to parse Excel file: {str(e)}")
+
+    @traced('parse', lambda df, self, *args, **kwargs: {'rows': len(df)})
+    def parse(self, streaming=False, batch_size=DEFAULT_BATCH_SIZE):
         """
         Parse the Excel file and return structured data.
+
+        Args:
+            streaming: Read the sheet row by row and keep only PAYLOAD_COLUMNS
+                instead of loading every column with pd.read_excel.
+            batch_size: Rows per batch in streaming mode.
         """
+        if self.cache is None:
+            return self._parse(streaming, batch_size)
+
+        settings = {'streaming': streaming}
+        if self.sheet is not None:
+            settings['sheet'] = self.sheet
+        try:
+            key = self.cache.key(self.file_path, settings)
+        except OSError as e:
+            raise Exception(f"Failed to parse Excel file: {str(e)}")
+
+        df = self.cache.get(key)
+        if df is None:
+            df = self._parse(streaming, batch_size)
+            try:
+                self.cache.put(key, df)
+            except OSError:
+                # The cache is only an optimization; a read-only cache dir must not fail the run
+                pass
+        return df
+
+    def _parse(self, streaming, batch_size):
+        reader = TABULAR_READERS.get(os.path.splitext(str(self.file_path))[1].lower())
+        if reader is not None:
+            return self._read_tabular(getattr(self, reader))
+
+        if streaming:
+            # Types are inferred once over whole columns, as pd.read_excel does; typing
+            # each batch on its own would type a column differently per batch
+            rows = []
+            columns = None
+            for columns, batch in self._iter_row_batches(batch_size):
+                rows.extend(batch)
+            return self._build_batch(rows, columns)
+
         try:
             # Read Excel file
-            df = pd.read_excel(self.file_path)
-            
+            df = pd.read_excel(self.file_path, sheet_name=0 if self.sheet is None else self.sheet)
+
             # Check if core required columns exist
-            core_required_columns = [
-                'itemName', 'commerceVariableName',
-                'childVariableName', 'childResourceType'
-            ]
-            
-            for col in core_required_columns:
-                if col not in df.columns:
-                    raise ValueError(f"Required column '{col}' not found in Excel file.")
-            
+            self._check_required_columns(df.columns)
+
             # For new columns, add them with empty values if they don't exist
-            new_columns = [
-                'granular', 'transactionVariableName'
-            ]
-            
-            for col in new_columns:
-                if col not in df.columns:
-                    df[col] = ''
+            return self._fill_optional_columns(df)
+
+        except Exception as e:
+            raise Exception(f"Failed to parse Excel file: {str(e)}")
+
+    def _read_tabular(self, reader):
+        """
+        Read a non-workbook tracker with reader(), which returns the PAYLOAD_COLUMNS
+        present in the file, and apply the same validation and defaults as workbooks.
+        """
+        try:
+            if self.sheet is not None:
+                raise ValueError(f"'{self.file_path}' has no sheets.")
+            df = reader()
+            self._check_required_columns(df.columns, 'tracker file')
+            return self._fill_optional_columns(df)[PAYLOAD_COLUMNS]
+
+        except Exception as e:
+            raise Exception(f"Failed to parse tracker file: {str(e)}")
+
+    def _read_csv(self):
+        # Validate the header before reading any data, then parse only the needed
+        # columns with the C parser over a memory map
+        header = pd.read_csv(self.file_path, nrows=0).columns
+        self._check_required_columns(header, 'tracker file')
+        usecols = [col for col in PAYLOAD_COLUMNS if col in header]
+        return pd.read_csv(self.file_path, usecols=usecols, memory_map=True)
+
+    def _read_parquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet trackers require pyarrow (pip install pyarrow).")
+
+        header = pq.read_schema(self.file_path, memory_map=True).names
+        self._check_required_columns(header, 'tracker file')
+        columns = [col for col in PAYLOAD_COLUMNS if col in header]
+        return pd.read_parquet(self.file_path, engine='pyarrow', columns=columns, memory_map=True)
+
+    def _read_json_lines(self):
+        return self._read_mapped_json(lines=True)
+
+    def _read_json(self):
+        return self._read_mapped_json(lines=False)
+
+    def _read_mapped_json(self, lines):
+        # dtype=False keeps values as written; nulls and missing keys become NaN
+        if os.path.getsize(self.file_path) == 0:
+            return pd.DataFrame()
+        with open(self.file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            df = pd.read_json(mapped, lines=lines, orient='records', dtype=False, convert_dates=False)
+        return df[[col for col in PAYLOAD_COLUMNS if col in df.columns]]
+
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Stream the sheet (the first one unless a sheet was given) with openpyxl's
+        read-only reader and yield DataFrames of at most batch_size rows containing
+        only PAYLOAD_COLUMNS.
+
+        Each batch is typed on its own: a column mixing numbers with blanks or text
+        can be typed differently per batch (see iter_chunks).
+        """
+        for columns, batch in self._iter_row_batches(batch_size):
+            yield self._build_batch(batch, columns)
+
+    def iter_rows(self, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Stream the sheet like iter_batches, but yield each batch as the rows read,
+        before any type inference: lists of cell values in PAYLOAD_COLUMNS order,
+        with empty cells and missing optional columns as ''. A ColumnTyper that has
+        seen every row types them as parse does.
+        """
+        for columns, batch in self._iter_row_batches(batch_size):
+            if columns != PAYLOAD_COLUMNS:
+                positions = [columns.index(col) if col in columns else None for col in PAYLOAD_COLUMNS]
+                batch = [[row[index] if index is not None else '' for index in positions] for row in batch]
+            yield batch
+
+    def _iter_row_batches(self, batch_size):
+        """
+        Yield (columns, rows) for batches of at most batch_size sheet rows, with the
+        cells of the PAYLOAD_COLUMNS present converted as pd.read_excel converts
+        them but not yet typed.
+
+        The header is validated before any data row is read, so a tracker with a
+        missing column fails without loading the sheet.
+        """
+        try:
+            from openpyxl import load_workbook
+
+            workbook = load_workbook(self.file_path, read_only=True, data_only=True)
+            try:
+                if self.sheet is None:
+                    sheet = workbook.worksheets[0]
+                elif self.sheet in workbook.sheetnames:
+                    sheet = workbook[self.sheet]
                 else:
-                    # Fill NA values with empty strings
-                    df[col] = df[col].fillna('')
-            
-            # Return the DataFrame for further processing
-            return df
-            
+                    raise ValueError(f"Sheet '{self.sheet}' not found.")
+                sheet.reset_dimensions()
+                rows = sheet.iter_rows(values_only=True)
+
+                header = next(rows, ())
+                positions = {}
+                for index, name in enumerate(header):
+                    if name is not None and str(name) not in positions:
+                        positions[str(name)] = index
+
+                self._check_required_columns(positions)
+                columns = [col for col in PAYLOAD_COLUMNS if col in positions]
+                indexes = [positions[col] for col in columns]
+
+                batch = []
+                emitted = False
+                blank_rows = 0
+                for row in rows:
+                    # Like pd.read_excel, keep blank rows between data but drop trailing ones
+                    if all(value is None for value in row):
+                        blank_rows += 1
+                        continue
+                    pending = [[''] * len(indexes)] * blank_rows
+                    pending.append([
+                        self._convert_cell(row[index]) if index < len(row) else ''
+                        for index in indexes
+                    ])
+                    blank_rows = 0
+
+                    for values in pending:
+                        batch.append(values)
+                        if len(batch) >= batch_size:
+                            yield columns, batch
+                            batch = []
+                            emitted = True
+
+                if batch or not emitted:
+                    yield columns, batch
+            finally:
+                workbook.close()
+
+        except Exception as e:
+            raise Exception(f"Failed to parse Excel file: {str(e)}")
+
+    def iter_chunks(self, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Read any tracker format in batches of at most batch_size rows, for trackers
+        too large to parse at once.
+
+        Yields (df, kinds): df has PAYLOAD_COLUMNS with the validation and defaults
+        parse applies, and kinds maps each column to the dtype kind the batch adds to
+        the column parse would build. pandas turns a column read as int in some
+        batches and float in others into floats, so a reader combining the batches
+        needs the kinds to get the same values.
+
+        Workbooks yield iter_batches' frames. CSV batches are typed per batch, so a
+        column mixing numbers and text may type a cell differently than a whole-file
+        read. .json arrays cannot be split and are read whole.
+        """
+        suffix = os.path.splitext(str(self.file_path))[1].lower()
+        if suffix not in TABULAR_READERS:
+            for df in self.iter_batches(batch_size):
+                yield df, {col: df[col].dtype.kind for col in PAYLOAD_COLUMNS}
+            return
+
+        try:
+            if self.sheet is not None:
+                raise ValueError(f"'{self.file_path}' has no sheets.")
+            if suffix == '.csv':
+                header = pd.read_csv(self.file_path, nrows=0).columns
+                self._check_required_columns(header, 'tracker file')
+                usecols = [col for col in PAYLOAD_COLUMNS if col in header]
+                chunks = pd.read_csv(self.file_path, usecols=usecols, chunksize=batch_size)
+            elif suffix == '.parquet':
+                chunks = self._iter_parquet_batches(batch_size)
+            elif suffix == '.jsonl' and os.path.getsize(self.file_path) > 0:
+                chunks = pd.read_json(self.file_path, lines=True, orient='records', dtype=False,
+                                      convert_dates=False, chunksize=batch_size)
+            else:
+                chunks = [self._read_json() if suffix == '.json' else pd.DataFrame()]
+
+            # A JSON Lines key missing from a whole batch is still a column of the
+            # whole file, with NaN in that batch
+            seen = set()
+            for df in chunks:
+                seen.update(df.columns)
+                df = df.reindex(columns=PAYLOAD_COLUMNS)
+                # The whole-file read fills optional columns after combining the batches
+                kinds = {col: df[col].dtype.kind for col in PAYLOAD_COLUMNS}
+                yield self._fill_optional_columns(df), kinds
+            self._check_required_columns(seen, 'tracker file')
+
         except Exception as e:
-            raise Exception(f"Failed to parse Excel file: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to parse tracker file: {str(e)}")
+
+    def _iter_parquet_batches(self, batch_size):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet trackers require pyarrow (pip install pyarrow).")
+
+        parquet_file = pq.ParquetFile(self.file_path, memory_map=True)
+        header = parquet_file.schema_arrow.names
+        self._check_required_columns(header, 'tracker file')
+        columns = [col for col in PAYLOAD_COLUMNS if col in header]
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+
+    @staticmethod
+    def _check_required_columns(columns, source='Excel file'):
+        for col in CORE_REQUIRED_COLUMNS:
+            if col not in columns:
+                raise ValueError(f"Required column '{col}' not found in {source}.")
+
+    @staticmethod
+    def _fill_optional_columns(df):
+        for col in OPTIONAL_COLUMNS:
+            if col not in df.columns:
+                df[col] = ''
+            else:
+                # Fill NA values with empty strings
+                df[col] = df[col].fillna('')
+        return df
+
+    @staticmethod
+    def _convert_cell(value):
+        """
+        Match pd.read_excel's openpyxl cell conversion: empty cells become ''
+        and integral floats become ints.
+        """
+        if value is None:
+            return ''
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    def _build_batch(self, batch, columns):
+        # Same NA handling and type inference pd.read_excel applies to sheet data
+        df = TextParser([columns] + batch, header=0, skip_blank_lines=False).read()
+        return self._fill_optional_columns(df)[PAYLOAD_COLUMNS]
+
+
+class ColumnTyper:
+    """
+    Types sheet rows read in batches (ExcelParser.iter_rows) as parse types them
+    over the whole sheet.
+
+    TextParser infers a column's type from the kinds of values it holds and the
+    order each kind first appears in (it even maps 1 and True, which hash alike,
+    to whichever came first). The typer keeps the first value of every kind per
+    column, a few values in all, and parses rows after them: the column then has
+    the same kinds in the same order of first appearance, so the rows are typed
+    as in the whole sheet.
+    """
+    def __init__(self, parser):
+        self._parser = parser
+        self._witnesses = [{} for _ in PAYLOAD_COLUMNS]
+
+    def add(self, rows):
+        """
+        Record the value kinds of rows (in PAYLOAD_COLUMNS order, as iter_rows yields them).
+        """
+        for witnesses, values in zip(self._witnesses, zip(*rows)):
+            for value in values:
+                kind = _value_kind(value)
+                if kind not in witnesses:
+                    witnesses[kind] = value
+
+    def build(self, rows):
+        """
+        A DataFrame of rows (from iter_rows) typed as parse types them, once every
+        row of the sheet has been added.
+        """
+        columns = [list(witnesses.values()) for witnesses in self._witnesses]
+        count = max(map(len, columns))
+        # Repeating a column's first value adds no kind and keeps the order kinds appear in
+        witness_rows = [list(row) for row in zip(*(values + values[:1] * (count - len(values))
+                                                   for values in columns))]
+        df = self._parser._build_batch(witness_rows + rows, PAYLOAD_COLUMNS)
+        return df.iloc[count:].reset_index(drop=True)
+
+
+def _value_kind(value):
+    """
+    The kind of a cell value for TextParser's type inference: values of one kind
+    are converted alike, whatever else the column holds.
+    """
+    kind = type(value)
+    if kind is str:
+        if value in STR_NA_VALUES or value in BOOLEAN_TEXT:
+            return str, value
+        first = value[:1]
+        if (first.isalpha() and first not in 'iInN') or '_' in value or not value.isascii():
+            # Text no number parser reads ('inf' and 'nan' can be numbers)
+            return str
+        try:
+            number = int(value)
+        except ValueError:
+            try:
+                number = float(value)
+            except ValueError:
+                return str
+            return str, float, value if first in 'iInN' else None, number in (0, 1), value != value.strip()
+        return (str, int, value != value.strip()) + _int_range(number)
+    if kind is bool or kind is int or kind is float:
+        if value == 0 or value == 1:
+            # Equal to (and hashed like) False and True
+            return kind, value
+        if kind is int:
+            return (int,) + _int_range(value)
+        return float, math.isfinite(value)
+    return kind
+
+
+def _int_range(number):
+    # int64 and uint64 bounds, where TextParser switches integer types
+    return number in (0, 1), number < -2 ** 63, number < 0, number >= 2 ** 63, number >= 2 ** 64
@@ -0,0 +1,200 @@
+"""
+Lightweight per-stage instrumentation.
+
+Spans record wall time, CPU time, peak RSS and stage counters (rows, nodes,
+payload bytes). Nothing is recorded until enable() is called; while disabled,
+span() returns a shared no-op object and traced() only checks a flag.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_enabled = False
+_started = time.perf_counter()
+_spans = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable():
+    global _enabled, _started
+    _enabled = True
+    _started = time.perf_counter()
+
+
+def is_enabled():
+    return _enabled
+
+
+def spans():
+    with _lock:
+        return list(_spans)
+
+
+def collect(records, **attrs):
+    """
+    Add spans recorded elsewhere (e.g. in a worker process), tagged with attrs.
+    """
+    with _lock:
+        _spans.extend(dict(record, **attrs) for record in records)
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+class _NoopSpan:
+    enabled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    enabled = True
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        _local.stack.pop()
+
+        record = {
+            'name': self.name,
+            'parent': self.parent,
+            'depth': self.depth,
+            'start': round(self._wall - _started, 6),
+            'wall': round(wall, 6),
+            'cpu': round(cpu, 6),
+            'peak_rss_mb': peak_rss_mb(),
+            'pid': os.getpid(),
+            'thread': threading.current_thread().name,
+        }
+        record.update(self.attrs)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+
+        with _lock:
+            _spans.append(record)
+        return False
+
+
+def span(name, **attrs):
+    """
+    Context manager timing a stage; call .set(rows=..., nodes=..., bytes=...) on it.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, attrs)
+
+
+def traced(name, measure=None):
+    """
+    Decorator recording a span around each call.
+
+    measure(result, *args, **kwargs) returns extra span attributes; it only runs
+    while instrumentation is enabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(name, {}) as current:
+                result = func(*args, **kwargs)
+                if measure is not None:
+                    current.set(**measure(result, *args, **kwargs))
+                return result
+        return wrapper
+    return decorator
+
+
+def count_nodes(payload):
+    """
+    Number of nodes below contents.items (items included).
+    """
+    count = 0
+    stack = list(payload['contents']['items'])
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.get('children') or ())
+    return count
+
+
+def write_trace(path):
+    """
+    Write all spans as a JSON trace.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'spans': spans()}, f, indent=2)
+
+
+def format_summary():
+    """
+    One row per stage: calls, wall/CPU seconds, counters and the highest peak RSS seen.
+    """
+    totals = {}
+    for record in spans():
+        total = totals.setdefault(record['name'], {
+            'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': 0, 'nodes': 0, 'bytes': 0, 'peak_rss_mb': None
+        })
+        total['calls'] += 1
+        total['wall'] += record['wall']
+        total['cpu'] += record['cpu']
+        for counter in ('rows', 'nodes', 'bytes'):
+            total[counter] += record.get(counter) or 0
+        if record['peak_rss_mb'] is not None:
+            total['peak_rss_mb'] = max(total['peak_rss_mb'] or 0, record['peak_rss_mb'])
+
+    lines = [f"{'Stage':<26} {'Calls':>5} {'Wall(s)':>9} {'CPU(s)':>9} {'Rows':>9} {'Nodes':>9} {'Bytes':>11} {'PeakRSS(MB)':>12}"]
+    for name, total in totals.items():
+        peak = '-' if total['peak_rss_mb'] is None else f"{total['peak_rss_mb']:.1f}"
+        lines.append(
+            f"{name:<26} {total['calls']:>5} {total['wall']:>9.3f} {total['cpu']:>9.3f} "
+            f"{total['rows'] or '-':>9} {total['nodes'] or '-':>9} {total['bytes'] or '-':>11} {peak:>12}"
+        )
+    return '\n'.join(lines)
@@ -1,77 +1,142 @@
-import pandas as pd
-import numpy as np
+import logging
+
+from instrumentation import count_nodes, traced
+from tracker_schema import (DERIVED_COLUMNS, ITEM_CATEGORIES, PAYLOAD_COLUMNS, DerivedColumnRule, derive_value,
+                            rule_inputs)
+from tracker_table import INTERNED_COLUMNS, as_table, group_by_codes
+
+# Progress messages; shown by the interactive CLI, silent unless logging is configured
+logger = logging.getLogger(__name__)
+
+# The commerce level node of an item: variableName, name and resourceType
+COMMERCE_NODE_RULES = [
+    DerivedColumnRule('commerceVariableName', 'commerceVariableName', None, ()),
+    DERIVED_COLUMNS['commerceName'],
+    DERIVED_COLUMNS['resourceType'],
+]
+
+# The transaction node a granular Commerce row belongs to: name, variableName and resourceType
+TRANSACTION_NODE_RULES = [
+    DERIVED_COLUMNS['transactionName'],
+    DerivedColumnRule('transactionVariableName', 'transactionVariableName', None, ()),
+    DERIVED_COLUMNS['transactionResourceType'],
+]
+
 
 class JSONGenerator:
     """
-    A class to generate a nested JSON payload from a pandas DataFrame.
+    A class to generate a nested JSON payload from tracker rows.
     """
     def __init__(self, excel_data):
         """
-        Initializes the JSONGenerator with a DataFrame.
+        Initializes the JSONGenerator with the tracker rows.
         
         Args:
-            excel_data (pd.DataFrame): The input data from an Excel file.
+            excel_data (TrackerTable or pd.DataFrame): The input data from an Excel file.
+                A DataFrame is converted to a TrackerTable once; neither is modified.
+        """
+        self.table = as_table(excel_data)
+
+    @staticmethod
+    def _child_nodes(rows, child_variable_names, child_resource_types):
+        """
+        Builds the leaf child nodes for a block of row indexes, preserving row order.
+        """
+        return [
+            {
+                "name": child_variable_names[index],
+                "variableName": child_variable_names[index],
+                "resourceType": child_resource_types[index]
+            }
+            for index in rows
+        ]
+
+    @staticmethod
+    def _derive_rows(rules, codes, rows):
+        """
+        Evaluates derived column rules for a block of row indexes: one tuple of values
+        per row, in rule order. The rules only read coded columns, so they are
+        evaluated once per distinct combination of input codes.
+        """
+        inputs = []
+        for rule in rules:
+            inputs.extend(column for column in rule_inputs(rule) if column not in inputs)
+        code_lists = [codes[column][0] for column in inputs]
+
+        derived_by_codes = {}
+        derived_rows = []
+        for key in zip(*(map(code_list.__getitem__, rows) for code_list in code_lists)):
+            derived = derived_by_codes.get(key)
+            if derived is None:
+                values = {column: codes[column][1][code] for column, code in zip(inputs, key)}
+                derived = derived_by_codes[key] = tuple(derive_value(rule, values) for rule in rules)
+            derived_rows.append(derived)
+        return derived_rows
+
+    @staticmethod
+    def _is_missing(value):
+        # None and NaN, the values fillna replaces
+        return value is None or value != value
+
+    @classmethod
+    def _read_columns(cls, table):
+        """
+        Reads the payload columns, treating missing columns and NaN cells as empty strings.
+        Coded columns are checked (and blanked) once per distinct value.
+
+        Returns:
+            (values by column, (codes, categories) by coded column)
+        """
+        columns = {}
+        codes = {}
+        for col in PAYLOAD_COLUMNS:
+            if col not in table.columns:
+                columns[col] = [''] * len(table)
+                codes[col] = ([0] * len(table), [''])
+                continue
+            values = table[col]
+            if col in INTERNED_COLUMNS:
+                column_codes, categories = table.categories(col)
+                if any(cls._is_missing(value) for value in categories):
+                    categories = ['' if cls._is_missing(value) else value for value in categories]
+                    values = [categories[code] for code in column_codes]
+                codes[col] = column_codes, categories
+            elif any(cls._is_missing(value) for value in values):
+                values = ['' if cls._is_missing(value) else value for value in values]
+            columns[col] = values
+        return columns, codes
+
+    @staticmethod
+    def _item_category(item_name):
+        item_category = ITEM_CATEGORIES.get(item_name)
+        if item_category is None:
+            raise ValueError(f"Incorrect Item Name '{item_name}'.Use: Commerce, Util Library, Document Designer, Email Designer, Data Table")
+        return item_category
+
+    @staticmethod
+    def _group_order(key):
+        """
+        Sort key matching a pandas groupby over mixed-type keys: per level,
+        non-strings sort before strings.
         """
-        if not isinstance(excel_data, pd.DataFrame):
-            raise TypeError("excel_data must be a pandas DataFrame.")
-        self.excel_data = excel_data.copy()  # Work on copy to avoid modifying the original DataFrame
+        return tuple((1, value) if isinstance(value, str) else (0, value) for value in key)
 
+    @traced('json_generator', lambda payload, self, *args, **kwargs: {
+        'rows': len(self.table), 'nodes': count_nodes(payload)})
     def generate(self, package_name=None):
         """
-        Generates the JSON payload from the DataFrame.
+        Generates the JSON payload from the tracker rows.
         
         Args:
             package_name (str, optional): The name of the migration package. If not provided, user will be prompted.
         """
         try:
-            print("Getting Started")
-            df = self.excel_data
-
-            # Define required columns and fill missing ones with empty strings
-            required_columns = [
-                'itemName', 'commerceVariableName', 
-                'granular', 'transactionVariableName', 
-                'childVariableName', 'childResourceType'
-            ]
-            
-                         
-            # Fill NA/NaN values with empty strings for the new columns
-            for col in required_columns:
-                if col in df.columns:
-                    df[col] = df[col].fillna('')
-                else:
-                    # If column doesn't exist, add it with empty values
-                    df[col] = ''
-            
-            # Initialize derived columns
-            df['transactionName'] = ''
-            df['transactionResourceType'] = ''
-            df['commerceName'] = ''
-            df['resourceType'] = ''
-            
-            # Apply logic for each row
-            for idx, row in df.iterrows():
-                # Rule: If childResourceType is NOT "integration" AND transactionVariableName is not NULL, set transactionResourceType to "document"
-                if row['childResourceType'] != 'integration' and row['transactionVariableName'] != '':
-                    df.at[idx, 'transactionResourceType'] = 'document'
-                
-                # Rule: Set transactionName based on transactionVariableName
-                if row['transactionVariableName'] == 'transaction':
-                    df.at[idx, 'transactionName'] = 'Transaction'
-                elif row['transactionVariableName'] == 'transactionLine':
-                    df.at[idx, 'transactionName'] = 'Transaction Line'
-                
-                # Rule: If commerceVariableName is NOT NULL, set commerceName = commerceVariableName
-                if row['commerceVariableName'] != '':
-                    df.at[idx, 'commerceName'] = row['commerceVariableName']
-                
-                # Rule: Set resourceType based on itemName
-                if row['itemName'] == 'Commerce':
-                    df.at[idx, 'resourceType'] = 'process'
-                elif row['itemName'] in ['Document Designer', 'Email Designer']:
-                    df.at[idx, 'resourceType'] = '_set'
-                elif row['itemName'] == 'Data Table':
-                    df.at[idx, 'resourceType'] = 'data_table_folder'
+            logger.info("Getting Started")
+            table = self.table
+
+            columns, codes = self._read_columns(table)
+            child_variable_names = columns['childVariableName']
+            child_resource_types = columns['childResourceType']
             
             # Get package name - ask only if not provided
             if package_name is None:
@@ -89,24 +154,18 @@ class JSONGenerator:
                 }
             }
 
-            # Process each unique item using groupby for efficiency
-            item_groups = df.groupby('itemName')
-
-            for item_name, item_rows in item_groups:
-                if item_name == 'Commerce':
-                    item_category = 'COMMERCE'
-                elif item_name == 'Util Library':
-                    item_category = 'UTIL_LIBRARY'
-                elif item_name == 'Document Designer':
-                    item_category = 'DOCUMENT_DESIGNER'
-                elif item_name == 'Email Designer':
-                    item_category = 'EMAIL_DESIGNER'
-                elif item_name == 'Data Table':
-                    item_category = 'DATA_TABLE'
-                elif item_name == 'Configuration':
-                    item_category = 'CONFIGURATION'
-                else:   
-                    raise ValueError(f"Incorrect Item Name '{item_name}'.Use: Commerce, Util Library, Document Designer, Email Designer, Data Table")
+            # Row indexes per item, in row order; items are processed sorted by name
+            item_groups = group_by_codes(*codes['itemName'])
+
+            # granular is TRUE (any case, padded) for these codes
+            granular_codes, granular_categories = codes['granular']
+            true_granular_codes = {
+                code for code, value in enumerate(granular_categories) if str(value).strip().upper() == "TRUE"
+            }
+
+            for item_name in sorted(item_groups, key=lambda name: self._group_order((name,))):
+                item_rows = item_groups[item_name]
+                item_category = self._item_category(item_name)
                 
                 item = {
                     "name": item_name,
@@ -115,18 +174,11 @@ class JSONGenerator:
                 }
 
                 # Assuming commerce details are consistent for each item group
-                commerce_name = item_rows['commerceName'].iloc[0]
-                commerce_variable_name = item_rows['commerceVariableName'].iloc[0]
-                resource_type = item_rows['resourceType'].iloc[0]
+                (commerce_variable_name, commerce_name, resource_type), = self._derive_rows(
+                    COMMERCE_NODE_RULES, codes, item_rows[:1])
                 
                 if item_name == "Util Library":
-                    for _, row in item_rows.iterrows():
-                        commerce = {
-                            "name": row['childVariableName'],
-                            "variableName": row['childVariableName'],
-                            "resourceType": row['childResourceType']
-                        }
-                        item["children"].append(commerce)
+                    item["children"].extend(self._child_nodes(item_rows, child_variable_names, child_resource_types))
                 else:
                     commerce = {
                         "name": commerce_name,
@@ -136,51 +188,36 @@ class JSONGenerator:
                     }
                     
                     is_commerce_item = (item_name.lower() == "commerce")
-                    is_granular = (item_rows['granular'].astype(str).str.strip().str.upper() == "TRUE").any()
+                    is_granular = bool(true_granular_codes) and not true_granular_codes.isdisjoint(
+                        map(granular_codes.__getitem__, item_rows))
 
                     if is_commerce_item and is_granular:
-                        print("Commerce and Granular Item Found")
+                        logger.info("Commerce and Granular Item Found")
                         commerce['granular'] = True
                         
-                        # Group children by transaction details
-                        transaction_groups = item_rows.groupby(['transactionName', 'transactionVariableName', 'transactionResourceType'])
+                        # Group children by transaction details, sorted like a groupby
+                        transaction_groups = {}
+                        transaction_rows = self._derive_rows(TRANSACTION_NODE_RULES, codes, item_rows)
+                        for index, transaction_details in zip(item_rows, transaction_rows):
+                            transaction_groups.setdefault(transaction_details, []).append(index)
                         
-                        for transaction_details, transaction_rows in transaction_groups:
+                        for transaction_details in sorted(transaction_groups, key=self._group_order):
                             transaction_name, transaction_variable_name, transaction_resource_type = transaction_details
+                            transaction_rows = transaction_groups[transaction_details]
                             
                             if transaction_name and transaction_variable_name and transaction_resource_type:
                                 transaction_obj = {
                                     "name": transaction_name,
                                     "variableName": transaction_variable_name,
                                     "resourceType": transaction_resource_type,
-                                    "children": []
+                                    "children": self._child_nodes(transaction_rows, child_variable_names, child_resource_types)
                                 }
-                                
-                                for _, row in transaction_rows.iterrows():
-                                    child = {
-                                        "name": row['childVariableName'],
-                                        "variableName": row['childVariableName'],
-                                        "resourceType": row['childResourceType']
-                                    }
-                                    transaction_obj['children'].append(child)
                                     
                                 commerce['children'].append(transaction_obj)
                             else:
-                                for _, row in transaction_rows.iterrows():
-                                    child = {
-                                        "name": row['childVariableName'],
-                                        "variableName": row['childVariableName'],
-                                        "resourceType": row['childResourceType']
-                                    }
-                                    commerce['children'].append(child)
+                                commerce['children'].extend(self._child_nodes(transaction_rows, child_variable_names, child_resource_types))
                     else:
-                        for _, row in item_rows.iterrows():
-                            child = {
-                                "name": row['childVariableName'],
-                                "variableName": row['childVariableName'],
-                                "resourceType": row['childResourceType']
-                            }
-                            commerce['children'].append(child)
+                        commerce['children'].extend(self._child_nodes(item_rows, child_variable_names, child_resource_types))
 
                     item["children"].append(commerce)
                 json_payload["contents"]["items"].append(item)
@@ -193,6 +230,8 @@ class JSONGenerator:
 
 # Example Usage:
 if __name__ == "__main__":
+    import pandas as pd
+
     # Create a sample DataFrame to test the class
     data = {
         #'PackageName': ['Auto28AugTest','Auto28AugTest'],
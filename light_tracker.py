@@ -0,0 +1,128 @@
+"""
+Pure-Python reader for CSV, JSON and JSON Lines trackers.
+
+Trackers are read straight into a TrackerTable, so converting a small tracker
+never pays for importing pandas and numpy. Cells are typed and defaulted the
+way ExcelParser's pandas readers leave them.
+"""
+import csv
+import json
+import os
+import re
+
+from instrumentation import traced
+from tracker_schema import CORE_REQUIRED_COLUMNS, OPTIONAL_COLUMNS, PAYLOAD_COLUMNS
+from tracker_table import TrackerTable
+
+LIGHT_EXTENSIONS = ('.csv', '.json', '.jsonl')
+
+# Cells pandas' CSV reader treats as missing by default
+NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+])
+TRUE_VALUES = frozenset(['True', 'TRUE', 'true'])
+FALSE_VALUES = frozenset(['False', 'FALSE', 'false'])
+
+_INT_PATTERN = re.compile(r'[+-]?\d+')
+_FLOAT_PATTERN = re.compile(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?')
+
+
+def is_light_input(path):
+    return os.path.splitext(str(path))[1].lower() in LIGHT_EXTENSIONS
+
+
+@traced('parse', lambda table, path: {'rows': len(table)})
+def read_tracker(path):
+    """
+    Read a CSV file, a JSON array of row objects or a JSON Lines file into a
+    TrackerTable holding the PAYLOAD_COLUMNS present in the file.
+
+    Like ExcelParser, missing optional columns are added empty and optional cells
+    default to ''; empty required cells are NaN, as pandas leaves them.
+    """
+    try:
+        extension = os.path.splitext(str(path))[1].lower()
+        if extension in ('.json', '.jsonl'):
+            header, rows = _read_json_rows(path, lines=extension == '.jsonl')
+            convert = _json_column
+        else:
+            header, rows = _read_csv_rows(path)
+            convert = _type_column
+
+        positions = {}
+        for index, name in enumerate(header):
+            if name not in positions:
+                positions[name] = index
+        for col in CORE_REQUIRED_COLUMNS:
+            if col not in positions:
+                raise ValueError(f"Required column '{col}' not found in tracker file.")
+
+        columns = {}
+        for col in PAYLOAD_COLUMNS:
+            missing = '' if col in OPTIONAL_COLUMNS else float('nan')
+            if col not in positions:
+                columns[col] = [''] * len(rows)
+                continue
+            index = positions[col]
+            values = [row[index] if index < len(row) else None for row in rows]
+            columns[col] = convert(values, missing)
+        return TrackerTable.from_columns(columns)
+
+    except Exception as e:
+        raise Exception(f"Failed to parse tracker file: {str(e)}")
+
+
+def _read_csv_rows(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        # Blank lines are skipped, as pandas does
+        return header, [row for row in reader if row]
+
+
+def _read_json_rows(path, lines=False):
+    with open(path, encoding='utf-8') as f:
+        if lines:
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = json.load(f)
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        raise ValueError("JSON trackers must be an array of row objects (or one object per line).")
+
+    header = list(dict.fromkeys(key for record in records for key in record))
+    return header, [[record.get(key) for key in header] for record in records]
+
+
+def _type_column(values, missing):
+    """
+    Type a column of CSV cells the way pandas infers it: all-boolean, integer
+    (float when cells are missing) or float columns are converted, anything else
+    stays text. Missing cells become `missing`.
+    """
+    present = [value for value in values if value is not None and value not in NA_VALUES]
+    convert = None
+    if present:
+        if all(value in TRUE_VALUES or value in FALSE_VALUES for value in present):
+            convert = TRUE_VALUES.__contains__
+        elif all(_INT_PATTERN.fullmatch(value) for value in present):
+            convert = int if len(present) == len(values) else float
+        elif all(_FLOAT_PATTERN.fullmatch(value) for value in present):
+            convert = float
+
+    return [
+        missing if value is None or value in NA_VALUES else (convert(value) if convert else value)
+        for value in values
+    ]
+
+
+def _json_column(values, missing):
+    """
+    Like pandas' JSON reader: nulls and absent keys are missing, and a numeric
+    column with floats or missing values becomes float.
+    """
+    present = [value for value in values if value is not None]
+    if present and all(type(value) in (int, float) for value in present) and (
+            len(present) < len(values) or any(type(value) is float for value in present)):
+        values = [None if value is None else float(value) for value in values]
+    return [missing if value is None else value for value in values]
@@ -1,44 +1,117 @@
 import argparse
 import json
+import logging
+import os
 import sys
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+import instrumentation
 warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
-from excel_parser import ExcelParser
-from json_generator import JSONGenerator
-from configuration_generator import ConfigurationGenerator
-from api_client import APIClient
+# pandas, openpyxl and requests are imported by the stages that need them
+# (payload_builder, api_client), not at startup
+from payload_writer import format_summary, save_payload, summarize_payload
+from payload_builder import (
+    FLOW_CONFIGURATION, FLOW_STANDARD, FLOW_MIXED,
+    detect_flow, load_tracker, split_mixed, generate_standard_payload, generate_configuration_payload
+)
 
-def main():
+def read_instances(text):
+    """
+    Split a comma-separated list of CPQ instance names.
+    """
+    instances = [instance.strip() for instance in text.split(',') if instance.strip()]
+    if not instances:
+        raise ValueError("No CPQ instance name given.")
+    return instances
+
+def read_sheet_names(text):
+    """
+    Split a comma-separated list of sheet names.
+    """
+    names = [name.strip() for name in text.split(',') if name.strip()]
+    if not names:
+        raise ValueError("No sheet name given.")
+    return names
+
+def submit_to_instances(cpq_instances, username, password, package_name, payload, config_payload=None,
+                        incremental=False, compression=None):
+    """
+    Submit the package to every instance concurrently and print one combined report.
+    With incremental, each instance only gets what changed since its last successful submission.
+    """
+    from submission import fan_out, print_fanout_report
+    from payload_delta import SnapshotStore
+    
+    print(f"\nSubmitting to {len(cpq_instances)} instance(s)...")
+    results = fan_out(cpq_instances, username, password, package_name, payload, config_payload,
+                      snapshots=SnapshotStore() if incremental else None, compression=compression)
+    print()
+    print_fanout_report(results)
+
+def config_output_path(output):
+    """
+    Where the Configuration payload of a mixed tracker goes: next to the main
+    payload (tracker.json -> tracker.config.json), or also stdout for '-'.
+    """
+    if output == '-':
+        return output
+    root, ext = os.path.splitext(output)
+    return f"{root}.config{ext or '.json'}"
+
+def describe_request_body(request):
+    if request['compression'] is None:
+        return f"{request['bytes']:,} bytes of JSON (uncompressed)"
+    return (f"{request['bytes']:,} bytes sent, {request['compression']} of {request['payloadBytes']:,} bytes "
+            f"of JSON ({request['ratio']:.1f}x)")
+
+def show_payload(payload, title, show_full_payload=False, output=None):
+    """
+    Print a summary of the payload (or the full JSON) and optionally stream it to output.
+    """
+    print(f"\n{title}:")
+    if show_full_payload:
+        print(json.dumps(payload, indent=4))
+    else:
+        print(format_summary(summarize_payload(payload)))
+    
+    if output:
+        written = save_payload(payload, output)
+        if output != '-':
+            print(f"Payload written to {output} ({written} bytes)")
+
+def main(show_full_payload=False, output=None, incremental=False, jobs=1, compression=None):
+    # The generators log their progress; the interactive session shows it
+    logging.basicConfig(format='%(message)s', stream=sys.stdout)
+    logging.getLogger('json_generator').setLevel(logging.INFO)
+    
     print("Excel to API Tool")
     print("=================\n")
     
     # Get the Excel file path
-    excel_file = input("Enter the path to the Excel file: ")
+    excel_file = input("Enter the path to the Excel file (or a CSV/JSON tracker): ")
     
     try:
-        # Parse Excel file
+        # Parse Excel file (CSV and JSON trackers are read without pandas)
         print(f"Reading Excel file: {excel_file}")
-        parser = ExcelParser(excel_file)
-        excel_data = parser.parse()
+        excel_data = load_tracker(excel_file)
         
         # Check if we have Configuration items
-        has_configuration = (excel_data['itemName'] == 'Configuration').any()
-        has_other_items = (excel_data['itemName'] != 'Configuration').any()
+        flow = detect_flow(excel_data)
         
         # Generate JSON payload
         print("Generating JSON payload...")
         
-        if has_configuration and not has_other_items:
+        if flow == FLOW_CONFIGURATION:
             # Only Configuration items - use ConfigurationGenerator
             print("Detected Configuration items only...")
             package_name = input("Enter the Package Name: ")
-            generator = ConfigurationGenerator(excel_data)
-            payload = generator.generate(package_name)
-        elif not has_configuration and has_other_items:
+            payload = generate_configuration_payload(excel_data, package_name, jobs)
+        elif flow == FLOW_STANDARD:
             # Only non-Configuration items - use existing JSONGenerator
             print("Detected standard items...")
-            generator = JSONGenerator(excel_data)
-            payload = generator.generate()
+            package_name = input("Enter the Package Name: ")
+            payload = generate_standard_payload(excel_data, package_name, jobs)
         else:
             # Mixed items - handle with two-step API call
             print("Detected both Configuration and standard items...")
@@ -48,18 +121,22 @@ def main():
             payload = None
         
         # Handle mixed items scenario
-        if has_configuration and has_other_items:
+        if flow == FLOW_MIXED:
             # Get package name first for mixed items
             package_name = input("\nEnter the Package Name: ")
+            non_config_data, config_data = split_mixed(excel_data)
+            
+            # The Configuration payload is generated in the background while the
+            # standard payload is shown, confirmed and created
+            background = ThreadPoolExecutor(max_workers=1)
+            config_future = background.submit(generate_configuration_payload, config_data, package_name, jobs)
+            background.shutdown(wait=False)
             
             # Step 1: Generate payload for non-Configuration items
             print("\n[Step 1/2] Generating payload for standard items...")
-            non_config_data = excel_data[excel_data['itemName'] != 'Configuration']
-            standard_generator = JSONGenerator(non_config_data)
-            standard_payload = standard_generator.generate(package_name)
+            standard_payload = generate_standard_payload(non_config_data, package_name, jobs)
             
-            print("\nStandard Items Payload:")
-            print(json.dumps(standard_payload, indent=4))
+            show_payload(standard_payload, "Standard Items Payload", show_full_payload, output)
             
             # Confirm with user
             confirm = input("\nDo you want to submit to the API? (yes/no): ")
@@ -68,67 +145,81 @@ def main():
                 return
             
             # Get API details
-            cpq_instance = input("\nEnter the CPQ instance name: ")
-            api_endpoint = f"{cpq_instance}/rest/v14/migrationPackages"
+            cpq_instances = read_instances(input("\nEnter the CPQ instance name (separate several with commas): "))
             username = input("Enter username for Basic Auth: ")
             password = input("Enter password for Basic Auth: ")
             
-            # Make first API call (POST)
-            print("\n[Step 1/2] Creating migration package with standard items...")
-            api_client = APIClient(api_endpoint, username, password)
-            response = api_client.post_data(standard_payload)
-            
-            # Display response
-            print("\nAPI Response (CREATE):")
-            print(f"Status Code: {response.status_code}")
-            print("Response Body:")
-            try:
-                print(json.dumps(response.json(), indent=4))
-            except:
-                print(response.text)
-            
-            if response.status_code not in [200, 201]:
-                print("\nMigration Package creation failed. Cannot proceed with Configuration items.")
-                return
-            
-            print("\nMigration Package Created Successfully!")
-            
-            # Step 2: Generate payload for Configuration items
-            print("\n[Step 2/2] Generating payload for Configuration items...")
-            config_data = excel_data[excel_data['itemName'] == 'Configuration']
-            config_generator = ConfigurationGenerator(config_data)
-            config_payload = config_generator.generate(package_name)
-            
-            print("\nConfiguration Items Payload:")
-            print(json.dumps(config_payload, indent=4))
-            
-            # Generate identifier for PATCH
-            identifier = package_name.lower() + "_v1"
-            
-            # Make second API call (PATCH)
-            print(f"\n[Step 2/2] Updating migration package with Configuration items (identifier: {identifier})...")
-            patch_response = api_client.patch_data(identifier, config_payload)
-            
-            # Display response
-            print("\nAPI Response (UPDATE):")
-            print(f"Status Code: {patch_response.status_code}")
-            print("Response Body:")
-            try:
-                print(json.dumps(patch_response.json(), indent=4))
-            except:
-                print(patch_response.text)
-            
-            # Show final success message
-            if patch_response.status_code in [200, 201]:
-                print("\nMigration Package Updated with Configuration Items Successfully!")
+            if len(cpq_instances) > 1 or incremental:
+                # Both payloads are needed up front to fan out or diff
+                print("\n[Step 2/2] Generating payload for Configuration items...")
+                config_payload = config_future.result()
+                show_payload(config_payload, "Configuration Items Payload", show_full_payload,
+                             output and config_output_path(output))
+                submit_to_instances(cpq_instances, username, password, package_name, standard_payload, config_payload,
+                                    incremental, compression)
             else:
-                print("\nConfiguration items update failed.")
+                from api_client import APIClient, migration_packages_endpoint, package_identifier
+                api_endpoint = migration_packages_endpoint(cpq_instances[0])
+                
+                # Make first API call (POST)
+                print("\n[Step 1/2] Creating migration package with standard items...")
+                with APIClient(api_endpoint, username, password, compression=compression) as api_client:
+                    started = time.perf_counter()
+                    response = api_client.post_data(standard_payload)
+                    
+                    # Display response
+                    print("\nAPI Response (CREATE):")
+                    print(f"Status Code: {response.status_code}")
+                    print(f"Request Time: {api_client.last_request['elapsed']:.2f}s (retries: {api_client.last_request['retries']})")
+                    print(f"Request Body: {describe_request_body(api_client.last_request)}")
+                    print("Response Body:")
+                    try:
+                        print(json.dumps(response.json(), indent=4))
+                    except:
+                        print(response.text)
+                    
+                    if response.status_code not in [200, 201]:
+                        print("\nMigration Package creation failed. Cannot proceed with Configuration items.")
+                        return
+                    
+                    print("\nMigration Package Created Successfully!")
+                    
+                    # Step 2: Payload for Configuration items (usually ready by now)
+                    print("\n[Step 2/2] Generating payload for Configuration items...")
+                    config_payload = config_future.result()
+                    
+                    show_payload(config_payload, "Configuration Items Payload", show_full_payload,
+                                 output and config_output_path(output))
+                    
+                    # Generate identifier for PATCH
+                    identifier = package_identifier(package_name)
+                    
+                    # Make second API call (PATCH)
+                    print(f"\n[Step 2/2] Updating migration package with Configuration items (identifier: {identifier})...")
+                    patch_response = api_client.patch_data(identifier, config_payload)
+                    
+                    # Display response
+                    print("\nAPI Response (UPDATE):")
+                    print(f"Status Code: {patch_response.status_code}")
+                    print(f"Request Time: {api_client.last_request['elapsed']:.2f}s (retries: {api_client.last_request['retries']})")
+                    print(f"Request Body: {describe_request_body(api_client.last_request)}")
+                    print("Response Body:")
+                    try:
+                        print(json.dumps(patch_response.json(), indent=4))
+                    except:
+                        print(patch_response.text)
+                    print(f"\nEnd-to-end Time (create + update): {time.perf_counter() - started:.2f}s")
+                    
+                    # Show final success message
+                    if patch_response.status_code in [200, 201]:
+                        print("\nMigration Package Updated with Configuration Items Successfully!")
+                    else:
+                        print("\nConfiguration items update failed.")
         
         else:
             # Single item type - existing flow
             # Display the generated JSON for verification
-            print("\nGenerated JSON Payload:")
-            print(json.dumps(payload, indent=4))
+            show_payload(payload, "Generated JSON Payload", show_full_payload, output)
             
             # Confirm with user
             confirm = input("\nDo you want to submit this payload to the API? (yes/no): ")
@@ -137,30 +228,38 @@ def main():
                 return
             
             # Get API details
-            cpq_instance = input("\nEnter the CPQ instance name: ")
-            api_endpoint = f"{cpq_instance}/rest/v14/migrationPackages"
+            cpq_instances = read_instances(input("\nEnter the CPQ instance name (separate several with commas): "))
             username = input("Enter username for Basic Auth: ")
             password = input("Enter password for Basic Auth: ")
             
-            # Make API call
-            print("\nSending API request...")
-            api_client = APIClient(api_endpoint, username, password)
-            response = api_client.post_data(payload)
-            
-            # Display response
-            print("\nAPI Response:")
-            print(f"Status Code: {response.status_code}")
-            print("Response Body:")
-            try:
-                print(json.dumps(response.json(), indent=4))
-            except:
-                print(response.text)
-                
-            # Show success message if API call was successful
-            if response.status_code in [200, 201]:
-                print("\nMigration Package Created Successfully!")
+            if len(cpq_instances) > 1 or incremental:
+                submit_to_instances(cpq_instances, username, password, package_name, payload,
+                                    incremental=incremental, compression=compression)
             else:
-                print("\nMigration Package creation failed.")
+                from api_client import APIClient, migration_packages_endpoint, package_identifier
+                api_endpoint = migration_packages_endpoint(cpq_instances[0])
+                
+                # Make API call
+                print("\nSending API request...")
+                with APIClient(api_endpoint, username, password, compression=compression) as api_client:
+                    response = api_client.post_data(payload)
+                    
+                    # Display response
+                    print("\nAPI Response:")
+                    print(f"Status Code: {response.status_code}")
+                    print(f"Request Time: {api_client.last_request['elapsed']:.2f}s (retries: {api_client.last_request['retries']})")
+                    print(f"Request Body: {describe_request_body(api_client.last_request)}")
+                    print("Response Body:")
+                    try:
+                        print(json.dumps(response.json(), indent=4))
+                    except:
+                        print(response.text)
+                    
+                    # Show success message if API call was successful
+                    if response.status_code in [200, 201]:
+                        print("\nMigration Package Created Successfully!")
+                    else:
+                        print("\nMigration Package creation failed.")
         
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -168,5 +267,194 @@ def main():
     
     input("\nPress Enter to exit...") #Prevents the console from closing immediately
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert tracker workbooks to migration package payloads. "
+                    "Runs interactively unless --batch is given."
+    )
+    parser.add_argument('--batch', metavar='DIR_OR_GLOB',
+                        help="Generate payloads for every workbook in a directory or matching a glob, without prompts")
+    parser.add_argument('--manifest',
+                        help="JSON or CSV file mapping workbook file names to package names (required with --batch "
+                             "unless --sheets is given)")
+    parser.add_argument('--sheets', metavar='all|NAME,...',
+                        help="With --batch, turn every sheet ('all') or the named sheets of each workbook into "
+                             "its own payload; a sheet's package name is its manifest entry "
+                             "('<workbook>:<sheet>' or '<sheet>') or else the sheet name")
+    parser.add_argument('--output-dir', default='payloads',
+                        help="Directory for generated payloads and summary.json (default: payloads)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes for --batch (default: CPU count)")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="Processes generating one tracker's payloads, one item group or Configuration product "
+                             "family per task (default: 1); trackers under 20,000 rows are always generated in-process")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Do not read or write the parse cache (--batch and --serve)")
+    parser.add_argument('--out-of-core', action='store_true',
+                        help="With --batch, read each tracker in row batches and spill them to disk by item group "
+                             "and Configuration product family instead of loading it whole, for trackers larger "
+                             "than memory")
+    parser.add_argument('--spill-dir', metavar='DIR',
+                        help="Directory for --out-of-core spill files (default: the system temporary directory)")
+    parser.add_argument('--submit', metavar='INSTANCE',
+                        help="With --batch, also submit every generated package to this CPQ instance as soon as "
+                             "its payloads are written (credentials from CPQ_USERNAME/CPQ_PASSWORD or prompted)")
+    parser.add_argument('--max-in-flight', type=int, default=4,
+                        help="Packages submitted concurrently with --submit or --resume (default: 4)")
+    parser.add_argument('--journal', metavar='FILE',
+                        help="Submission journal written by --submit and read by --resume "
+                             "(default: ~/.cache/excel_to_api/submissions.jsonl)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Resume interrupted --submit pushes from the journal: only the create and update calls "
+                             "that did not finish are sent, reloading the payload files they were queued with")
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help="Run as a long-lived local service that keeps the parser, generators and caches warm "
+                             "(POST /payloads, GET /metrics); binds 127.0.0.1 unless HOST is given")
+    parser.add_argument('--max-concurrent', type=int, default=4,
+                        help="Trackers generated at once with --serve (default: 4)")
+    parser.add_argument('--watch', metavar='TRACKER',
+                        help="Keep --output up to date while TRACKER is edited: on every save only the item "
+                             "groups and Configuration families whose rows changed are regenerated")
+    parser.add_argument('--package-name', help="Package name for --watch")
+    parser.add_argument('--output', metavar='FILE',
+                        help="Stream the generated payload as compact JSON to FILE ('-' for stdout); "
+                             "a mixed tracker's Configuration payload goes to FILE.config.json")
+    parser.add_argument('--show-payload', action='store_true',
+                        help="Print the full indented payload instead of a summary")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only send what changed since the last successful submission of the package "
+                             "to the same instance; unchanged packages are skipped")
+    parser.add_argument('--compress', action='store_true',
+                        help="Send request bodies gzip-compressed, for instances known to accept them; an "
+                             "instance that rejects the first compressed request gets plain JSON from then on")
+    parser.add_argument('--profile', nargs='?', const='', metavar='TRACE_FILE',
+                        help="Print per-stage timings and memory at exit; with TRACE_FILE, also write "
+                             "every span as a JSON trace")
+    args = parser.parse_args(argv)
+
+    if args.batch and not args.manifest and not args.sheets:
+        parser.error("--manifest is required with --batch")
+    if args.sheets and not args.batch:
+        parser.error("--sheets requires --batch")
+    if args.submit and not args.batch:
+        parser.error("--submit requires --batch")
+    if (args.out_of_core or args.spill_dir) and not args.batch:
+        parser.error("--out-of-core requires --batch")
+    if args.serve and args.batch:
+        parser.error("--serve and --batch cannot be combined")
+    if (args.batch or args.serve) and (args.incremental or args.show_payload or args.output):
+        parser.error("--incremental, --show-payload and --output cannot be combined with --batch or --serve")
+    if args.watch and (args.batch or args.serve):
+        parser.error("--watch cannot be combined with --batch or --serve")
+    if args.resume and (args.batch or args.serve or args.watch):
+        parser.error("--resume cannot be combined with --batch, --serve or --watch")
+    if args.journal and not (args.submit or args.resume):
+        parser.error("--journal requires --submit or --resume")
+    if args.compress and (args.serve or args.watch or (args.batch and not args.submit)):
+        parser.error("--compress only applies to submissions")
+    if args.watch and not (args.package_name and args.output and args.output != '-'):
+        parser.error("--watch requires --package-name and an --output file")
+    return args
+
+def run_batch_mode(args):
+    from batch_runner import run_batch, print_summary
+    
+    try:
+        sheets = None
+        if args.sheets:
+            sheets = 'all' if args.sheets == 'all' else read_sheet_names(args.sheets)
+        if args.submit:
+            from api_client import migration_packages_endpoint
+            from submission import SubmissionScheduler
+            username = os.environ.get('CPQ_USERNAME') or input("Enter username for Basic Auth: ")
+            password = os.environ.get('CPQ_PASSWORD') or input("Enter password for Basic Auth: ")
+            with SubmissionScheduler(migration_packages_endpoint(args.submit), username, password,
+                                     max_in_flight=args.max_in_flight,
+                                     journal=open_journal(args.journal),
+                                     compression=request_compression(args)) as submitter:
+                results = run_batch(args.batch, args.manifest, args.output_dir, workers=args.workers,
+                                    use_cache=not args.no_cache, sheets=sheets, submitter=submitter,
+                                    out_of_core=args.out_of_core, spill_dir=args.spill_dir)
+        else:
+            results = run_batch(args.batch, args.manifest, args.output_dir,
+                                workers=args.workers, use_cache=not args.no_cache, sheets=sheets,
+                                out_of_core=args.out_of_core, spill_dir=args.spill_dir)
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    
+    print_summary(results)
+    print(f"Summary written to {args.output_dir}/summary.json")
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
+
+def request_compression(args):
+    return 'gzip' if args.compress else None
+
+def open_journal(path):
+    from submission_journal import DEFAULT_JOURNAL_PATH, SubmissionJournal
+    
+    return SubmissionJournal(path or DEFAULT_JOURNAL_PATH)
+
+def run_resume_mode(args):
+    from submission import print_resume_report, resume_submissions
+    
+    journal = open_journal(args.journal)
+    try:
+        if not journal.pending():
+            results = []
+        else:
+            username = os.environ.get('CPQ_USERNAME') or input("Enter username for Basic Auth: ")
+            password = os.environ.get('CPQ_PASSWORD') or input("Enter password for Basic Auth: ")
+            results = resume_submissions(journal, username, password, max_in_flight=args.max_in_flight,
+                                         compression=request_compression(args))
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+    
+    print_resume_report(results)
+    if any(result['status'] != 'ok' for result in results):
+        sys.exit(1)
+
+def run_serve_mode(args):
+    from payload_server import DEFAULT_HOST, serve
+    
+    host, _, port = args.serve.rpartition(':')
+    try:
+        serve(host or DEFAULT_HOST, int(port), use_cache=not args.no_cache, max_concurrent=args.max_concurrent,
+              jobs=args.jobs)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
+
+def run_watch_mode(args):
+    from tracker_watch import watch
+    
+    watch(args.watch, args.package_name, args.output, config_output_path(args.output))
+
+def report_profile(trace_file):
+    print("\nProfile:")
+    print(instrumentation.format_summary())
+    if trace_file:
+        instrumentation.write_trace(trace_file)
+        print(f"Trace written to {trace_file}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.profile is not None:
+        instrumentation.enable()
+    try:
+        if args.batch:
+            run_batch_mode(args)
+        elif args.resume:
+            run_resume_mode(args)
+        elif args.serve:
+            run_serve_mode(args)
+        elif args.watch:
+            run_watch_mode(args)
+        else:
+            main(show_full_payload=args.show_payload, output=args.output, incremental=args.incremental,
+                 jobs=args.jobs, compression=request_compression(args))
+    finally:
+        if args.profile is not None:
+            report_profile(args.profile)
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""
+Out-of-core payload generation for trackers larger than memory.
+
+The tracker is read in row batches and every row is spilled to a local file
+under the payload group it belongs to: its item or its Configuration product
+family. The groups are then read back one at a time, generated by JSONGenerator
+(one item group) or ConfigurationGenerator (one product family) and streamed to
+the payload files, so memory holds one batch and one group instead of the whole
+tracker. The files are identical to the ones write_payloads writes for the same
+tracker.
+"""
+import os
+import pickle
+import tempfile
+
+from configuration_generator import write_configuration, ConfigurationGenerator
+from instrumentation import traced
+from json_generator import JSONGenerator
+from payload_builder import (
+    FLOW_CONFIGURATION, FLOW_MIXED, FLOW_STANDARD, generate_item, is_light_tracker, load_tracker,
+    standard_item_order
+)
+from payload_writer import encode
+from tracker_schema import PAYLOAD_COLUMNS
+from tracker_table import TrackerTable, as_table
+
+# Rows read per batch
+DEFAULT_BATCH_SIZE = 10000
+
+# Rows buffered in memory before they are appended to the spill file
+DEFAULT_SPILL_ROWS = 100000
+
+
+class PartitionSpill:
+    """
+    Rows appended under a partition key and spilled to one temporary file.
+
+    Once max_buffered_rows are buffered, every partition's buffered rows are
+    appended to the file as one pickled block. A partition is read back block by
+    block, in the order its rows were appended. The file is deleted on close.
+    """
+    def __init__(self, spill_dir=None, max_buffered_rows=DEFAULT_SPILL_ROWS):
+        self._file = tempfile.TemporaryFile(prefix='tracker-spill-', dir=spill_dir)
+        self._max_buffered_rows = max_buffered_rows
+        self._buffers = {}
+        self._buffered = 0
+        # partition key -> [(offset, size)] of its blocks in the file
+        self._blocks = {}
+
+    def append(self, key, row):
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = []
+        buffer.append(row)
+        self._buffered += 1
+        if self._buffered >= self._max_buffered_rows:
+            self.flush()
+
+    def flush(self):
+        f = self._file
+        f.seek(0, os.SEEK_END)
+        for key, rows in self._buffers.items():
+            block = pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)
+            self._blocks.setdefault(key, []).append((f.tell(), len(block)))
+            f.write(block)
+        self._buffers = {}
+        self._buffered = 0
+
+    def rows(self, key):
+        """
+        Yield a partition's rows in the order they were appended.
+        """
+        for offset, size in self._blocks.get(key, ()):
+            self._file.seek(offset)
+            yield from pickle.loads(self._file.read(size))
+        yield from self._buffers.get(key, ())
+
+    @property
+    def spilled_bytes(self):
+        return sum(size for blocks in self._blocks.values() for _, size in blocks)
+
+    def close(self):
+        self._file.close()
+
+
+class SpilledTracker:
+    """
+    A tracker read batch by batch into a PartitionSpill, keyed by payload group.
+
+    Standard rows are spilled per item name and Configuration rows per product
+    family; only the group keys (with each item's first row) are kept in memory.
+    Rows are typed as a read of the whole tracker types them when their group is
+    generated: workbook rows (add_rows) through a ColumnTyper, typed batches (add)
+    by converting the columns pandas would have combined into floats.
+    """
+    def __init__(self, spill_dir=None, max_buffered_rows=DEFAULT_SPILL_ROWS, typer=None):
+        """
+        typer: the ColumnTyper for workbook rows added with add_rows.
+        """
+        self.rows = 0
+        self._spill = PartitionSpill(spill_dir, max_buffered_rows)
+        self._typer = typer
+        # item name -> its first row, and product family -> None, in order of first appearance
+        self._items = {}
+        self._families = {}
+        self._configuration_rows = 0
+        self._kinds = {col: set() for col in PAYLOAD_COLUMNS}
+
+    def add(self, batch, kinds=None):
+        """
+        Spill a typed batch of rows (TrackerTable or DataFrame). kinds are the
+        batch's column dtype kinds, as ExcelParser.iter_chunks yields them.
+        """
+        if kinds is not None:
+            for col, kind in kinds.items():
+                self._kinds[col].add(kind)
+
+        table = as_table(batch)
+        columns = [
+            table[col] if col in table.columns else [''] * len(table)
+            for col in PAYLOAD_COLUMNS
+        ]
+        self._add(zip(*columns))
+        self.rows += len(table)
+
+    def add_rows(self, rows):
+        """
+        Spill a batch of workbook rows as ExcelParser.iter_rows yields them.
+        """
+        self._typer.add(rows)
+        self._add(map(tuple, rows))
+        self.rows += len(rows)
+
+    def _add(self, rows):
+        append = self._spill.append
+        items = self._items
+        families = self._families
+        for row in rows:
+            item_name, commerce_var = row[0], row[1]
+            if item_name == 'Configuration':
+                family = str(commerce_var).split('.')[0]
+                families.setdefault(family, None)
+                append(family, row)
+                self._configuration_rows += 1
+                continue
+
+            # JSONGenerator groups missing item names (None, NaN) together, as ''
+            item_name = _blank(item_name)
+            if item_name not in items:
+                items[item_name] = row
+            append((item_name,), row)
+
+    @property
+    def flow(self):
+        has_other_items = self.rows > self._configuration_rows
+        if not self._configuration_rows and not has_other_items:
+            raise ValueError("No items found in Excel file.")
+        if not has_other_items:
+            return FLOW_CONFIGURATION
+        if not self._configuration_rows:
+            return FLOW_STANDARD
+        return FLOW_MIXED
+
+    @property
+    def spilled_bytes(self):
+        return self._spill.spilled_bytes
+
+    def write(self, package_name, path, config_path):
+        """
+        Write the payloads like write_payloads: payload to path and, for the mixed
+        flow, the Configuration payload to config_path.
+
+        Returns:
+            (flow, paths written)
+        """
+        flow = self.flow
+        if flow == FLOW_CONFIGURATION:
+            with open(path, 'wb') as f:
+                write_configuration(self._configuration_rows_by_path(), package_name, f)
+            return flow, [path]
+
+        item_names = self._validate_items()
+        with open(path, 'wb') as f:
+            self._write_standard(f, package_name, item_names)
+        if flow == FLOW_STANDARD:
+            return flow, [path]
+
+        with open(config_path, 'wb') as f:
+            write_configuration(self._configuration_rows_by_path(), package_name, f)
+        return flow, [path, config_path]
+
+    def close(self):
+        self._spill.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _table(self, rows):
+        """
+        A group's spilled rows as a TrackerTable, typed as in a read of the whole tracker.
+        """
+        if self._typer is not None:
+            return as_table(self._typer.build([list(row) for row in rows]))
+
+        # pandas turns a column read as int in some batches and float in others into floats
+        columns = {}
+        for col, values in zip(PAYLOAD_COLUMNS, zip(*rows)):
+            if self._kinds[col] == {'i', 'f'}:
+                values = [float(value) if type(value) is int else value for value in values]
+            columns[col] = list(values)
+        return TrackerTable.from_columns(columns)
+
+    def _validate_items(self):
+        """
+        The standard item names in output order; fails before anything is written
+        on the first unknown item, with JSONGenerator's error.
+        """
+        item_names = standard_item_order(self._items)
+        for item_name in item_names:
+            try:
+                JSONGenerator._item_category(_blank(self._table([self._items[item_name]])['itemName'][0]))
+            except Exception as e:
+                raise RuntimeError(f"Failed to generate JSON payload: {e}")
+        return item_names
+
+    def _write_standard(self, f, package_name, item_names):
+        """
+        Write the JSONGenerator payload, generating one item group at a time.
+        """
+        f.write(b'{"name":' + encode(package_name) + b',"contents":{"items":[')
+        for index, item_name in enumerate(item_names):
+            table = self._table(list(self._spill.rows((item_name,))))
+            f.write((b',' if index else b'') + encode(generate_item(table, package_name)))
+        f.write(b']}}\n')
+
+    def _configuration_rows_by_path(self):
+        """
+        Configuration rows in ConfigurationGenerator.iter_path_rows order, loading
+        one product family at a time.
+        """
+        typed_families = set()
+        for family in self._families:
+            table = self._table(list(self._spill.rows(family)))
+            # Rows were spilled under the family of their cells as read; typing may rename
+            # a family (a blank cell is read as NaN), but must not split or merge families
+            names = {str(value).split('.')[0] for value in table.categories('commerceVariableName')[1]}
+            if len(names) != 1 or names & typed_families:
+                raise ValueError(f"Product family '{family}' changes once the whole tracker is typed; "
+                                 f"read this tracker in memory instead.")
+            typed_families |= names
+            yield from ConfigurationGenerator(table).iter_path_rows()
+
+
+def _blank(value):
+    # JSONGenerator treats None and NaN as empty strings
+    return '' if value is None or value != value else value
+
+
+def read_tracker_batches(path, sheet=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield (batch, dtype kinds) for a tracker file. Small
+    CSV/JSON/JSONL trackers, which load_tracker reads in pure Python, are read as
+    one batch.
+    """
+    if is_light_tracker(path, sheet):
+        yield load_tracker(path, use_cache=False), None
+        return
+
+    from excel_parser import ExcelParser
+    yield from ExcelParser(path, sheet=sheet).iter_chunks(batch_size)
+
+
+@traced('out_of_core', lambda written, path, *args, **kwargs: {'rows': written[2]})
+def write_payloads_out_of_core(path, package_name, output, config_output, sheet=None,
+                               batch_size=DEFAULT_BATCH_SIZE, spill_dir=None,
+                               max_buffered_rows=DEFAULT_SPILL_ROWS):
+    """
+    write_payloads for a tracker file that does not fit in memory: the file is
+    read in batches of batch_size rows and spilled to spill_dir (the system
+    temporary directory by default) by payload group, then the groups are
+    generated one at a time.
+
+    Workbooks give the same files as write_payloads(load_tracker(path)) for any
+    batch_size. CSV and JSON Lines batches are typed one at a time, so a column
+    mixing numbers with text or blanks may have a few cells typed differently
+    than a whole-file read (see ExcelParser.iter_chunks).
+
+    Returns:
+        (flow, paths written, row count)
+    """
+    if not is_light_tracker(path, sheet):
+        from excel_parser import TABULAR_READERS, ColumnTyper, ExcelParser
+
+        if os.path.splitext(str(path))[1].lower() not in TABULAR_READERS:
+            parser = ExcelParser(path, sheet=sheet)
+            with SpilledTracker(spill_dir, max_buffered_rows, ColumnTyper(parser)) as tracker:
+                for rows in parser.iter_rows(batch_size):
+                    tracker.add_rows(rows)
+                flow, paths = tracker.write(package_name, output, config_output)
+                return flow, paths, tracker.rows
+
+    with SpilledTracker(spill_dir, max_buffered_rows) as tracker:
+        for batch, kinds in read_tracker_batches(path, sheet, batch_size):
+            tracker.add(batch, kinds)
+        flow, paths = tracker.write(package_name, output, config_output)
+        return flow, paths, tracker.rows
@@ -0,0 +1,100 @@
+import hashlib
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# Bump when the parsed frame layout changes so old entries are ignored
+CACHE_VERSION = 2
+
+DEFAULT_CACHE_DIR = Path(os.environ.get('EXCEL_TO_API_CACHE_DIR', Path.home() / '.cache' / 'excel_to_api' / 'parse'))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed trackers keyed by workbook content and parser settings.
+
+    Entries are the normalized DataFrames written with pandas' binary pickle format,
+    which keeps the mixed object columns (e.g. granular True/False/'') exactly as parsed.
+    The cache directory is kept under max_bytes by evicting least recently used entries.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    def key(self, file_path, settings):
+        """
+        Build the cache key from the file's SHA-256 and the parser settings.
+        Any edit to the workbook changes the hash, so stale entries are never returned.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        settings_part = repr((CACHE_VERSION, pd.__version__, sorted(settings.items())))
+        digest.update(settings_part.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Return the cached DataFrame for key, or None on a miss.
+        """
+        entry = self._entry_path(key)
+        try:
+            df = pd.read_pickle(entry)
+        except (FileNotFoundError, EOFError):
+            return None
+        except Exception:
+            # Unreadable entry (e.g. written by an incompatible pandas); drop it
+            self._remove(entry)
+            return None
+
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            # Evicted by another process, or a read-only cache dir; the read still counts
+            pass
+        return df
+
+    def put(self, key, df):
+        """
+        Store df under key and evict old entries if the cache grew past max_bytes.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = self._entry_path(key)
+        tmp = entry.with_suffix(f'.{os.getpid()}.tmp')
+        df.to_pickle(tmp, protocol=5)
+        os.replace(tmp, entry)
+        self._evict()
+
+    def clear(self):
+        for entry in self.cache_dir.glob('*.pkl'):
+            self._remove(entry)
+
+    def _entry_path(self, key):
+        return self.cache_dir / f'{key}.pkl'
+
+    def _evict(self):
+        entries = []
+        for entry in self.cache_dir.glob('*.pkl'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            self._remove(entry)
+            total -= size
+
+    @staticmethod
+    def _remove(entry):
+        try:
+            entry.unlink()
+        except FileNotFoundError:
+            pass
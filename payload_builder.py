@@ -0,0 +1,287 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import light_tracker
+from json_generator import JSONGenerator
+from configuration_generator import ConfigurationGenerator
+from payload_writer import save_payload
+from tracker_table import TrackerTable, as_table, group_by_codes
+
+# The pandas-based parser is imported when first needed, so small CSV/JSON
+# trackers never load pandas
+
+# CSV/JSON/JSONL trackers up to this size are read in pure Python; larger ones
+# go through pandas' memory-mapped readers, which win once the import is paid for
+LIGHT_MAX_BYTES = 4 * 1024 * 1024
+
+# Trackers with fewer rows are always generated in-process: starting workers and
+# pickling the shards costs more than it saves
+PARALLEL_MIN_ROWS = 20000
+
+# Submission flows, picked from the item types present in a tracker
+FLOW_STANDARD = 'standard'
+FLOW_CONFIGURATION = 'configuration'
+FLOW_MIXED = 'mixed'
+
+
+def detect_flow(excel_data):
+    """
+    Decide how a tracker is submitted:
+    - only Configuration items -> single POST of the ConfigurationGenerator payload
+    - only standard items -> single POST of the JSONGenerator payload
+    - both -> POST the standard items, then PATCH the Configuration items
+    """
+    item_names = set(as_table(excel_data)['itemName'])
+    has_configuration = 'Configuration' in item_names
+    has_other_items = bool(item_names - {'Configuration'})
+
+    if not has_configuration and not has_other_items:
+        raise ValueError("No items found in Excel file.")
+    if has_configuration and not has_other_items:
+        return FLOW_CONFIGURATION
+    if not has_configuration and has_other_items:
+        return FLOW_STANDARD
+    return FLOW_MIXED
+
+
+def split_mixed(excel_data):
+    """
+    Split a mixed tracker into (standard rows, Configuration rows).
+
+    Both halves are TrackerTables sharing the cell values of excel_data.
+    """
+    table = as_table(excel_data)
+    standard, configuration = [], []
+    for index, item_name in enumerate(table['itemName']):
+        (configuration if item_name == 'Configuration' else standard).append(index)
+    return table.take(standard), table.take(configuration)
+
+
+def load_tracker(path, use_cache=True, sheet=None):
+    """
+    Read a tracker into a TrackerTable: small CSV/JSON/JSONL files through the
+    pure-Python reader, anything else through ExcelParser (streaming for workbooks,
+    with the parse cache when use_cache). The parsed DataFrame is only kept by the cache.
+
+    sheet selects a workbook sheet by name (default: the first sheet).
+    """
+    if is_light_tracker(path, sheet):
+        return light_tracker.read_tracker(path)
+
+    from excel_parser import ExcelParser
+    cache = None
+    if use_cache:
+        from parse_cache import ParseCache
+        cache = ParseCache()
+    return TrackerTable.from_frame(ExcelParser(path, cache=cache, sheet=sheet).parse(streaming=True))
+
+
+def is_light_tracker(path, sheet=None):
+    """
+    Whether load_tracker reads path with the pure-Python reader.
+    """
+    return light_tracker.is_light_input(path) and sheet is None and _is_small(path)
+
+
+def _is_small(path):
+    try:
+        return os.path.getsize(path) <= LIGHT_MAX_BYTES
+    except OSError:
+        # Let the reader report the missing file
+        return True
+
+
+def generate_standard_payload(excel_data, package_name, jobs=1):
+    """
+    JSONGenerator payload; with jobs > 1, large trackers are generated one item
+    group per task across a process pool (see generate_payloads).
+    """
+    if _use_pool(excel_data, jobs):
+        return generate_payloads(excel_data, package_name, jobs, flow=FLOW_STANDARD)[1]
+    return JSONGenerator(excel_data).generate(package_name)
+
+
+def generate_configuration_payload(excel_data, package_name, jobs=1):
+    """
+    ConfigurationGenerator payload; with jobs > 1, large trackers are generated one
+    product family per task across a process pool (see generate_payloads).
+    """
+    if _use_pool(excel_data, jobs):
+        return generate_payloads(excel_data, package_name, jobs, flow=FLOW_CONFIGURATION)[1]
+    return ConfigurationGenerator(excel_data).generate(package_name)
+
+
+def group_rows(excel_data):
+    """
+    Row indexes per independent part of the payloads, in row order:
+    - item name -> rows, for the standard items (one JSONGenerator item each)
+    - product family -> rows, for the Configuration items (one top-level node each)
+
+    Each part only depends on its own rows, so it can be generated on its own
+    with generate_item / generate_family.
+    """
+    table = as_table(excel_data)
+    item_rows = group_by_codes(*table.categories('itemName'))
+    configuration_rows = item_rows.pop('Configuration', [])
+
+    commerce_codes, commerce_values = table.categories('commerceVariableName')
+    families = [str(commerce_var).split('.')[0] for commerce_var in commerce_values]
+    family_rows = {}
+    for index in configuration_rows:
+        family_rows.setdefault(families[commerce_codes[index]], []).append(index)
+    return item_rows, family_rows
+
+
+def generate_item(excel_data, package_name):
+    """
+    The JSONGenerator item for the rows of one item group.
+    """
+    return JSONGenerator(excel_data).generate(package_name)['contents']['items'][0]
+
+
+def generate_family(excel_data, package_name):
+    """
+    The top-level Configuration node for the rows of one product family.
+    """
+    return ConfigurationGenerator(excel_data).generate(package_name)['contents']['items'][0]['children'][0]
+
+
+def standard_item_order(item_names):
+    """
+    Item names in the order JSONGenerator emits them.
+    """
+    return sorted(item_names, key=lambda name: JSONGenerator._group_order((name,)))
+
+
+def write_configuration_payload(excel_data, package_name, path):
+    """
+    Stream the Configuration payload to path without building the tree.
+    Returns the byte count.
+    """
+    with open(path, 'wb') as f:
+        return ConfigurationGenerator(excel_data).write(package_name, f)
+
+
+def generate_payloads(excel_data, package_name, jobs=1, flow=None):
+    """
+    Generate every payload a tracker needs.
+
+    With jobs > 1 and at least PARALLEL_MIN_ROWS rows, item groups and Configuration
+    product families are generated as separate tasks across a process pool and
+    merged back in the serial order, so the payloads are the same either way.
+    flow forces a flow instead of detecting it.
+
+    Returns:
+        (flow, payload, config_payload): payload is POSTed to create the package;
+        config_payload is only set for the mixed flow and is PATCHed afterwards.
+    """
+    excel_data = as_table(excel_data)
+    if flow is None:
+        flow = detect_flow(excel_data)
+    if _use_pool(excel_data, jobs):
+        return _generate_in_pool(excel_data, package_name, jobs, flow)
+
+    if flow == FLOW_CONFIGURATION:
+        return flow, generate_configuration_payload(excel_data, package_name), None
+    if flow == FLOW_STANDARD:
+        return flow, generate_standard_payload(excel_data, package_name), None
+
+    standard_data, config_data = split_mixed(excel_data)
+    return (
+        flow,
+        generate_standard_payload(standard_data, package_name),
+        generate_configuration_payload(config_data, package_name)
+    )
+
+
+def write_payloads(excel_data, package_name, path, config_path):
+    """
+    Like generate_payloads, but write the payloads as compact JSON instead of
+    returning them: payload to path and, for the mixed flow, config_payload to
+    config_path. Configuration payloads are streamed (see write_configuration_payload).
+
+    Returns:
+        (flow, paths written)
+    """
+    excel_data = as_table(excel_data)
+    flow = detect_flow(excel_data)
+
+    if flow == FLOW_CONFIGURATION:
+        write_configuration_payload(excel_data, package_name, path)
+        return flow, [path]
+    if flow == FLOW_STANDARD:
+        save_payload(generate_standard_payload(excel_data, package_name), path)
+        return flow, [path]
+
+    standard_data, config_data = split_mixed(excel_data)
+    save_payload(generate_standard_payload(standard_data, package_name), path)
+    write_configuration_payload(config_data, package_name, config_path)
+    return flow, [path, config_path]
+
+
+def _use_pool(excel_data, jobs):
+    return jobs is not None and jobs > 1 and len(as_table(excel_data)) >= PARALLEL_MIN_ROWS
+
+
+def _generate_in_pool(table, package_name, jobs, flow):
+    """
+    generate_payloads with one task per item group and per product family.
+    """
+    if flow == FLOW_STANDARD:
+        item_rows, family_rows = group_by_codes(*table.categories('itemName')), {}
+    elif flow == FLOW_CONFIGURATION:
+        commerce_codes, commerce_values = table.categories('commerceVariableName')
+        families = [str(commerce_var).split('.')[0] for commerce_var in commerce_values]
+        item_rows, family_rows = {}, group_by_codes(commerce_codes, families)
+    else:
+        item_rows, family_rows = group_rows(table)
+
+    item_names = standard_item_order(item_rows)
+    tasks = [(generate_item, item_rows[name]) for name in item_names]
+    tasks += [(generate_family, rows) for rows in family_rows.values()]
+
+    if len(tasks) < 2:
+        results = [generate(table.take(rows), package_name) for generate, rows in tasks]
+    else:
+        # Workers get the table once (inherited when processes are forked) and
+        # only row indexes per task
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)),
+                                 initializer=_share_table, initargs=(table,)) as executor:
+            # Largest groups first so one big group does not start last
+            futures = {
+                index: executor.submit(_generate_shard, tasks[index][0], tasks[index][1], package_name)
+                for index in sorted(range(len(tasks)), key=lambda index: -len(tasks[index][1]))
+            }
+            # Collected in serial order, so the first failing group raises as it would serially
+            results = [futures[index].result() for index in range(len(tasks))]
+
+    items = results[:len(item_names)]
+    families = results[len(item_names):]
+    payload = {"name": package_name, "contents": {"items": items}}
+    config_payload = {
+        "name": package_name,
+        "contents": {
+            "items": [{"name": "Configuration", "category": "CONFIGURATION", "children": families}]
+        }
+    }
+
+    if flow == FLOW_CONFIGURATION:
+        return flow, config_payload, None
+    if flow == FLOW_STANDARD:
+        return flow, payload, None
+    return flow, payload, config_payload
+
+
+_shared_table = None
+
+
+def _share_table(table):
+    global _shared_table
+    _shared_table = table
+    # Forked workers inherit the CLI's progress logging; one line per task would only be noise
+    logging.getLogger('json_generator').setLevel(logging.WARNING)
+
+
+def _generate_shard(generate, rows, package_name):
+    return generate(_shared_table.take(rows), package_name)
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+from pathlib import Path
+
+DEFAULT_SNAPSHOT_DIR = Path(os.environ.get('EXCEL_TO_API_SNAPSHOT_DIR', Path.home() / '.cache' / 'excel_to_api' / 'snapshots'))
+
+
+class SnapshotStore:
+    """
+    Last successfully submitted payload per (CPQ endpoint, package name).
+    """
+    def __init__(self, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+        self.snapshot_dir = Path(snapshot_dir)
+
+    def load(self, endpoint, package_name):
+        """
+        Return the last submitted payload, or None if there is no snapshot.
+        """
+        try:
+            with open(self._path(endpoint, package_name), encoding='utf-8') as f:
+                return json.load(f)['payload']
+        except FileNotFoundError:
+            return None
+
+    def save(self, endpoint, package_name, payload):
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(endpoint, package_name)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'endpoint': endpoint,
+                'packageName': package_name,
+                'submittedAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'payload': payload
+            }, f, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    def delete(self, endpoint, package_name):
+        try:
+            self._path(endpoint, package_name).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _path(self, endpoint, package_name):
+        key = hashlib.sha256(f"{endpoint}\n{package_name}".encode('utf-8')).hexdigest()
+        return self.snapshot_dir / f'{key}.json'
+
+
+def combine_payloads(payload, config_payload=None):
+    """
+    The package contents after the create call and, for mixed trackers, the Configuration PATCH.
+    """
+    if config_payload is None:
+        return payload
+    return {
+        'name': payload['name'],
+        'contents': {
+            'items': payload['contents']['items'] + config_payload['contents']['items']
+        }
+    }
+
+
+def diff_payload(payload, previous):
+    """
+    Compare payload with the previously submitted one.
+
+    Returns:
+        (delta, removed): delta is a payload with only the added or changed subtrees,
+        each under its ancestor chain, or None when nothing was added or changed.
+        removed counts nodes of previous that no longer exist; a PATCH cannot
+        remove them, so they are only reported.
+    """
+    removed = Counter()
+    items = _diff_nodes(payload['contents']['items'], previous['contents']['items'], removed)
+    if not items:
+        return None, removed['nodes']
+    return {'name': payload['name'], 'contents': {'items': items}}, removed['nodes']
+
+
+def _node_key(node):
+    return (node.get('name'), node.get('variableName'), node.get('resourceType'), node.get('category'))
+
+
+def _diff_nodes(nodes, previous_nodes, removed):
+    # Siblings are matched by key and, for repeated keys, by their position among them
+    previous_by_key = {}
+    for node in previous_nodes:
+        previous_by_key.setdefault(_node_key(node), []).append(node)
+
+    occurrences = Counter()
+    delta = []
+    for node in nodes:
+        key = _node_key(node)
+        candidates = previous_by_key.get(key, ())
+        index = occurrences[key]
+        occurrences[key] += 1
+        previous = candidates[index] if index < len(candidates) else None
+
+        if previous is None:
+            delta.append(node)
+            continue
+        if node == previous:
+            continue
+
+        children = node.get('children')
+        previous_children = previous.get('children')
+        same_attributes = all(
+            node.get(k) == previous.get(k) for k in node.keys() | previous.keys() if k != 'children'
+        )
+        if same_attributes and children and previous_children:
+            child_delta = _diff_nodes(children, previous_children, removed)
+            if child_delta:
+                delta.append({k: (child_delta if k == 'children' else v) for k, v in node.items()})
+        else:
+            # New attributes or a leaf turned into a subtree: resend the whole node
+            delta.append(node)
+
+    for key, candidates in previous_by_key.items():
+        for node in candidates[occurrences[key]:]:
+            removed['nodes'] += _count_nodes(node)
+
+    return delta
+
+
+def _count_nodes(node):
+    return 1 + sum(_count_nodes(child) for child in node.get('children') or ())
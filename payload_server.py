@@ -0,0 +1,396 @@
+"""
+Long-running payload service.
+
+Keeps pandas, the parsers, the generators, recently parsed trackers and API
+connections warm between requests, and serves payload generation over a local
+HTTP API:
+
+- POST /payloads   generate a package's payload(s), optionally submitting them
+    * JSON body: {"path": "tracker.xlsx", "packageName": "Pkg", "sheet": null,
+                  "submit": {"instance": "https://x.bigmachines.com", "username": "...",
+                             "password": "...", "incremental": false, "compress": false}}
+    * or the tracker file itself as the body:
+      POST /payloads?packageName=Pkg&filename=tracker.xlsx[&sheet=...][&submit=INSTANCE][&compress=true]
+      (submission credentials from the request's Basic Authorization header)
+- GET /metrics     request counts, latency percentiles and throughput per route
+- GET /health
+"""
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from payload_builder import generate_payloads, load_tracker
+from payload_writer import iter_payload_chunks
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8750
+
+MAX_UPLOAD_BYTES = 256 * 1024 * 1024
+
+# Latencies kept per route for percentiles, and the window for recent throughput
+LATENCY_WINDOW = 1000
+THROUGHPUT_WINDOW = 60
+
+
+class TrackerMemo:
+    """
+    Least recently used parsed TrackerTables, keyed by file identity and sheet.
+
+    Tables are never modified by the generators, so concurrent requests share them.
+    """
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            table = self._tables.get(key)
+            if table is None:
+                self.misses += 1
+                return None
+            self._tables.move_to_end(key)
+            self.hits += 1
+            return table
+
+    def put(self, key, table):
+        with self._lock:
+            self._tables[key] = table
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.max_entries:
+                self._tables.popitem(last=False)
+
+
+class ClientPool:
+    """
+    Idle APIClients per (endpoint, username, password, compression), reused across requests so
+    their keep-alive connections stay open. A client serves one request at a time.
+    """
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def client(self, endpoint, username, password, compression=None):
+        from api_client import APIClient
+
+        key = (endpoint, username, password, compression)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            api_client = idle.pop() if idle else None
+        if api_client is None:
+            api_client = APIClient(endpoint, username, password, compression=compression)
+        try:
+            yield api_client
+        finally:
+            # Each request reads its own calls from last_request; keep the log short
+            api_client.request_log.clear()
+            with self._lock:
+                self._idle[key].append(api_client)
+
+    def close(self):
+        with self._lock:
+            for clients in self._idle.values():
+                for api_client in clients:
+                    api_client.close()
+            self._idle.clear()
+
+
+class ServiceMetrics:
+    """
+    Request counts, errors, latency percentiles and throughput per route.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.in_flight = 0
+        self._routes = {}
+        self._completed = deque()
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self, route, seconds, failed):
+        now = time.time()
+        with self._lock:
+            self.in_flight -= 1
+            stats = self._routes.setdefault(route, {
+                'requests': 0, 'errors': 0, 'latencies': deque(maxlen=LATENCY_WINDOW)
+            })
+            stats['requests'] += 1
+            stats['errors'] += failed
+            stats['latencies'].append(seconds)
+            self._completed.append(now)
+            self._trim(now)
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            self._trim(now)
+            uptime = now - self.started
+            total = sum(stats['requests'] for stats in self._routes.values())
+            return {
+                'uptimeSeconds': round(uptime, 1),
+                'inFlight': self.in_flight,
+                'requests': total,
+                'throughput': {
+                    'overallPerSecond': round(total / uptime, 3) if uptime else 0.0,
+                    f'last{THROUGHPUT_WINDOW}sPerSecond': round(len(self._completed) / THROUGHPUT_WINDOW, 3)
+                },
+                'routes': {
+                    route: {
+                        'requests': stats['requests'],
+                        'errors': stats['errors'],
+                        'latencySeconds': _percentiles(stats['latencies'])
+                    }
+                    for route, stats in self._routes.items()
+                }
+            }
+
+    def _trim(self, now):
+        while self._completed and self._completed[0] < now - THROUGHPUT_WINDOW:
+            self._completed.popleft()
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return {}
+    ordered = sorted(latencies)
+    pick = lambda fraction: round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
+    return {'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1], 4)}
+
+
+class PayloadService:
+    """
+    Request processing shared by the HTTP handlers: load (memoized), generate,
+    optionally submit.
+    """
+    def __init__(self, use_cache=True, max_concurrent=4, memo_entries=16, jobs=1):
+        self.use_cache = use_cache
+        self.jobs = jobs
+        self.memo = TrackerMemo(memo_entries)
+        self.clients = ClientPool()
+        self.metrics = ServiceMetrics()
+        # Generation is CPU-bound; bound how many trackers are in memory at once
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def warm_up(self):
+        """
+        Import the heavy modules now so the first request does not pay for them.
+        """
+        import api_client  # noqa: F401
+        import excel_parser  # noqa: F401
+        import parse_cache  # noqa: F401
+
+    def generate(self, package_name, path=None, content=None, filename=None, sheet=None, submit=None):
+        """
+        Generate a package from a tracker path or uploaded tracker bytes.
+
+        Returns:
+            dict with packageName, flow, rows, payload, configPayload, cached, seconds
+            and, when submit is given, submission (see submission.submit_package).
+        """
+        started = time.perf_counter()
+        with self._slots:
+            table, cached = self._load(path, content, filename, sheet)
+            flow, payload, config_payload = generate_payloads(table, package_name, self.jobs)
+
+        result = {
+            'packageName': package_name,
+            'flow': flow,
+            'rows': len(table),
+            'cached': cached,
+            'payload': payload,
+            'configPayload': config_payload,
+        }
+        if submit is not None:
+            result['submission'] = self._submit(submit, package_name, payload, config_payload)
+        result['seconds'] = round(time.perf_counter() - started, 4)
+        return result
+
+    def close(self):
+        self.clients.close()
+
+    def _load(self, path, content, filename, sheet):
+        if content is not None:
+            key = ('upload', hashlib.sha256(content).hexdigest(), sheet)
+        else:
+            stat = os.stat(path)
+            key = ('path', os.path.abspath(path), stat.st_mtime_ns, stat.st_size, sheet)
+
+        table = self.memo.get(key)
+        if table is not None:
+            return table, True
+
+        if content is None:
+            table = load_tracker(path, self.use_cache, sheet=sheet)
+        else:
+            suffix = os.path.splitext(filename or '')[1] or '.xlsx'
+            fd, upload_path = tempfile.mkstemp(suffix=suffix)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(content)
+                table = load_tracker(upload_path, self.use_cache, sheet=sheet)
+            finally:
+                os.remove(upload_path)
+
+        self.memo.put(key, table)
+        return table, False
+
+    def _submit(self, submit, package_name, payload, config_payload):
+        from api_client import migration_packages_endpoint
+        from submission import submit_incremental, submit_package
+
+        endpoint = migration_packages_endpoint(submit['instance'])
+        compression = 'gzip' if submit.get('compress') else None
+        with self.clients.client(endpoint, submit['username'], submit['password'], compression) as api_client:
+            try:
+                if submit.get('incremental'):
+                    from payload_delta import SnapshotStore
+                    result = submit_incremental(api_client, package_name, payload, config_payload, SnapshotStore())
+                else:
+                    result = submit_package(api_client, package_name, payload, config_payload)
+                result['error'] = None
+            except Exception as e:
+                result = {'status': 'failed', 'steps': [], 'error': str(e)}
+        result['instance'] = submit['instance']
+        return result
+
+
+class PayloadRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'ExcelToAPI'
+    service = None
+
+    def do_GET(self):
+        route = urlparse(self.path).path
+        if route == '/health':
+            self._respond('/health', lambda: (200, {'status': 'ok'}))
+        elif route == '/metrics':
+            self._respond('/metrics', lambda: (200, self._metrics()))
+        else:
+            self._respond(route, lambda: (404, {'error': f"Unknown route '{route}'."}))
+
+    def do_POST(self):
+        route = urlparse(self.path).path
+        if route == '/payloads':
+            self._respond('/payloads', self._generate)
+        else:
+            self._respond(route, lambda: (404, {'error': f"Unknown route '{route}'."}))
+
+    def _metrics(self):
+        metrics = self.service.metrics.snapshot()
+        metrics['trackerMemo'] = {'hits': self.service.memo.hits, 'misses': self.service.memo.misses}
+        return metrics
+
+    def _generate(self):
+        try:
+            request = self._read_request()
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        try:
+            return 200, self.service.generate(**request)
+        except Exception as e:
+            return 422, {'error': str(e)}
+
+    def _read_request(self):
+        """
+        Keyword arguments for PayloadService.generate from a JSON or upload request.
+        """
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_UPLOAD_BYTES:
+            raise ValueError(f"Request body larger than {MAX_UPLOAD_BYTES} bytes.")
+        body = self.rfile.read(length)
+        query = {name: values[-1] for name, values in parse_qs(urlparse(self.path).query).items()}
+
+        if self.headers.get_content_type() == 'application/json':
+            try:
+                request = json.loads(body or b'{}')
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON body: {e}")
+            if not isinstance(request, dict) or not request.get('path'):
+                raise ValueError("JSON requests need a 'path' to the tracker.")
+            submit = request.get('submit')
+            if submit is not None and not (
+                    isinstance(submit, dict) and all(submit.get(key) for key in ('instance', 'username', 'password'))):
+                raise ValueError("'submit' needs 'instance', 'username' and 'password'.")
+            arguments = {'path': request['path'], 'sheet': request.get('sheet'), 'submit': submit}
+            package_name = request.get('packageName')
+        else:
+            if not body:
+                raise ValueError("Upload the tracker file as the request body.")
+            arguments = {'content': body, 'filename': query.get('filename'), 'sheet': query.get('sheet'),
+                         'submit': self._upload_submit(query)}
+            package_name = query.get('packageName')
+
+        if not package_name:
+            raise ValueError("No packageName given.")
+        arguments['package_name'] = package_name
+        return arguments
+
+    def _upload_submit(self, query):
+        if not query.get('submit'):
+            return None
+        authorization = self.headers.get('Authorization', '')
+        if not authorization.startswith('Basic '):
+            raise ValueError("Submitting an upload needs a Basic Authorization header.")
+        try:
+            username, _, password = base64.b64decode(authorization[6:]).decode('utf-8').partition(':')
+        except ValueError:
+            raise ValueError("Malformed Basic Authorization header.")
+        return {'instance': query['submit'], 'username': username, 'password': password,
+                'incremental': query.get('incremental', '').lower() in ('1', 'true', 'yes'),
+                'compress': query.get('compress', '').lower() in ('1', 'true', 'yes')}
+
+    def _respond(self, route, handle):
+        metrics = self.service.metrics
+        metrics.begin()
+        started = time.perf_counter()
+        status = 500
+        try:
+            try:
+                status, body = handle()
+            except Exception as e:
+                status, body = 500, {'error': str(e)}
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            # Payloads can be large: stream them and end the response by closing the connection
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            for chunk in iter_payload_chunks(body):
+                self.wfile.write(chunk)
+        finally:
+            metrics.end(route, time.perf_counter() - started, status >= 400)
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, use_cache=True, max_concurrent=4, jobs=1):
+    """
+    Run the payload service until interrupted. Requests are handled on their own
+    threads; at most max_concurrent trackers are loaded and generated at once, each
+    across up to jobs processes when large (see payload_builder.generate_payloads).
+    """
+    service = PayloadService(use_cache=use_cache, max_concurrent=max_concurrent, jobs=jobs)
+    service.warm_up()
+    handler = type('Handler', (PayloadRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    print(f"Serving payloads on http://{host}:{server.server_port} (POST /payloads, GET /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print("Payload service stopped.")
@@ -0,0 +1,140 @@
+from instrumentation import traced
+from payload_writer import encode
+
+
+@traced('serialize', lambda body, payload: {'bytes': len(body)})
+def serialize_payload(payload):
+    """
+    Serialize a payload as a request body: the same compact JSON bytes that
+    payload files and compressed bodies carry.
+    """
+    return encode(payload)
+
+
+def split_payload(payload, max_bytes=None, max_children=None):
+    """
+    Split a migration package payload into payloads that each fit the budget.
+
+    The contents.items tree is cut between leaf nodes (nodes without children).
+    Every part repeats the ancestor chain of the leaves it carries, without the
+    siblings that went to other parts, so sending the first part as the create
+    call and the rest as PATCHes to the package rebuilds the original tree.
+
+    Args:
+        payload: {"name": ..., "contents": {"items": [...]}}
+        max_bytes: Approximate upper bound for the serialized size of each part.
+        max_children: Upper bound for the number of leaf nodes in each part.
+
+    Returns:
+        List of payloads in submission order; [payload] when it fits in one part.
+    """
+    if max_bytes is None and max_children is None:
+        return [payload]
+
+    leaves = list(_iter_leaves(payload['contents']['items'], ()))
+
+    envelope_size = len(serialize_payload(_envelope(payload, [])))
+    shell_sizes = {}
+    parts = []
+    current = None
+
+    for ancestors, leaf in leaves:
+        leaf_size = len(serialize_payload(leaf)) + 2
+        if current is not None:
+            # Ancestors the current part doesn't have yet must be added along with the leaf
+            shared = _shared_depth(current['chain'], ancestors)
+            added = leaf_size + sum(
+                _shell_size(node, shell_sizes) for node in ancestors[shared:]
+            )
+            over_bytes = max_bytes is not None and current['size'] + added > max_bytes
+            over_children = max_children is not None and current['leaves'] >= max_children
+            if over_bytes or over_children:
+                current = None
+
+        if current is None:
+            current = {'items': [], 'chain': [], 'size': envelope_size, 'leaves': 0}
+            parts.append(current)
+            shared = 0
+            added = leaf_size + sum(_shell_size(node, shell_sizes) for node in ancestors)
+
+        _attach(current, ancestors, shared, leaf)
+        current['size'] += added
+        current['leaves'] += 1
+
+    if len(parts) <= 1:
+        return [payload]
+    return [_envelope(payload, part['items']) for part in parts]
+
+
+def count_leaves(payload):
+    """
+    Number of leaf nodes in the payload's contents.items tree.
+    """
+    return sum(1 for _ in _iter_leaves(payload['contents']['items'], ()))
+
+
+def _iter_leaves(nodes, ancestors):
+    """
+    Yield (ancestor chain, leaf node) pairs in document order.
+    """
+    for node in nodes:
+        children = node.get('children')
+        if children:
+            yield from _iter_leaves(children, ancestors + (node,))
+        else:
+            yield ancestors, node
+
+
+def _envelope(payload, items):
+    """
+    Copy of the payload's outer structure carrying the given items.
+    """
+    envelope = {}
+    for key, value in payload.items():
+        if key == 'contents':
+            value = {k: (items if k == 'items' else v) for k, v in value.items()}
+        envelope[key] = value
+    return envelope
+
+
+def _shell(node):
+    """
+    Copy of node with an empty children list, keeping key order.
+    """
+    return {key: ([] if key == 'children' else value) for key, value in node.items()}
+
+
+def _shell_size(node, cache):
+    size = cache.get(id(node))
+    if size is None:
+        size = cache[id(node)] = len(serialize_payload(_shell(node))) + 2
+    return size
+
+
+def _shared_depth(chain, ancestors):
+    """
+    Number of leading ancestors already open in the current part.
+    """
+    depth = 0
+    for (node, _), ancestor in zip(chain, ancestors):
+        if node is not ancestor:
+            break
+        depth += 1
+    return depth
+
+
+def _attach(part, ancestors, shared, leaf):
+    """
+    Add leaf to the part, reusing the first `shared` open ancestors and opening the rest.
+    """
+    chain = part['chain'][:shared]
+    siblings = chain[-1][1]['children'] if chain else part['items']
+
+    for node in ancestors[shared:]:
+        shell = _shell(node)
+        siblings.append(shell)
+        chain.append((node, shell))
+        siblings = shell['children']
+
+    siblings.append(leaf)
+    part['chain'] = chain
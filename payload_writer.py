@@ -0,0 +1,168 @@
+import json
+import sys
+
+from instrumentation import traced
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _stdlib_encode(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, allow_nan=False).encode('utf-8')
+
+
+def _orjson_encode(value):
+    # orjson writes NaN as null and formats exponents differently (1e16, not 1e+16),
+    # so values holding floats go through the stdlib; the output never depends on
+    # whether orjson is installed. Strings and flat leaf nodes are checked cheaply
+    kind = type(value)
+    if not (kind is str or (kind is dict and {*map(type, value.values())} <= _SCALAR_TYPES)):
+        if _contains_float(value):
+            return _stdlib_encode(value)
+    try:
+        return orjson.dumps(value)
+    except orjson.JSONEncodeError:
+        # e.g. integers beyond 64 bits, which the stdlib encodes
+        return _stdlib_encode(value)
+
+
+# Types orjson encodes exactly like the stdlib
+_SCALAR_TYPES = {str, int, bool, type(None)}
+
+
+def _contains_float(value):
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            return True
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+    return False
+
+
+# Compact UTF-8 JSON, with NaN and infinity rejected; orjson encodes when installed
+encode = _orjson_encode if orjson is not None else _stdlib_encode
+# For values already known to hold only _SCALAR_TYPES
+_dumps = orjson.dumps if orjson is not None else _stdlib_encode
+
+
+def iter_payload_chunks(value):
+    """
+    Yield the compact JSON encoding of value in chunks.
+
+    Containers are walked recursively and only flat objects (leaf nodes such as
+    {"name", "variableName", "resourceType"}) are encoded in one call, so the whole
+    document never exists as one string. The bytes are the same as encode(value).
+    """
+    kind = type(value)
+    if kind is list:
+        yield b'['
+        for index, item in enumerate(value):
+            if index:
+                yield b','
+            yield from iter_payload_chunks(item)
+        yield b']'
+        return
+
+    if kind is dict:
+        kinds = {*map(type, value.values())}
+        if dict in kinds or list in kinds:
+            yield b'{'
+            for index, (key, item) in enumerate(value.items()):
+                yield (b',' if index else b'') + _dumps(key) + b':'
+                yield from iter_payload_chunks(item)
+            yield b'}'
+            return
+    else:
+        kinds = {kind}
+    yield _dumps(value) if kinds <= _SCALAR_TYPES else encode(value)
+
+
+@traced('write_payload', lambda written, payload, fp: {'bytes': written})
+def write_payload(payload, fp):
+    """
+    Stream payload as compact JSON to a binary file object.
+
+    Returns:
+        Number of bytes written.
+    """
+    written = 0
+    for chunk in iter_payload_chunks(payload):
+        fp.write(chunk)
+        written += len(chunk)
+    fp.write(b'\n')
+    return written
+
+
+def save_payload(payload, path):
+    """
+    Write payload to path, or to stdout when path is '-'. Returns the byte count.
+    """
+    if path == '-':
+        # Keep ordering with anything already printed through the text layer
+        sys.stdout.flush()
+        written = write_payload(payload, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+        return written
+    with open(path, 'wb') as f:
+        return write_payload(payload, f)
+
+
+def payload_size(payload):
+    """
+    Size of the compact JSON encoding, computed without keeping the output.
+    """
+    return sum(len(chunk) for chunk in iter_payload_chunks(payload))
+
+
+def summarize_payload(payload):
+    """
+    Summary used instead of printing the whole payload: leaf children per item
+    category, node count, tree depth and compact size in bytes.
+    """
+    categories = {}
+    nodes = 0
+    max_depth = 0
+
+    for item in payload['contents']['items']:
+        stack = [(child, 1) for child in item.get('children', [])]
+        leaves = 0
+        while stack:
+            node, depth = stack.pop()
+            nodes += 1
+            max_depth = max(max_depth, depth)
+            children = node.get('children')
+            if children:
+                stack.extend((child, depth + 1) for child in children)
+            else:
+                leaves += 1
+        category = item.get('category', item.get('name'))
+        categories[category] = categories.get(category, 0) + leaves
+
+    return {
+        'name': payload.get('name'),
+        'categories': categories,
+        'nodes': nodes,
+        'depth': max_depth,
+        'bytes': payload_size(payload)
+    }
+
+
+def format_summary(summary):
+    lines = [f"Package: {summary['name']}"]
+    for category, leaves in summary['categories'].items():
+        lines.append(f"  {category}: {leaves} children")
+    lines.append(f"Nodes: {summary['nodes']}, tree depth: {summary['depth']}, size: {_format_bytes(summary['bytes'])}")
+    return '\n'.join(lines)
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024 or unit == 'MB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
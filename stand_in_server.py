@@ -0,0 +1,439 @@
+"""
+Stand-in for the CPQ migration package REST API, for checking submissions
+without a real instance.
+
+StandInServer serves any number of "instances" from one local port: the path
+before /rest/ names the instance, so http://127.0.0.1:PORT/a and
+http://127.0.0.1:PORT/b are two instances on the same host. Packages are kept in
+memory per instance:
+
+- POST  /<instance>/rest/v14/migrationPackages                creates a package (400 if it exists)
+- PATCH /<instance>/rest/v19/migrationPackages/<identifier>   merges items into it (404 if missing)
+- GET   /<instance>/rest/v19/migrationPackages/<identifier>   200 or 404
+
+Every request is recorded with its timing, together with the most requests that
+were in flight at once. Failures can be queued per method and instance.
+
+Running the module checks fan_out, split payloads, lost creates and journal resumes
+against it:
+    python stand_in_server.py
+"""
+import contextlib
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class StandInServer:
+    """
+    A stand-in CPQ server on 127.0.0.1, running on a background thread.
+
+    Args:
+        delay: Seconds every request takes, so concurrent requests overlap
+        port: Port to bind (0: any free port)
+    """
+    def __init__(self, delay=0.0, port=0):
+        self.delay = delay
+        # (instance, identifier) -> {'name', 'contents'}
+        self.packages = {}
+        # One entry per request: method, instance, identifier, status, started, finished
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._failures = []
+        self._lock = threading.Lock()
+
+        handler = type('Handler', (StandInRequestHandler,), {'stand_in': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url(self, instance=''):
+        """
+        CPQ instance URL of the named instance, for migration_packages_endpoint.
+        """
+        return f"http://127.0.0.1:{self._server.server_port}/{instance}".rstrip('/')
+
+    def fail(self, method, instance='', status=None, times=1):
+        """
+        Fail the next `times` method requests to instance. With a status, the
+        request is answered with it and has no effect; without one, it takes effect
+        and the connection is closed unanswered, like a response lost in transit.
+        """
+        with self._lock:
+            self._failures.append({'method': method, 'instance': instance, 'status': status, 'times': times})
+
+    def requests_to(self, instance=''):
+        with self._lock:
+            return [request for request in self.requests if request['instance'] == instance]
+
+    def contents(self, instance, package_name):
+        package = self.packages.get((instance, package_name.lower() + '_v1'))
+        return package and package['contents']
+
+    def reset(self):
+        with self._lock:
+            self.packages.clear()
+            self.requests.clear()
+            self._failures.clear()
+            self.max_in_flight = 0
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _take_failure(self, method, instance):
+        with self._lock:
+            for failure in self._failures:
+                if failure['method'] == method and failure['instance'] == instance:
+                    failure['times'] -= 1
+                    if not failure['times']:
+                        self._failures.remove(failure)
+                    return failure
+        return None
+
+    def _apply(self, method, instance, identifier, body):
+        """
+        Apply a request to the packages; returns the status code.
+        """
+        key = (instance, identifier)
+        with self._lock:
+            if method == 'GET':
+                return 200 if key in self.packages else 404
+            if method == 'POST':
+                if key in self.packages:
+                    return 400
+                self.packages[key] = {'name': body['name'], 'contents': {'items': []}}
+                _merge_nodes(self.packages[key]['contents']['items'], body['contents']['items'])
+                return 201
+            if key not in self.packages:
+                return 404
+            _merge_nodes(self.packages[key]['contents']['items'], body['contents']['items'])
+            return 200
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    stand_in = None
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_PATCH(self):
+        self._handle()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        stand_in = self.stand_in
+        instance, _, resource = urlparse(self.path).path.strip('/').partition('rest/')
+        instance = instance.strip('/')
+        request = {'method': self.command, 'instance': instance, 'identifier': None, 'status': None,
+                   'started': time.perf_counter(), 'finished': None}
+        with stand_in._lock:
+            stand_in.requests.append(request)
+            stand_in.in_flight += 1
+            stand_in.max_in_flight = max(stand_in.max_in_flight, stand_in.in_flight)
+        try:
+            body = self._read_body()
+            time.sleep(stand_in.delay)
+            if self.command == 'POST':
+                identifier = body['name'].lower() + '_v1'
+            else:
+                identifier = resource.rsplit('/', 1)[-1]
+            request['identifier'] = identifier
+
+            failure = stand_in._take_failure(self.command, instance)
+            if failure is not None and failure['status'] is None:
+                stand_in._apply(self.command, instance, identifier, body)
+                self.close_connection = True
+                return
+            status = failure['status'] if failure is not None else stand_in._apply(
+                self.command, instance, identifier, body)
+            request['status'] = status
+            self._respond(status, {'identifier': identifier} if status < 400 else {'message': f"Status {status}"})
+        finally:
+            request['finished'] = time.perf_counter()
+            with stand_in._lock:
+                stand_in.in_flight -= 1
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            data = b''.join(chunks)
+        else:
+            data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        return json.loads(data) if data else None
+
+    def _respond(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _merge_nodes(nodes, new_nodes):
+    # Branches are matched by key, since the parts of a split payload repeat their
+    # ancestors; a leaf replaces the leaf with its key, so a resent PATCH changes nothing
+    for node in new_nodes:
+        children = node.get('children')
+        key = _node_key(node)
+        if not children:
+            index = next((i for i, n in enumerate(nodes) if not n.get('children') and _node_key(n) == key), None)
+            if index is None:
+                nodes.append(node)
+            else:
+                nodes[index] = node
+            continue
+        existing = next((n for n in nodes if n.get('children') and _node_key(n) == key), None)
+        if existing is None:
+            existing = {**node, 'children': []}
+            nodes.append(existing)
+        _merge_nodes(existing['children'], children)
+
+
+def _node_key(node):
+    return (node.get('name'), node.get('variableName'), node.get('resourceType'), node.get('category'))
+
+
+def sample_package(name, items=3, leaves=40, category='COMMERCE'):
+    """
+    A (payload, config_payload) pair shaped like the generators' output.
+    """
+    def payload(item_names, item_category):
+        return {'name': name, 'contents': {'items': [
+            {'name': item_name, 'category': item_category, 'children': [
+                {'name': f"{item_name}_process", 'variableName': f"{item_name}_process", 'resourceType': 'process',
+                 'children': [{'name': f"{item_name}_{leaf}", 'variableName': f"{item_name}_{leaf}",
+                               'resourceType': 'action'} for leaf in range(leaves)]}
+            ]} for item_name in item_names
+        ]}}
+
+    return (payload([f"{category.title()}{index}" for index in range(items)], category),
+            payload([f"Family{index}" for index in range(items)], 'CONFIGURATION'))
+
+
+def check_fan_out(server):
+    """
+    fan_out to six instances on one host: at most per_host_limit of them in flight,
+    POST before PATCH per instance, and one report covering all of them.
+    """
+    from payload_delta import combine_payloads
+    from submission import fan_out, print_fanout_report
+
+    server.delay = 0.05
+    payload, config_payload = sample_package('FanOut')
+    instances = [server.url(f"fanout{index}") for index in range(6)]
+    server.fail('POST', 'fanout5', status=400)
+    results = fan_out(instances, 'user', 'password', 'FanOut', payload, config_payload, per_host_limit=2)
+
+    problems = []
+    if server.max_in_flight != 2:
+        problems.append(f"{server.max_in_flight} requests in flight at once, expected the per-host limit of 2")
+    for index, (instance, result) in enumerate(zip(instances, results)):
+        name = f"fanout{index}"
+        requests = server.requests_to(name)
+        expected = ['POST'] if index == 5 else ['POST', 'PATCH']
+        if [request['method'] for request in requests] != expected:
+            problems.append(f"{name}: sent {[request['method'] for request in requests]}, expected {expected}")
+        elif len(requests) == 2 and requests[1]['started'] < requests[0]['finished']:
+            problems.append(f"{name}: PATCH started before the POST finished")
+        if result['instance'] != instance or result['status'] != ('failed' if index == 5 else 'ok'):
+            problems.append(f"{name}: reported {result['instance']} as {result['status']}")
+        if index != 5 and server.contents(name, 'FanOut') != combine_payloads(payload, config_payload)['contents']:
+            problems.append(f"{name}: package contents differ from the payloads")
+
+    report = io.StringIO()
+    with contextlib.redirect_stdout(report):
+        print_fanout_report(results)
+    if "5 succeeded, 0 unchanged, 1 failed" not in report.getvalue():
+        problems.append("the fan_out report does not count 5 succeeded and 1 failed")
+    return problems
+
+
+def check_split(server):
+    """
+    A payload over the leaf budget goes out as one POST and PATCHes that rebuild
+    it, plain and gzip-compressed.
+    """
+    from api_client import APIClient, migration_packages_endpoint
+    from payload_splitter import split_payload
+
+    server.delay = 0
+    payload, _ = sample_package('Split', items=4, leaves=60)
+    batches = len(split_payload(payload, max_children=50))
+    problems = []
+    for name, compression in (('split', None), ('split-gzip', 'gzip')):
+        with APIClient(migration_packages_endpoint(server.url(name)), 'user', 'password',
+                       max_payload_children=50, compression=compression) as api_client:
+            response = api_client.post_data(payload)
+        methods = [request['method'] for request in server.requests_to(name)]
+        if response.status_code != 200 or methods != ['POST'] + ['PATCH'] * (batches - 1):
+            problems.append(f"{name}: sent {methods} ({response.status_code}), expected a POST and "
+                            f"{batches - 1} PATCHes")
+        if server.contents(name, 'Split') != payload['contents']:
+            problems.append(f"{name}: the batches do not rebuild the payload")
+    return problems
+
+
+def check_lost_create(server):
+    """
+    A create call is never posted twice: after a lost response the package is
+    looked up and found, after a 500 it is looked up, missing, and posted again.
+    """
+    from api_client import APIClient, migration_packages_endpoint
+
+    server.delay = 0
+    payload, _ = sample_package('Create')
+    problems = []
+    server.fail('POST', 'create-lost')
+    server.fail('POST', 'create-500', status=500)
+    expected = {'create-lost': (['POST', 'GET'], 200), 'create-500': (['POST', 'GET', 'POST'], 201)}
+    for name, (methods, status) in expected.items():
+        with APIClient(migration_packages_endpoint(server.url(name)), 'user', 'password',
+                       backoff_factor=0.01) as api_client:
+            response = api_client.post_data(payload)
+        sent = [request['method'] for request in server.requests_to(name)]
+        if sent != methods or response.status_code != status:
+            problems.append(f"{name}: sent {sent} ({response.status_code}), expected {methods} ({status})")
+        if server.contents(name, 'Create') != payload['contents']:
+            problems.append(f"{name}: package contents differ from the payload")
+    return problems
+
+
+def check_incremental_after_failed_update(server):
+    """
+    An incremental push of a mixed package whose create succeeded and whose update
+    failed: the next incremental push only PATCHes the Configuration items into the
+    package instead of creating it again.
+    """
+    from api_client import APIClient, migration_packages_endpoint
+    from payload_delta import SnapshotStore, combine_payloads
+    from submission import submit_incremental
+
+    server.delay = 0
+    payload, config_payload = sample_package('Incremental')
+    problems = []
+    server.fail('PATCH', 'incremental', status=400)
+    with tempfile.TemporaryDirectory() as tmp, APIClient(
+            migration_packages_endpoint(server.url('incremental')), 'user', 'password') as api_client:
+        snapshots = SnapshotStore(tmp)
+        statuses = [submit_incremental(api_client, 'Incremental', payload, config_payload, snapshots)['status']
+                    for _ in range(2)]
+    sent = [request['method'] for request in server.requests_to('incremental')]
+    if statuses != ['failed', 'ok'] or sent != ['POST', 'PATCH', 'PATCH']:
+        problems.append(f"pushes {statuses} sent {sent}, expected ['failed', 'ok'] and ['POST', 'PATCH', 'PATCH']")
+    if server.contents('incremental', 'Incremental') != combine_payloads(payload, config_payload)['contents']:
+        problems.append("package contents differ from the payloads")
+    return problems
+
+
+def check_resume(server):
+    """
+    A journaled push whose update call failed, one whose create call was never
+    answered, and one whose create was lost once and then refused as a duplicate on
+    its resend: resume_submissions sends only the missing calls, checking with a GET
+    that a failed create took effect instead of posting it again.
+    """
+    from api_client import migration_packages_endpoint
+    from payload_delta import combine_payloads
+    from payload_writer import save_payload
+    from submission import SubmissionScheduler, resume_submissions
+    from submission_journal import SubmissionJournal
+
+    server.delay = 0
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = SubmissionJournal(os.path.join(tmp, 'submissions.jsonl'))
+        server.fail('PATCH', 'resume-update', status=400)
+        # The create goes unanswered and so does the lookup that would confirm it
+        # (first try and APIClient's 3 retries)
+        server.fail('POST', 'resume-lost')
+        server.fail('GET', 'resume-lost', status=503, times=4)
+        # The create goes unanswered, a stale lookup misses it, and the resend gets a 400
+        # because the package exists: the journal records the create as answered with 400
+        server.fail('POST', 'resume-refused')
+        server.fail('GET', 'resume-refused', status=404)
+
+        packages = {}
+        for name in ('resume-update', 'resume-lost', 'resume-refused'):
+            payload, config_payload = packages[name] = sample_package(name)
+            outputs = [os.path.join(tmp, f"{name}.json"), os.path.join(tmp, f"{name}.config.json")]
+            save_payload(payload, outputs[0])
+            save_payload(config_payload, outputs[1])
+            with SubmissionScheduler(migration_packages_endpoint(server.url(name)), 'user', 'password',
+                                     journal=journal) as scheduler:
+                if scheduler.submit(name, payload, config_payload, sources=outputs).result()['status'] != 'failed':
+                    problems.append(f"{name}: the first push did not fail as set up")
+
+        sent_before = {name: len(server.requests_to(name)) for name in packages}
+        results = resume_submissions(journal, 'user', 'password')
+        expected = {'resume-update': ['PATCH'], 'resume-lost': ['GET', 'PATCH'],
+                    'resume-refused': ['GET', 'PATCH']}
+        for name, (payload, config_payload) in packages.items():
+            methods = [request['method'] for request in server.requests_to(name)[sent_before[name]:]]
+            if methods != expected[name]:
+                problems.append(f"{name}: resume sent {methods}, expected {expected[name]}")
+            if server.contents(name, name) != combine_payloads(payload, config_payload)['contents']:
+                problems.append(f"{name}: package contents differ from the payloads after resuming")
+        if [result['status'] for result in results] != ['ok'] * len(packages):
+            problems.append(f"resume results: {[result['status'] for result in results]}")
+        if journal.pending():
+            problems.append("packages still pending after resuming")
+    return problems
+
+
+CHECKS = [
+    ('fan_out', check_fan_out),
+    ('split payloads', check_split),
+    ('lost create', check_lost_create),
+    ('incremental after a failed update', check_incremental_after_failed_update),
+    ('journal resume', check_resume),
+]
+
+
+def main():
+    failed = False
+    with StandInServer() as server:
+        for name, check in CHECKS:
+            server.reset()
+            problems = check(server)
+            print(f"{name}: {'FAILED' if problems else 'ok'}")
+            for problem in problems:
+                print(f"  {problem}")
+            failed = failed or bool(problems)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
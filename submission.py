@@ -0,0 +1,338 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlparse
+
+from api_client import APIClient, migration_packages_endpoint, package_identifier
+from payload_delta import combine_payloads, diff_payload
+from submission_journal import resume_points
+
+SUCCESS_STATUS_CODES = (200, 201)
+
+
+def submit_package(api_client, package_name, payload, config_payload=None, resume=None):
+    """
+    Create a package and, for mixed trackers, PATCH the Configuration items into it.
+    The PATCH is only sent once the create call succeeded.
+
+    config_payload may be a Future (e.g. still being generated); it is only waited
+    for once the create call succeeded, so its generation overlaps the create call.
+
+    resume ({'create': batch, 'update': batch}, see submission_journal.resume_points)
+    continues an interrupted submission: a call marked None already finished and is
+    skipped, the others start at the given batch.
+
+    Returns:
+        dict with 'status' ('ok' or 'failed'), one entry per API call in 'steps' and
+        'latency', the seconds from sending the create call to the last response.
+    """
+    started = time.perf_counter()
+    steps = []
+    resume = resume or {'create': 0, 'update': 0}
+
+    created = True
+    if resume['create'] is not None:
+        response = api_client.post_data(payload, start_batch=resume['create'])
+        steps.append(_step_result('create', response, api_client.last_request))
+        created = response.status_code in SUCCESS_STATUS_CODES
+
+    if created and config_payload is not None and resume['update'] is not None:
+        if isinstance(config_payload, Future):
+            config_payload = config_payload.result()
+        response = api_client.patch_data(package_identifier(package_name), config_payload,
+                                         start_batch=resume['update'])
+        steps.append(_step_result('update', response, api_client.last_request))
+
+    expected_steps = (resume['create'] is not None) + (config_payload is not None and resume['update'] is not None)
+    succeeded = len(steps) == expected_steps and all(
+        step['statusCode'] in SUCCESS_STATUS_CODES for step in steps
+    )
+    return {'status': 'ok' if succeeded else 'failed', 'steps': steps,
+            'latency': time.perf_counter() - started}
+
+
+def settle_failed_create(api_client, package, points, journal=None):
+    """
+    Resume points for a package whose create call went out but did not succeed.
+
+    Whatever the failure, the instance may have created the package anyway: a
+    response lost in transit, or a resend of it refused because the package already
+    exists. Posting it again would collide with it, so the package is looked up by
+    identifier first: if it exists, the create call continues after its first batch
+    (or is done, when that was its only batch), and the journal records that.
+    """
+    progress = package['steps'].get('create')
+    if points['create'] != 0 or progress is None:
+        return points
+
+    identifier = package_identifier(package['packageName'])
+    if not api_client.package_exists(identifier):
+        return points
+
+    fields = {'endpoint': package['endpoint'], 'packageName': package['packageName'],
+              'identifier': identifier, 'step': 'create', 'payloadHash': progress['payloadHash']}
+    if progress['batches'] > 1:
+        points = {**points, 'create': 1}
+        event = 'sent'
+        fields['batch'] = 1
+    else:
+        points = {**points, 'create': None}
+        event = 'done'
+    if journal is not None:
+        journal.record(event, **fields)
+    return points
+
+
+def submit_incremental(api_client, package_name, payload, config_payload=None, snapshots=None):
+    """
+    Submit only what changed since the last successful submission of this package
+    to this instance.
+
+    - no snapshot: full submit_package (create, plus PATCH for mixed trackers)
+    - nothing added or changed: no request at all ('status' is 'unchanged')
+    - otherwise: one PATCH carrying only the added or changed subtrees
+
+    The snapshot is replaced after every successful submission. If the package is
+    gone on the server (404 on the PATCH), the full submission is sent instead. If
+    a full submission only got as far as the create call, the snapshot holds what
+    the create call sent, so the next submission PATCHes the rest instead of
+    creating the package again.
+    """
+    contents = combine_payloads(payload, config_payload)
+    previous = snapshots.load(api_client.endpoint, package_name)
+
+    if previous is not None:
+        delta, removed = diff_payload(contents, previous)
+        if delta is None:
+            return {'status': 'unchanged', 'steps': [], 'mode': 'delta', 'removed': removed}
+
+        response = api_client.patch_data(package_identifier(package_name), delta)
+        if response.status_code != 404:
+            step = _step_result('update', response, api_client.last_request)
+            succeeded = response.status_code in SUCCESS_STATUS_CODES
+            if succeeded:
+                snapshots.save(api_client.endpoint, package_name, contents)
+            return {'status': 'ok' if succeeded else 'failed', 'steps': [step], 'mode': 'delta', 'removed': removed}
+
+    result = submit_package(api_client, package_name, payload, config_payload)
+    if result['status'] == 'ok':
+        snapshots.save(api_client.endpoint, package_name, contents)
+    elif any(step['step'] == 'create' and step['statusCode'] in SUCCESS_STATUS_CODES for step in result['steps']):
+        snapshots.save(api_client.endpoint, package_name, payload)
+    result['mode'] = 'full'
+    result['removed'] = 0
+    return result
+
+
+def fan_out(instances, username, password, package_name, payload, config_payload=None,
+            max_workers=8, per_host_limit=2, snapshots=None, compression=None):
+    """
+    Submit the same package to several CPQ instances concurrently.
+
+    Each instance runs submit_package on its own pooled APIClient, so the
+    create-then-update order is kept per instance. At most per_host_limit
+    instances on the same host are in flight at once.
+
+    With a SnapshotStore, each instance only receives what changed since its
+    last successful submission (see submit_incremental). compression is passed on
+    to each APIClient.
+
+    Returns:
+        One result dict per instance, in the order given.
+    """
+    if not instances:
+        return []
+
+    host_slots = {}
+    for instance in instances:
+        host = urlparse(migration_packages_endpoint(instance)).netloc
+        host_slots.setdefault(host, threading.BoundedSemaphore(per_host_limit))
+
+    def submit(instance):
+        endpoint = migration_packages_endpoint(instance)
+        started = time.perf_counter()
+        with host_slots[urlparse(endpoint).netloc]:
+            with APIClient(endpoint, username, password, compression=compression) as api_client:
+                try:
+                    if snapshots is not None:
+                        result = submit_incremental(api_client, package_name, payload, config_payload, snapshots)
+                    else:
+                        result = submit_package(api_client, package_name, payload, config_payload)
+                    result['error'] = None
+                except Exception as e:
+                    result = {'status': 'failed', 'steps': [], 'error': str(e)}
+        result['instance'] = instance
+        result['elapsed'] = time.perf_counter() - started
+        return result
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(instances))) as executor:
+        return list(executor.map(submit, instances))
+
+
+class SubmissionScheduler:
+    """
+    Submits independent packages to one CPQ instance with up to max_in_flight of
+    them in flight at once.
+
+    Each package still runs create-then-update in order (submit_package); packages
+    do not wait for each other. Worker threads keep their own pooled APIClient, so
+    connections are reused across the packages a thread sends.
+
+    With a SubmissionJournal, every queued package and API call is journaled so an
+    interrupted push can be resumed (resume_submissions).
+    """
+    def __init__(self, endpoint, username, password, max_in_flight=4, journal=None, compression=None):
+        self.endpoint = endpoint
+        self.username = username
+        self.password = password
+        self.journal = journal
+        self.compression = compression
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='submit')
+        self._local = threading.local()
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def submit(self, package_name, payload, config_payload=None, sources=None, resume=None):
+        """
+        Queue a package; returns a Future of submit_package's result (with 'error'
+        set instead of raising).
+
+        Args:
+            sources: Payload files the package is loaded from, journaled for a later resume
+            resume: A SubmissionJournal.pending() entry; only its unfinished calls are sent
+        """
+        if self.journal is not None and sources is not None:
+            self.journal.queued(self.endpoint, package_name, sources)
+        return self._executor.submit(self._submit, package_name, payload, config_payload, resume)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for client in self._clients:
+            client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = APIClient(self.endpoint, self.username, self.password,
+                                                    journal=self.journal, compression=self.compression)
+            with self._lock:
+                self._clients.append(client)
+        return client
+
+    def _submit(self, package_name, payload, config_payload, resume):
+        try:
+            if callable(payload):
+                # Loaded lazily so only in-flight packages are held in memory
+                payload, config_payload = payload()
+            if resume is not None:
+                resume = settle_failed_create(self._client(), resume,
+                                              resume_points(resume, payload, config_payload), self.journal)
+            result = submit_package(self._client(), package_name, payload, config_payload, resume)
+            result['error'] = None
+        except Exception as e:
+            result = {'status': 'failed', 'steps': [], 'latency': None, 'error': str(e)}
+        return result
+
+
+def resume_submissions(journal, username, password, max_in_flight=4, compression=None):
+    """
+    Resume every unfinished package in the journal: calls that finished are
+    skipped, a split payload continues at its first unsent batch, and the update
+    call of a mixed package is sent once its create call has gone through. A
+    create call that failed is only resent if the package does not exist
+    (settle_failed_create).
+
+    Payloads are reloaded from the files the package was queued with.
+
+    Returns:
+        One result dict per pending package, in the order they were queued, with
+        'packageName' and 'endpoint' added.
+    """
+    from batch_runner import load_outputs
+
+    pending = journal.pending()
+    futures = []
+    schedulers = {}
+    try:
+        for package in pending:
+            scheduler = schedulers.get(package['endpoint'])
+            if scheduler is None:
+                scheduler = schedulers[package['endpoint']] = SubmissionScheduler(
+                    package['endpoint'], username, password, max_in_flight=max_in_flight, journal=journal,
+                    compression=compression)
+            futures.append(scheduler.submit(package['packageName'], partial(load_outputs, package['outputs']),
+                                            resume=package))
+    finally:
+        for scheduler in schedulers.values():
+            scheduler.close()
+
+    results = []
+    for package, future in zip(pending, futures):
+        result = future.result()
+        result['packageName'] = package['packageName']
+        result['endpoint'] = package['endpoint']
+        results.append(result)
+    return results
+
+
+def print_resume_report(results):
+    if not results:
+        print("Nothing to resume: every journaled package was submitted.")
+        return
+
+    print(f"{'Package':<25} {'Status':<10} Steps")
+    for result in results:
+        steps = ', '.join(format_step(step) for step in result['steps'])
+        if result['error']:
+            steps = f"{steps}; error: {result['error']}" if steps else f"error: {result['error']}"
+        print(f"{str(result['packageName']):<25} {result['status']:<10} {steps}")
+
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    print(f"\n{len(results) - failed} resumed, {failed} failed")
+
+
+def print_fanout_report(results):
+    print(f"{'Instance':<45} {'Status':<10} {'Time(s)':>8}  Steps")
+    for result in results:
+        steps = ', '.join(format_step(step) for step in result['steps'])
+        if result['status'] == 'unchanged':
+            steps = "no changes since the last submission"
+        if result.get('removed'):
+            steps = f"{steps}; {result['removed']} removed nodes not sent (PATCH cannot delete)"
+        if result['error']:
+            steps = f"{steps}; error: {result['error']}" if steps else f"error: {result['error']}"
+        print(f"{result['instance']:<45} {result['status']:<10} {result['elapsed']:>8.2f}  {steps}")
+
+    failed = sum(1 for result in results if result['status'] == 'failed')
+    unchanged = sum(1 for result in results if result['status'] == 'unchanged')
+    print(f"\n{len(results) - failed - unchanged} succeeded, {unchanged} unchanged, {failed} failed")
+
+
+def _step_result(step, response, request_stats):
+    return {
+        'step': step,
+        'statusCode': response.status_code,
+        'elapsed': request_stats['elapsed'],
+        'retries': request_stats['retries'],
+        'bytes': request_stats['bytes'],
+        'payloadBytes': request_stats['payloadBytes'],
+        'compression': request_stats['compression'],
+        'response': response.text
+    }
+
+
+def format_step(step):
+    """
+    One API call of a submission, e.g. "create 201 (0.42s, 0 retries, 83,412 bytes gzip 14.2x)".
+    """
+    sent = f"{step['bytes']:,} bytes"
+    if step.get('compression'):
+        sent = f"{sent} {step['compression']} {step['payloadBytes'] / step['bytes']:.1f}x"
+    return f"{step['step']} {step['statusCode']} ({step['elapsed']:.2f}s, {step['retries']} retries, {sent})"
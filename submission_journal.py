@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from payload_splitter import serialize_payload
+
+DEFAULT_JOURNAL_PATH = Path(os.environ.get('EXCEL_TO_API_JOURNAL', Path.home() / '.cache' / 'excel_to_api' / 'submissions.jsonl'))
+
+STEPS = ('create', 'update')
+
+
+def payload_hash(body):
+    """
+    Hash of a serialized request body, identifying the payload a journaled call sent.
+    """
+    return hashlib.sha256(body).hexdigest()
+
+
+class SubmissionJournal:
+    """
+    Append-only JSON Lines record of package submissions, so an interrupted push
+    can be resumed without resending the calls that already reached the instance.
+
+    Records are never rewritten. A batch push records each package as 'queued',
+    with the payload files it is loaded from; APIClient then records every create
+    and update call as 'started', 'sent' (per finished batch of a split payload),
+    and 'done' or 'failed', keyed by package name, identifier and payload hash.
+    """
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def record(self, event, **fields):
+        record = {'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'event': event, **fields}
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Opened per record so every line is on disk before the next request goes out
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def queued(self, endpoint, package_name, outputs):
+        self.record('queued', endpoint=endpoint, packageName=package_name,
+                    outputs=[os.path.abspath(output) for output in outputs])
+
+    def records(self):
+        """
+        Every record in journal order. A line cut short by a crash is skipped.
+        """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+
+    def pending(self):
+        """
+        Queued packages whose submission did not finish, in the order they were queued.
+
+        Only the latest queue record of a package per endpoint counts, together with
+        the calls recorded after it. Each entry has 'endpoint', 'packageName',
+        'outputs' and 'steps', the progress of the calls sent so far:
+        {step: {'payloadHash', 'batches', 'sent' (batches that reached the package),
+        'done'}}.
+        """
+        packages = {}
+        for record in self.records():
+            key = (record.get('endpoint'), record.get('packageName'))
+            if record['event'] == 'queued':
+                # A new push of the package starts over
+                packages.pop(key, None)
+                packages[key] = {'endpoint': key[0], 'packageName': key[1],
+                                 'outputs': record['outputs'], 'steps': {}}
+                continue
+
+            package = packages.get(key)
+            if package is None or record.get('step') not in STEPS:
+                continue
+            progress = package['steps'].get(record['step'])
+            if progress is None or progress['payloadHash'] != record['payloadHash']:
+                progress = package['steps'][record['step']] = {
+                    'payloadHash': record['payloadHash'], 'batches': 1, 'sent': 0, 'done': False}
+
+            if record['event'] == 'started':
+                progress['batches'] = record.get('batches', 1)
+                progress['sent'] = record.get('startBatch', 0)
+                progress['done'] = False
+            elif record['event'] == 'sent':
+                progress['sent'] = record['batch']
+            elif record['event'] == 'done':
+                progress['done'] = True
+
+        return [package for package in packages.values() if not self._finished(package)]
+
+    @staticmethod
+    def _finished(package):
+        # A package written as two files is a mixed package with an update call
+        steps = STEPS if len(package['outputs']) > 1 else STEPS[:1]
+        return all(package['steps'].get(step, {}).get('done') for step in steps)
+
+
+def resume_points(package, payload, config_payload=None):
+    """
+    Where each call of a pending package resumes, from its journal progress:
+    {'create': batch, 'update': batch}, None for a call that already finished.
+
+    Raises ValueError if the payload files no longer match what was sent, since
+    the sent part of the package could not be completed with them.
+    """
+    points = {}
+    for step, step_payload in zip(STEPS, (payload, config_payload)):
+        progress = package['steps'].get(step)
+        if step_payload is None:
+            points[step] = None
+        elif progress is None:
+            points[step] = 0
+        elif progress['payloadHash'] != payload_hash(serialize_payload(step_payload)):
+            raise ValueError(f"The payload files of '{package['packageName']}' changed after its {step} call "
+                             f"was sent; regenerate and submit the package again.")
+        else:
+            points[step] = None if progress['done'] else progress['sent']
+    return points
@@ -0,0 +1,48 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tracker_schema import PAYLOAD_COLUMNS  # noqa: E402
+
+
+@pytest.fixture
+def write_workbook(tmp_path):
+    """
+    Write tracker rows (lists in PAYLOAD_COLUMNS order, None for an empty cell)
+    to an .xlsx file and return its path.
+    """
+    from openpyxl import Workbook
+
+    def write(rows, name='tracker.xlsx'):
+        path = tmp_path / name
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Tracker')
+        sheet.append(PAYLOAD_COLUMNS)
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+        return path
+
+    return write
+
+
+@pytest.fixture
+def mixed_type_rows():
+    """
+    Commerce rows whose columns change type past the first 12 rows: integer names
+    with blanks, then text; booleans with blanks, then without.
+    """
+    rows = []
+    for index in range(30):
+        if index < 12:
+            child = index if index % 3 else None
+            granular = True if index % 2 else None
+        else:
+            child = f"child{index}"
+            granular = bool(index % 2)
+        rows.append(['Commerce', 'proc', granular, 'transaction' if index % 4 else None, child,
+                     'action' if index % 5 else 'integration'])
+    return rows
@@ -0,0 +1,41 @@
+import pytest
+
+from excel_parser import ColumnTyper, ExcelParser
+from json_generator import JSONGenerator
+from tracker_schema import PAYLOAD_COLUMNS
+
+
+def typed_values(df):
+    return {col: [(type(value), repr(value)) for value in df[col].tolist()] for col in PAYLOAD_COLUMNS}
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 12, 10000])
+def test_streaming_parse_matches_full_read_across_batches(write_workbook, mixed_type_rows, batch_size):
+    path = write_workbook(mixed_type_rows)
+    full = ExcelParser(path).parse()
+    streamed = ExcelParser(path).parse(streaming=True, batch_size=batch_size)
+
+    assert typed_values(streamed) == typed_values(full)
+    assert (JSONGenerator(streamed).generate('Pkg') == JSONGenerator(full).generate('Pkg'))
+
+
+def test_integer_names_keep_their_type_before_text(write_workbook, mixed_type_rows):
+    path = write_workbook(mixed_type_rows)
+    streamed = ExcelParser(path).parse(streaming=True, batch_size=10)
+
+    assert streamed['childVariableName'].tolist()[1] == 1
+    assert type(streamed['childVariableName'].tolist()[1]) is int
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 12])
+def test_column_typer_types_batches_as_the_whole_sheet(write_workbook, mixed_type_rows, batch_size):
+    path = write_workbook(mixed_type_rows)
+    parser = ExcelParser(path)
+    typer = ColumnTyper(parser)
+    batches = list(parser.iter_rows(batch_size))
+    for rows in batches:
+        typer.add(rows)
+
+    typed = [typed_values(typer.build(rows)) for rows in batches]
+    combined = {col: [value for values in typed for value in values[col]] for col in PAYLOAD_COLUMNS}
+    assert combined == typed_values(parser.parse())
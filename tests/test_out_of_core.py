@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from excel_parser import ExcelParser
+from json_generator import JSONGenerator
+from out_of_core import write_payloads_out_of_core
+from payload_builder import load_tracker, write_payloads
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 12, 10000])
+def test_standard_payload_matches_json_generator(tmp_path, write_workbook, mixed_type_rows, batch_size):
+    path = write_workbook(mixed_type_rows)
+    expected = JSONGenerator(ExcelParser(path).parse()).generate('Pkg')
+
+    output = tmp_path / 'payload.json'
+    flow, paths, rows = write_payloads_out_of_core(str(path), 'Pkg', str(output), str(tmp_path / 'config.json'),
+                                                   batch_size=batch_size, max_buffered_rows=5)
+
+    assert (flow, rows) == ('standard', len(mixed_type_rows))
+    assert json.loads(output.read_bytes()) == expected
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 10000])
+def test_mixed_payloads_match_write_payloads(tmp_path, write_workbook, mixed_type_rows, batch_size):
+    rows = mixed_type_rows + [
+        ['Configuration', f"family{index % 3}.line{index}", None, 'transaction', index, 'rule']
+        for index in range(10)
+    ] + [['Util Library', 'util', None, None, 'lib', 'library']]
+    path = write_workbook(rows)
+    expected = write_payloads(load_tracker(str(path), use_cache=False), 'Pkg',
+                              str(tmp_path / 'expected.json'), str(tmp_path / 'expected.config.json'))
+
+    written = write_payloads_out_of_core(str(path), 'Pkg', str(tmp_path / 'payload.json'),
+                                         str(tmp_path / 'payload.config.json'), batch_size=batch_size)
+
+    assert written[0] == expected[0] == 'mixed'
+    for expected_path, path in zip(expected[1], written[1]):
+        assert open(path, 'rb').read() == open(expected_path, 'rb').read()
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from tracker_schema import PAYLOAD_COLUMNS
+from tracker_watch import IncrementalPayload
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=PAYLOAD_COLUMNS, dtype=object)
+
+
+def written(payload, tmp_path, name):
+    output = tmp_path / f"{name}.json"
+    payload.write(str(output), str(tmp_path / f"{name}.config.json"))
+    return output.read_bytes()
+
+
+@pytest.mark.parametrize('column, before, after', [
+    ('granular', 1, True),
+    ('childVariableName', 1, 1.0),
+    ('childVariableName', 0.0, -0.0),
+])
+def test_type_only_edit_is_a_change(tmp_path, column, before, after):
+    rows = [['Commerce', 'proc', True, 'transaction', 'child', 'action'],
+            ['Commerce', 'proc', True, None, 'other', 'integration']]
+    rows[0][PAYLOAD_COLUMNS.index(column)] = before
+    payload = IncrementalPayload('Pkg')
+    payload.update(frame(rows))
+
+    rows[0][PAYLOAD_COLUMNS.index(column)] = after
+    stats = payload.update(frame(rows))
+
+    assert stats['changed']
+    assert stats['changedRows'] == 2
+    fresh = IncrementalPayload('Pkg')
+    fresh.update(frame(rows))
+    assert written(payload, tmp_path, 'watched') == written(fresh, tmp_path, 'fresh')
+
+
+def test_unchanged_rows_are_not_a_change():
+    rows = [['Commerce', 'proc', True, 'transaction', 1, 'action'],
+            ['Commerce', 'proc', None, None, 'other', 'integration']]
+    payload = IncrementalPayload('Pkg')
+    payload.update(frame(rows))
+
+    assert not payload.update(frame([list(row) for row in rows]))['changed']
@@ -0,0 +1,92 @@
+"""
+Tracker columns and item lookups shared by the readers and generators.
+
+Kept free of pandas so the light CSV/JSON path can import it cheaply.
+"""
+from collections import namedtuple
+
+# Columns that must be present in every tracker
+CORE_REQUIRED_COLUMNS = [
+    'itemName', 'commerceVariableName',
+    'childVariableName', 'childResourceType'
+]
+
+# Newer columns, added with empty values when a tracker doesn't have them
+OPTIONAL_COLUMNS = [
+    'granular', 'transactionVariableName'
+]
+
+# The columns the generators actually read
+PAYLOAD_COLUMNS = [
+    'itemName', 'commerceVariableName',
+    'granular', 'transactionVariableName',
+    'childVariableName', 'childResourceType'
+]
+
+# Item name -> migration package category
+ITEM_CATEGORIES = {
+    'Commerce': 'COMMERCE',
+    'Util Library': 'UTIL_LIBRARY',
+    'Document Designer': 'DOCUMENT_DESIGNER',
+    'Email Designer': 'EMAIL_DESIGNER',
+    'Data Table': 'DATA_TABLE',
+    'Configuration': 'CONFIGURATION',
+}
+
+# transactionVariableName -> transactionName
+TRANSACTION_NAMES = {
+    'transaction': 'Transaction',
+    'transactionLine': 'Transaction Line',
+}
+
+# itemName -> resourceType of the commerce level node
+RESOURCE_TYPES = {
+    'Commerce': 'process',
+    'Document Designer': '_set',
+    'Email Designer': '_set',
+    'Data Table': 'data_table_folder',
+}
+
+# A derived column rule gives `target` its value for a row: a constant `value`, a lookup
+# map `value` applied to the `source` column, or (value None) the `source` value itself.
+# `when` lists (column, excluded value) conditions that must all hold, i.e. the row's
+# value in that column differs from the excluded one; rows failing them get ''.
+# Rules only read the tracker columns, so they can be evaluated once per distinct
+# combination of those values (derive_value).
+DerivedColumnRule = namedtuple('DerivedColumnRule', ['target', 'source', 'value', 'when'])
+
+DERIVED_COLUMN_RULES = [
+    # If childResourceType is NOT "integration" AND transactionVariableName is not NULL, transactionResourceType is "document"
+    DerivedColumnRule('transactionResourceType', None, 'document',
+                      (('childResourceType', 'integration'), ('transactionVariableName', ''))),
+    # transactionName is looked up from transactionVariableName
+    DerivedColumnRule('transactionName', 'transactionVariableName', TRANSACTION_NAMES, ()),
+    # If commerceVariableName is NOT NULL, commerceName = commerceVariableName
+    DerivedColumnRule('commerceName', 'commerceVariableName', None, (('commerceVariableName', ''),)),
+    # resourceType is looked up from itemName
+    DerivedColumnRule('resourceType', 'itemName', RESOURCE_TYPES, ()),
+]
+
+DERIVED_COLUMNS = {rule.target: rule for rule in DERIVED_COLUMN_RULES}
+
+
+def rule_inputs(rule):
+    """
+    The tracker columns a derived column rule reads, in a fixed order.
+    """
+    columns = [rule.source] if rule.source is not None else []
+    columns.extend(column for column, _ in rule.when if column not in columns)
+    return columns
+
+
+def derive_value(rule, values):
+    """
+    Value of a derived column for one row, given its tracker values by column name.
+    """
+    if any(values[column] == excluded for column, excluded in rule.when):
+        return ''
+    if rule.source is None:
+        return rule.value
+    if rule.value is None:
+        return values[rule.source]
+    return rule.value.get(values[rule.source], '')
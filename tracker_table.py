@@ -0,0 +1,144 @@
+"""
+Compact column-oriented tracker rows shared by the readers and both generators.
+
+A TrackerTable holds one plain list per tracker column. The category-like
+columns are also coded: each row's value is one of a few distinct values
+(shared objects, strings interned) and its integer code, so the generators can
+group rows by code and test each distinct value once instead of every row.
+Row subsets (take) copy references and codes, never cell values.
+"""
+import sys
+from array import array
+
+from tracker_schema import PAYLOAD_COLUMNS
+
+# Columns with few distinct values; they are coded and their strings interned
+INTERNED_COLUMNS = frozenset([
+    'itemName', 'commerceVariableName', 'granular',
+    'transactionVariableName', 'childResourceType'
+])
+
+_NUMERIC_TYPES = frozenset([bool, int, float])
+
+
+class TrackerTable:
+    """
+    Tracker rows stored as one list per tracker column.
+    """
+    def __init__(self, columns, codes=None):
+        self._columns = columns
+        # column -> (codes, categories), see categories()
+        self._codes = {} if codes is None else codes
+        self.columns = list(columns)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Build a table from lists of cell values (taken over, not copied),
+        coding INTERNED_COLUMNS.
+        """
+        return cls(columns, {
+            col: encode_categories(values) for col, values in columns.items() if col in INTERNED_COLUMNS
+        })
+
+    @classmethod
+    def from_frame(cls, df, columns=PAYLOAD_COLUMNS):
+        """
+        Build a table from the given columns of a DataFrame.
+        """
+        return cls.from_columns({col: df[col].tolist() for col in columns if col in df.columns})
+
+    def __len__(self):
+        for values in self._columns.values():
+            return len(values)
+        return 0
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def categories(self, name):
+        """
+        (codes, categories) for a column: row i holds categories[codes[i]]. Coded
+        once per column (at construction for INTERNED_COLUMNS); after take(),
+        categories may also hold values none of the rows have.
+        """
+        coded = self._codes.get(name)
+        if coded is None:
+            coded = self._codes[name] = encode_categories(self._columns[name])
+        return coded
+
+    def take(self, indexes):
+        """
+        New table with the given rows, in the given order.
+        """
+        return TrackerTable(
+            {name: [values[index] for index in indexes] for name, values in self._columns.items()},
+            {name: (array(codes.typecode, [codes[index] for index in indexes]), categories)
+             for name, (codes, categories) in self._codes.items()}
+        )
+
+
+def encode_categories(values):
+    """
+    Code a list of cell values: returns (codes, categories), the distinct values
+    in order of first appearance, with codes as a compact array (one byte per row
+    for up to 256 distinct values). Values are replaced in place by their category
+    object (strings interned). Values that compare equal across types (1, 1.0,
+    True) are kept apart, so every row keeps its exact value.
+    """
+    numeric_types = set(map(type, values)) & _NUMERIC_TYPES
+    if len(numeric_types) > 1 or float in numeric_types:
+        # 1, 1.0 and True are equal keys, and so are 0.0 and -0.0; key floats by their
+        # exact hex form instead
+        keys = [(float, value.hex()) if type(value) is float else (type(value), value) for value in values]
+        distinct = lambda index: [float.fromhex(value) if kind is float else value for kind, value in index]
+    else:
+        keys = values
+        distinct = list
+
+    index = {}
+    codes = [index.setdefault(key, len(index)) for key in keys]
+    intern = sys.intern
+    categories = [intern(value) if type(value) is str else value for value in distinct(index)]
+    values[:] = map(categories.__getitem__, codes)
+    return array(_code_typecode(len(categories)), codes), categories
+
+
+def _code_typecode(count):
+    if count <= 0x100:
+        return 'B'
+    return 'H' if count <= 0x10000 else 'I'
+
+
+def group_by_codes(codes, keys):
+    """
+    Row indexes per key, in row order, where keys[code] is the key of the rows
+    with that code. Keys are in order of their first row, like a dict filled row
+    by row: codes with equal keys (e.g. None and NaN both read as '') are merged
+    under the first one.
+    """
+    code_rows = [[] for _ in keys]
+    for index, code in enumerate(codes):
+        code_rows[code].append(index)
+
+    groups = {}
+    for code in sorted((code for code, rows in enumerate(code_rows) if rows), key=lambda code: code_rows[code][0]):
+        rows = code_rows[code]
+        group = groups.get(keys[code])
+        if group is None:
+            groups[keys[code]] = rows
+        else:
+            group.extend(rows)
+            group.sort()
+    return groups
+
+
+def as_table(data):
+    """
+    Return data as a TrackerTable, converting a DataFrame once.
+    """
+    if isinstance(data, TrackerTable):
+        return data
+    if not hasattr(data, 'columns'):
+        raise TypeError("Tracker data must be a pandas DataFrame or a TrackerTable.")
+    return TrackerTable.from_frame(data)
@@ -0,0 +1,227 @@
+"""
+Watch mode: keep a tracker's payload file up to date while the tracker is edited.
+
+The payload is kept as encoded bytes per JSONGenerator item group and per
+Configuration product family. When the tracker is saved, its rows are compared
+with the previous read and only the groups whose rows changed are regenerated;
+the output file is rewritten from the cached bytes of the others.
+"""
+import os
+import time
+from collections import Counter
+
+from payload_builder import (
+    FLOW_CONFIGURATION, FLOW_MIXED, FLOW_STANDARD,
+    generate_family, generate_item, group_rows, load_tracker, standard_item_order
+)
+from payload_writer import encode
+from tracker_schema import PAYLOAD_COLUMNS
+from tracker_table import as_table
+
+
+class IncrementalPayload:
+    """
+    A tracker's payload(s) as encoded item groups and product families.
+
+    Each item group only depends on its own rows (in row order), and so does each
+    product family of the Configuration tree, so a group is regenerated only when
+    its rows changed. The written bytes are identical to write_payload of the
+    generate_payloads result.
+    """
+    def __init__(self, package_name):
+        self.package_name = package_name
+        self.flow = None
+        # item name -> (row keys, encoded item); product family -> (row keys, encoded node)
+        self._items = {}
+        self._families = {}
+        self._family_order = []
+        self._keys = None
+
+    def update(self, excel_data):
+        """
+        Bring the payload up to date with the tracker rows.
+
+        Returns:
+            dict with 'changed' (whether the payload may differ from the last update),
+            'changedRows' (rows added plus rows removed), 'regenerated' (the item names
+            and 'Configuration/<family>' entries rebuilt) and 'reused'.
+        """
+        table = as_table(excel_data)
+        keys = _row_keys(table)
+        if keys == self._keys:
+            return {'changed': False, 'changedRows': 0, 'regenerated': [], 'reused': len(self._items) + len(self._families)}
+
+        item_rows, family_rows = group_rows(table)
+        if not item_rows and not family_rows:
+            raise ValueError("No items found in Excel file.")
+
+        regenerated = []
+        changed_rows = Counter()
+        self._items = self._refresh(self._items, item_rows, keys, table, self._generate_item,
+                                    regenerated, changed_rows)
+        self._families = self._refresh(self._families, family_rows, keys, table, self._generate_family,
+                                       regenerated, changed_rows, 'Configuration/')
+        self._family_order = list(family_rows)
+
+        if item_rows and family_rows:
+            self.flow = FLOW_MIXED
+        else:
+            self.flow = FLOW_STANDARD if item_rows else FLOW_CONFIGURATION
+
+        self._keys = keys
+        return {
+            'changed': True,
+            'changedRows': sum(abs(count) for count in changed_rows.values()),
+            'regenerated': regenerated,
+            'reused': len(self._items) + len(self._families) - len(regenerated)
+        }
+
+    def write(self, path, config_path):
+        """
+        Replace path (and config_path for the mixed flow) with the current payload(s).
+        A config_path left by an earlier mixed version of the tracker is removed, so it
+        is never paired with a payload it no longer belongs to.
+
+        Returns:
+            The paths written.
+        """
+        if self.flow == FLOW_CONFIGURATION:
+            documents = [(path, self._configuration_document())]
+        elif self.flow == FLOW_STANDARD:
+            documents = [(path, self._standard_document())]
+        else:
+            documents = [(path, self._standard_document()), (config_path, self._configuration_document())]
+
+        for output_path, chunks in documents:
+            tmp = f"{output_path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.writelines(chunks)
+                f.write(b'\n')
+            os.replace(tmp, output_path)
+
+        if self.flow != FLOW_MIXED and config_path != path:
+            try:
+                os.remove(config_path)
+            except FileNotFoundError:
+                pass
+        return [output_path for output_path, _ in documents]
+
+    @staticmethod
+    def _refresh(groups, group_rows, keys, table, generate, regenerated, changed_rows, label=''):
+        """
+        Reuse the groups whose rows are unchanged and regenerate the others.
+        Rows added to (+1) or removed from (-1) regenerated and dropped groups
+        are counted in changed_rows; rows only moved within a group cancel out.
+        """
+        refreshed = {}
+        for name, indexes in group_rows.items():
+            group_keys = [keys[index] for index in indexes]
+            previous = groups.get(name)
+            if previous is not None and previous[0] == group_keys:
+                refreshed[name] = previous
+                continue
+            refreshed[name] = (group_keys, generate(table.take(indexes)))
+            regenerated.append(f"{label}{name}")
+            changed_rows.update(group_keys)
+            if previous is not None:
+                changed_rows.subtract(previous[0])
+        for name, (group_keys, _) in groups.items():
+            if name not in refreshed:
+                changed_rows.subtract(group_keys)
+        return refreshed
+
+    def _generate_item(self, rows):
+        return encode(generate_item(rows, self.package_name))
+
+    def _generate_family(self, rows):
+        return encode(generate_family(rows, self.package_name))
+
+    def _standard_document(self):
+        items = [self._items[name][1] for name in standard_item_order(self._items)]
+        return [b'{"name":', encode(self.package_name), b',"contents":{"items":[', b','.join(items), b']}}']
+
+    def _configuration_document(self):
+        families = [self._families[family][1] for family in self._family_order]
+        return [b'{"name":', encode(self.package_name),
+                b',"contents":{"items":[{"name":"Configuration","category":"CONFIGURATION","children":[',
+                b','.join(families), b']}]}}']
+
+
+def _row_keys(table):
+    """
+    One hashable tuple per row over the payload columns, with missing cells as None
+    (NaN never compares equal to itself). Cells of numeric columns are keyed by type
+    as in encode_categories, since 1, 1.0 and True are equal but generate differently.
+    """
+    columns = []
+    for col in PAYLOAD_COLUMNS:
+        if col not in table.columns:
+            columns.append([None] * len(table))
+            continue
+        values = table[col]
+        if set(map(type, values)) & {bool, int, float}:
+            values = [_cell_key(value) for value in values]
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def _cell_key(value):
+    if type(value) is float:
+        # NaN is a missing cell; 0.0 and -0.0 are equal keys, so floats are keyed by hex
+        return None if value != value else (float, value.hex())
+    return (type(value), value)
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def watch(path, package_name, output, config_output, sheet=None, interval=1.0):
+    """
+    Regenerate output (and config_output for mixed trackers) whenever the tracker
+    is saved, until interrupted. A failed read or generation is reported and the
+    previous payload files are left as they are.
+    """
+    payload = IncrementalPayload(package_name)
+    last_signature = None
+    print(f"Watching {path} (Ctrl+C to stop)")
+
+    try:
+        while True:
+            signature = _signature(path)
+            if signature is not None and signature != last_signature:
+                # Wait for the save to finish before reading
+                time.sleep(min(interval, 0.2))
+                if _signature(path) != signature:
+                    continue
+                last_signature = signature
+                _refresh_output(payload, path, output, config_output, sheet)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+
+def _refresh_output(payload, path, output, config_output, sheet):
+    stamp = time.strftime('%H:%M:%S')
+    try:
+        started = time.perf_counter()
+        table = load_tracker(path, use_cache=False, sheet=sheet)
+        parsed = time.perf_counter()
+        stats = payload.update(table)
+        written = payload.write(output, config_output) if stats['changed'] else []
+        finished = time.perf_counter()
+    except Exception as e:
+        print(f"[{stamp}] Not updated: {str(e)}")
+        return
+
+    if not written:
+        print(f"[{stamp}] No changes (read {parsed - started:.2f}s)")
+        return
+    regenerated = ', '.join(stats['regenerated']) or 'none'
+    print(f"[{stamp}] {stats['changedRows']} rows changed; regenerated {regenerated} "
+          f"({stats['reused']} reused) in {finished - parsed:.3f}s (read {parsed - started:.2f}s); "
+          f"wrote {', '.join(written)}")